@@ -0,0 +1 @@
+"""Benchmarks of the processing paths on synthetic exports; run ``python -m benchmarks --help``."""
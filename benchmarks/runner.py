@@ -0,0 +1,242 @@
+"""Time every processing path on synthetic exports and compare against a saved baseline.
+
+    python -m benchmarks                                   # 1k and 10k rows, every case
+    python -m benchmarks --rows 100000 1000000 --case 'django-sales/*'
+    python -m benchmarks --save baseline.json              # record a baseline
+    python -m benchmarks --compare baseline.json           # exit 1 on a regression
+
+Each case runs the engine calls one web upload makes, stage by stage:
+``read`` (parse the workbook), ``split`` or ``clean`` (classification, GST,
+receipt bucketing) and ``write`` (render the outputs). Timings are the best
+of ``--repeat`` runs; a further run under ``tracemalloc`` records the peak
+Python heap of each stage. Inputs are generated once into ``--data`` and
+reused. The frame cache stays off, so every run parses its inputs, and the
+Django ledger insert is left out; it only measures the database.
+"""
+import argparse
+import contextlib
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from excel_engine.cli import RECEIPT_TEMPLATE_PATH
+from excel_engine.reader import RECEIPT_COLUMNS, SALES_COLUMNS, read_columns
+from excel_engine.receipts import read_receipt_file, receipt_buckets, write_receipt_buckets
+from excel_engine.rules import SALES_FORM_PLAN, plan_for_branch
+from excel_engine.template_registry import template_registry
+
+from .synthetic import export_path
+
+BRANCHES = ('Aluva', 'Kalamassery', 'Vedimara', 'Choondy')
+# Stage names the cases use, in the order they run
+STAGES = ('read', 'clean', 'split', 'write')
+DEFAULT_ROWS = [1000, 10000]
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# A case is a regression when it is this much slower (or its peak this much larger) than the baseline
+DEFAULT_THRESHOLD = 0.25
+
+
+class Stages:
+    """Times the stages of one run; with ``trace_memory`` also records each stage's peak traced heap."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.seconds = {}
+        self.peaks = {}
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0) + time.perf_counter() - start
+            if self.trace_memory:
+                self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+
+
+def receipts_case(branch):
+    """Flask receipt upload: ``process_receipt_file``."""
+    def run(inputs, directory, stage):
+        with stage('read'):
+            df, departments = read_receipt_file(inputs['receipt'], 'receipt.xlsx', branch)
+        with stage('clean'):
+            buckets = receipt_buckets(df, 'SBI BANK', departments)
+        with stage('write'):
+            write_receipt_buckets(buckets, 'receipt.xlsx', directory, departments)
+    return run
+
+
+def flask_sales_case(inputs, directory, stage):
+    """Flask sales form: ``sales_blueprint.process_excel_file_logic``."""
+    with stage('read'):
+        df = read_columns(inputs['sales'], SALES_COLUMNS)
+    with stage('split'):
+        frames = SALES_FORM_PLAN.split(df)
+    with stage('write'):
+        SALES_FORM_PLAN.write(frames, directory)
+
+
+def django_sales_case(branch):
+    """Django sales upload: ``processor.views.process_excel_file_logic``, without the ledger insert."""
+    plan = plan_for_branch(branch)
+
+    def run(inputs, directory, stage):
+        with stage('read'):
+            df = read_columns(inputs['sales'], SALES_COLUMNS)
+            receipt_df = read_columns(inputs['receipt'], RECEIPT_COLUMNS) if plan.rules.receipt_join else None
+        with stage('split'):
+            frames = plan.split(df, receipt_df)
+        with stage('write'):
+            plan.write(frames, directory)
+    return run
+
+
+CASES = dict(
+    [(f"receipts/{branch}", receipts_case(branch)) for branch in BRANCHES]
+    + [('flask-sales', flask_sales_case)]
+    + [(f"django-sales/{branch}", django_sales_case(branch)) for branch in BRANCHES]
+)
+
+
+def run_once(case, inputs, trace_memory=False):
+    stages = Stages(trace_memory)
+    directory = tempfile.mkdtemp(prefix='excel-bench-')
+    try:
+        start = time.perf_counter()
+        CASES[case](inputs, directory, stages)
+        total = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return total, stages
+
+
+def measure(case, rows, inputs, repeat=3, trace_memory=True):
+    """Best-of-``repeat`` timings for ``case``, plus its traced peaks; returns one result record."""
+    best_total, best_stages = None, None
+    for _ in range(repeat):
+        total, stages = run_once(case, inputs)
+        if best_total is None or total < best_total:
+            best_total, best_stages = total, stages
+    result = {
+        'case': case,
+        'rows': rows,
+        'seconds': best_total,
+        'rows_per_second': rows / best_total if best_total else None,
+        'stages': best_stages.seconds,
+    }
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            _, traced = run_once(case, inputs, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+        result['peak_bytes'] = max(traced.peaks.values())
+        result['stage_peak_bytes'] = traced.peaks
+    return result
+
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Messages for every result slower, or with a larger peak, than its baseline by more than ``threshold``."""
+    previous = {(entry['case'], entry['rows']): entry for entry in baseline['results']}
+    messages = []
+    for result in results:
+        base = previous.get((result['case'], result['rows']))
+        if base is None:
+            continue
+        for metric, unit in (('seconds', 's'), ('peak_bytes', 'B')):
+            if metric not in result or metric not in base:
+                continue
+            if result[metric] > base[metric] * (1 + threshold):
+                change = result[metric] / base[metric] - 1
+                messages.append(
+                    f"{result['case']} ({result['rows']} rows): {metric} {base[metric]:.4g}{unit} -> "
+                    f"{result[metric]:.4g}{unit} (+{change:.0%})"
+                )
+    return messages
+
+
+def format_results(results):
+    table = pd.DataFrame([
+        {
+            'case': result['case'],
+            'rows': result['rows'],
+            'seconds': round(result['seconds'], 4),
+            'rows/s': int(result['rows_per_second'] or 0),
+            **{stage: round(seconds, 4) for stage, seconds in result['stages'].items()},
+            **({'peak MiB': round(result['peak_bytes'] / 2 ** 20, 1)} if 'peak_bytes' in result else {}),
+        }
+        for result in results
+    ])
+    columns = ['case', 'rows', 'seconds', 'rows/s'] + [column for column in STAGES + ('peak MiB',) if column in table]
+    return table[columns].fillna('').to_string(index=False)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark the Excel processing paths.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='Export sizes (default: %(default)s)')
+    parser.add_argument(
+        '--case', action='append',
+        help=f"Case name or glob pattern, repeatable (default: all of {', '.join(CASES)})",
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case; the best counts (default: %(default)s)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run that records peak memory')
+    parser.add_argument('--data', default=DATA_DIRECTORY, help='Directory the generated exports are kept in')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file (from --save) to check the results against')
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Allowed slowdown or peak growth over the baseline, as a fraction (default: %(default)s)',
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    cases = [
+        name for name in CASES
+        if not args.case or any(fnmatch.fnmatchcase(name, pattern) for pattern in args.case)
+    ]
+    if not cases:
+        parser.error(f"No case matches {', '.join(args.case)}.")
+    # Registered once, as both web apps do at startup
+    template_registry.register('receipt', RECEIPT_TEMPLATE_PATH)
+
+    results = []
+    for rows in args.rows:
+        inputs = {kind: export_path(kind, rows, args.data, args.seed) for kind in ('sales', 'receipt')}
+        for case in cases:
+            results.append(measure(case, rows, inputs, args.repeat, trace_memory=not args.no_memory))
+            print(f"{case} ({rows} rows): {results[-1]['seconds']:.3f} s", file=sys.stderr)
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'pandas': pd.__version__,
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        messages = regressions(results, baseline, args.threshold)
+        for message in messages:
+            print(f"REGRESSION {message}")
+        if messages:
+            return 1
+        print(f"No regressions over {args.threshold:.0%} against {args.compare}")
+    return 0
@@ -0,0 +1,92 @@
+"""Profile the start-up imports of both web apps.
+
+    python -m benchmarks.startup                  # both apps, slowest 15 imports each
+    python -m benchmarks.startup --app flask --top 30
+    python -m benchmarks.startup --check          # exit 1 if an app imports pandas & co. at start-up
+
+Each app is imported in a fresh interpreter under ``python -X importtime``,
+the way gunicorn and uvicorn load it: Flask's ``app`` module, and Django's
+settings plus URLconf, which imports every view. The report gives the
+import's wall time, the modules with the largest cumulative import time,
+and whichever of the heavy libraries got imported. Those should be none:
+the processing stack loads on the first upload or during warm-up (see
+``excel_engine.lazy`` and ``excel_engine.warmup``).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The libraries a web process must not pay for before it can answer a health check
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'xlsxwriter', 'pyarrow')
+
+# app: (working directory, code importing the app the way its server does)
+APPS = {
+    'flask': (os.path.join(ROOT, 'flask_app'), 'import app'),
+    'django': (
+        os.path.join(ROOT, 'django_app', 'excel_web_app'),
+        "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'excel_web_app.settings'); "
+        "import django; django.setup(); import excel_web_app.urls",
+    ),
+}
+
+# "import time:       self |  cumulative | <indent>module"
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| \s*(\S+)$')
+
+
+def profile_app(name):
+    """``{'app', 'seconds', 'imports': [(module, self µs, cumulative µs)], 'heavy': [...]}`` for one app."""
+    directory, code = APPS[name]
+    timed = (
+        "import time; _start = time.perf_counter()\n"
+        f"{code}\n"
+        "import json, sys\n"
+        f"print(json.dumps([time.perf_counter() - _start, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))"
+    )
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', timed],
+        cwd=directory, capture_output=True, text=True, check=False,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing the {name} app failed:\n{completed.stderr}")
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imports.append((match.group(3), int(match.group(1)), int(match.group(2))))
+    # From sys.modules rather than the import log, which also lists imports that failed
+    seconds, heavy = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {'app': name, 'seconds': seconds, 'imports': imports, 'heavy': heavy}
+
+
+def format_profile(profile, top):
+    lines = [f"{profile['app']}: {profile['seconds'] * 1000:.0f} ms to import, {len(profile['imports'])} modules"]
+    lines.append(f"  {'cumulative':>10}  {'self':>8}  module")
+    for module, own, cumulative in sorted(profile['imports'], key=lambda entry: entry[2], reverse=True)[:top]:
+        lines.append(f"  {cumulative / 1000:>7.1f} ms  {own / 1000:>5.1f} ms  {module}")
+    lines.append(f"  heavy modules imported: {', '.join(profile['heavy']) or 'none'}")
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.startup', description='Profile the web apps\' start-up imports.')
+    parser.add_argument('--app', choices=sorted(APPS), action='append', help='App to profile (default: both)')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports listed per app (default: %(default)s)')
+    parser.add_argument('--check', action='store_true', help='Exit with status 1 if an app imports a heavy module')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profiles = [profile_app(name) for name in args.app or sorted(APPS)]
+    print('\n\n'.join(format_profile(profile, args.top) for profile in profiles))
+    if args.check and any(profile['heavy'] for profile in profiles):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
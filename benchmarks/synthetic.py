@@ -0,0 +1,196 @@
+"""Synthetic treatment (sales) and receipt exports for benchmarking.
+
+The generated workbooks have the full column layout of the clinic
+software's exports (see ``samples/`` and ``flask_app/uploads/``): every
+column the engine never reads is there too, dates are Excel dates, ids and
+invoice numbers look like the real ones, and each export ends with the
+summary rows the real reports carry. Treatment names, departments, doctors
+and payment methods are drawn so that every bucket of every branch gets
+rows. Generation is seeded, so a given size always produces the same file.
+"""
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from excel_engine.writer import write_dataframe
+
+CENTER = 'Topmost Enterprises Pvt Ltd - Vdm'
+
+SALES_HEADER = [
+    'Date', 'Teeth', 'Center Name', 'Patient Treatment ID', 'Pt ID', 'Patient', 'New Patient', 'Gender',
+    'Date of birth', 'Mobile', 'Second Mobile', 'Email ID (Personal)', 'Email ID (Work)', 'Source', 'Source Type',
+    'Category', 'Treatment Name', 'Doctor', 'Plan Doctor', 'Price', 'Qty', 'Gross Amount', 'Discount', 'Net Amount',
+    'Tax', 'Total', 'Current balance', 'Status', 'Invoice', 'Return Invoice', 'Notes', 'Created On', 'Created By',
+    'Last Updated On', 'Last Updated By',
+]
+RECEIPT_HEADER = [
+    'Type', 'Center Name', 'Receipt #', 'Date', 'Pt Id', 'Patient', 'Amount', 'Paid By', 'Paid By Details', 'Notes',
+    'Patient Group', 'Addl Info', 'Bank Name', 'Ref Date', 'Doctor', 'Status', 'Bal Due/(Adv)', 'Source',
+    'Source Type', 'Created On', 'Created By', 'Last Updated On', 'Last Updated By',
+]
+
+# (treatment, category, weight, typical price)
+TREATMENTS = [
+    ('Consultation', 'Consultation', 20, 100),
+    ('RCT', 'Endodontics', 8, 3500),
+    ('COMPOSITE FILLING', 'Restorative', 8, 1000),
+    ('Scaling', 'Periodontics', 6, 800),
+    ('METAL CERAMIC CROWN', 'Prosthodontics', 6, 4400),
+    ('FPD', 'Prosthodontics', 4, 9000),
+    ('VENEERS', 'Cosmetic', 3, 8000),
+    ('dental ortho bonding', 'Orthodontics', 3, 30000),
+    ('debonding', 'Orthodontics', 2, 2000),
+    ('Ortho Scaling', 'Orthodontics', 2, 1000),
+    ('RPD SUNFLEX', 'Prosthodontics', 2, 12000),
+    ('Skin peel', 'Dermatology', 6, 2500),
+    ('Botox', 'Dermatology', 3, 9000),
+    ('Hair PRP', 'Trichology', 6, 4000),
+    ('X-ray', 'Radiology', 4, 150),
+]
+# Department notes as staff type them, inconsistent case and padding included
+DEPARTMENT_NOTES = [('DENTAL', 5), (' Dental', 3), ('economy', 3), ('skin ', 2), ('Skin', 1), ('HAIR', 2), ('', 1)]
+DOCTORS = [('SABNA ABDHULLAKUTTY', 4), ('ROHITH RAJ T S', 3), ('CIARA OSHIN', 3), ('Redhina Raj', 3), ('ALINA THOMAS', 2)]
+PAYMENTS = [('Cash', 4), ('Card', 2), ('Wallet', 4)]
+FIRST_NAMES = ['ANEESH', 'NISHA', 'SUSMITHA', 'SOUJATH', 'MUHAMMED', 'SHANTHA', 'NIRANJANA', 'SHELVI', 'AYAN', 'BIBI']
+LAST_NAMES = ['UMMER', 'BIJU', 'T E', 'SUKUMARAN', 'K R', 'A R', 'VARMA', 'THOMAS', 'RAJ', 'NAIR']
+
+START_DATE = datetime.datetime(2025, 10, 1)
+
+
+def _weights(weights):
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def _choice(rng, weighted, size):
+    values = np.array([value for value, _ in weighted], dtype=object)
+    return values[rng.choice(len(values), size=size, p=_weights([weight for _, weight in weighted]))]
+
+
+def _patients(rng, count):
+    """Patient ids and names; ids are drawn from a pool a quarter the size of the export, like real repeat visits."""
+    pool = max(1, count // 4)
+    numbers = rng.integers(0, pool, size=count)
+    ids = np.char.add('TMV', (1000 + numbers).astype(str)).astype(object)
+    first = np.array(FIRST_NAMES, dtype=object)[numbers % len(FIRST_NAMES)]
+    last = np.array(LAST_NAMES, dtype=object)[(numbers // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    return ids, first + ' ' + last
+
+
+def _dates(rng, count, days=30):
+    offsets = np.sort(rng.integers(0, days, size=count))
+    return pd.to_datetime(START_DATE) + pd.to_timedelta(offsets, unit='D')
+
+
+def sales_export(rows, seed=0):
+    """A treatment export with ``rows`` treatment rows plus its trailing summary row."""
+    rng = np.random.default_rng(seed)
+    treatments = rng.choice(len(TREATMENTS), size=rows, p=_weights([weight for _, _, weight, _ in TREATMENTS]))
+    names = np.array([name for name, _, _, _ in TREATMENTS], dtype=object)[treatments]
+    categories = np.array([category for _, category, _, _ in TREATMENTS], dtype=object)[treatments]
+    prices = np.array([price for _, _, _, price in TREATMENTS])[treatments]
+    totals = (prices * rng.uniform(0.8, 1.2, size=rows)).round(-1).astype(np.int64)
+    ids, patients = _patients(rng, rows)
+    dates = _dates(rng, rows)
+    created = dates + pd.to_timedelta(rng.integers(9 * 3600, 19 * 3600, size=rows), unit='s')
+    doctors = _choice(rng, DOCTORS, rows)
+
+    df = pd.DataFrame({
+        'Date': dates,
+        'Teeth': None,
+        'Center Name': CENTER,
+        'Patient Treatment ID': 2214000 + np.arange(rows),
+        'Pt ID': ids,
+        'Patient': patients,
+        'New Patient': _choice(rng, [('No', 3), ('Yes', 1)], rows),
+        'Gender': _choice(rng, [('Male', 1), ('Female', 1)], rows),
+        'Date of birth': pd.to_datetime('1960-01-01') + pd.to_timedelta(rng.integers(0, 60 * 365, size=rows), unit='D'),
+        'Mobile': 7000000000 + rng.integers(0, 2999999999, size=rows),
+        'Second Mobile': None,
+        'Email ID (Personal)': None,
+        'Email ID (Work)': None,
+        'Source': None,
+        'Source Type': None,
+        'Category': categories,
+        'Treatment Name': names,
+        'Doctor': doctors,
+        'Plan Doctor': doctors,
+        'Price': totals.astype(float),
+        'Qty': 1,
+        'Gross Amount': totals,
+        'Discount': 0,
+        'Net Amount': totals,
+        'Tax': 0,
+        'Total': totals,
+        'Current balance': 0.0,
+        'Status': 'Completed',
+        'Invoice': 6000 + np.arange(rows),
+        'Return Invoice': None,
+        'Notes': _choice(rng, DEPARTMENT_NOTES, rows),
+        'Created On': created,
+        'Created By': doctors,
+        'Last Updated On': created,
+        'Last Updated By': 'Parvathy',
+    }, columns=SALES_HEADER)
+    # The report's summary row, e.g. "Count: 7 6090 6090"
+    df = df.reindex(range(rows + 1)).astype({'Date': object})
+    df.loc[rows, ['Date', 'Net Amount', 'Total']] = [f"Count: {rows}", totals.sum(), totals.sum()]
+    return df
+
+
+def receipt_export(rows, seed=0):
+    """A receipt export with ``rows`` receipts plus the report's trailing summary rows."""
+    rng = np.random.default_rng(seed + 1)
+    ids, patients = _patients(rng, rows)
+    dates = _dates(rng, rows)
+    created = dates + pd.to_timedelta(rng.integers(9 * 3600, 19 * 3600, size=rows), unit='s')
+    amounts = (rng.uniform(100, 5000, size=rows)).round(-2).astype(np.int64)
+    paid_by = _choice(rng, PAYMENTS, rows)
+    details = np.where(paid_by == 'Wallet', 'Google pay', np.where(paid_by == 'Card', 'POS', None))
+
+    df = pd.DataFrame({
+        'Type': 'Receipt',
+        'Center Name': CENTER,
+        'Receipt #': 7000 + np.arange(rows),
+        'Date': dates,
+        'Pt Id': ids,
+        'Patient': patients,
+        'Amount': amounts,
+        'Paid By': paid_by,
+        'Paid By Details': details,
+        'Notes': _choice(rng, DEPARTMENT_NOTES, rows),
+        'Patient Group': None,
+        'Addl Info': None,
+        'Bank Name': None,
+        'Ref Date': None,
+        'Doctor': _choice(rng, DOCTORS, rows),
+        'Status': 'Regular',
+        'Bal Due/(Adv)': 0,
+        'Source': None,
+        'Source Type': None,
+        'Created On': created,
+        'Created By': 'Parvathy',
+        'Last Updated On': created,
+        'Last Updated By': 'Parvathy',
+    }, columns=RECEIPT_HEADER)
+    total = amounts.sum()
+    # The report's summary rows, one text cell each
+    df = df.reindex(range(rows + 3))
+    df.loc[rows, 'Center Name'] = f"Total Amount: {total:,.2f}"
+    df.loc[rows + 1, 'Type'] = f"Report Summary: Count: {rows} | Total Amount: {total:,.2f}"
+    df.loc[rows + 2, 'Patient'] = f"Parvathy (#{rows}): {total:,.2f}"
+    return df
+
+
+EXPORTS = {'sales': sales_export, 'receipt': receipt_export}
+
+
+def export_path(kind, rows, directory, seed=0):
+    """Path of the ``kind`` export with ``rows`` rows, generated into ``directory`` on first use."""
+    path = os.path.join(directory, f"{kind}_{rows}_{seed}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_dataframe(EXPORTS[kind](rows, seed), path)
+    return path
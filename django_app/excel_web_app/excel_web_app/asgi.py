@@ -9,8 +9,25 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'excel_web_app.settings')
 
 application = get_asgi_application()
+
+if settings.DEBUG:
+    # Serve the app's static files the way runserver did
+    application = ASGIStaticFilesHandler(application)
+
+# Imported once the settings have put the repository root on sys.path
+from excel_engine.warmup import start_warm_up  # noqa: E402
+# The views configure the metrics directory; uvicorn's one process is the parent of every pool worker
+from processor.views import metrics  # noqa: E402
+
+# The metrics files there are from processes of an earlier run
+metrics.clear()
+
+# By default on a thread, so /healthz answers while pandas loads and /readyz reports when it is done
+start_warm_up()
@@ -18,8 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic.base import RedirectView
 
+from processor import views as processor_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('processor/', include('processor.urls')),
+    path('healthz', processor_views.healthz, name='healthz'),
+    path('readyz', processor_views.readyz, name='readyz'),
+    path('metrics', processor_views.prometheus_metrics, name='metrics'),
     path('', RedirectView.as_view(url='processor/', permanent=True)),
 ]
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import LedgerEntry
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('date', 'branch', 'kind', 'category', 'patient_id', 'patient_name', 'amount')
+    list_filter = ('kind', 'branch', 'category')
+    search_fields = ('patient_id', 'patient_name', 'invoice')
+    date_hierarchy = 'date'
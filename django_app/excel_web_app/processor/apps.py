@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ProcessorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'processor'
+
+    def ready(self):
+        # Once per process, after the apps are loaded; starting it on import made it a side effect of whoever imports the views
+        from .views import janitor
+
+        janitor.start()
@@ -0,0 +1,155 @@
+"""Append-only ledger of processed rows.
+
+Every processed upload's sales rows, and the receipt export the Vedimara
+branch uploads alongside, are bulk inserted into ``LedgerEntry``, so a
+month-to-date or date-range view is one indexed query streamed into a
+workbook instead of a re-parse of every daily file.
+"""
+import decimal
+import logging
+import os
+import uuid
+
+import pandas as pd
+from django.db import DatabaseError, connections
+
+from excel_engine.dates import parse_dates
+from excel_engine.metrics import metrics
+from excel_engine.writer import write_rows
+
+from .models import LedgerEntry
+
+INGEST_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+CENT = decimal.Decimal('0.01')
+
+# (model field, column header) per kind, in export order
+EXPORT_COLUMNS = {
+    LedgerEntry.SALES: [
+        ('date', 'Date'), ('branch', 'Branch'), ('category', 'Category'), ('patient_id', 'ID'),
+        ('patient_name', 'Name'), ('treatment', 'Treatment Name'), ('doctor', 'Doctors  Name'),
+        ('net_amount', 'Total Amount'), ('base_value', 'Base Value'), ('sgst', 'Sgst'), ('cgst', 'Cgst'),
+        ('amount', 'Total inv'), ('invoice', 'Invoice No'),
+    ],
+    LedgerEntry.RECEIPT: [
+        ('date', 'Date'), ('branch', 'Branch'), ('category', 'Category'), ('patient_id', 'Pt Id'),
+        ('patient_name', 'Patient'), ('amount', 'Amount'), ('paid_by', 'Paid By'),
+    ],
+}
+
+logger = logging.getLogger(__name__)
+
+# Process the database connections belong to; job workers are forked from it
+_connections_pid = os.getpid()
+
+
+def _text(value, field):
+    if value is None or value is pd.NaT or (isinstance(value, float) and value != value):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Invoice numbers come out of the export as floats
+        value = int(value)
+    return str(value).strip()[:LedgerEntry._meta.get_field(field).max_length]
+
+
+def _decimal(value):
+    return None if pd.isna(value) else decimal.Decimal(str(value)).quantize(CENT)
+
+
+def _column(df, name):
+    return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def sales_entries(plan, frames, branch):
+    """Ledger rows for the output frames of ``plan.split``; summary and undated rows are left out."""
+    entries = []
+    for index, frame in frames.items():
+        category = os.path.splitext(plan.outputs[index][1])[0]
+        dates = parse_dates(frame['Date'], source='sales')
+        totals = pd.to_numeric(frame['Total inv'], errors='coerce')
+        keep = (dates.notna() & totals.notna() & frame['ID'].notna()).to_numpy()
+        numbers = {
+            column: pd.to_numeric(frame[column], errors='coerce')[keep]
+            for column in ('Total Amount', 'Base Value', 'Sgst', 'Cgst')
+        }
+        rows = zip(
+            dates[keep].dt.date, totals[keep], frame['ID'][keep], frame['Name'][keep],
+            frame['Treatment Name'][keep], frame['Doctors  Name'][keep], frame['Invoice No'][keep],
+            numbers['Total Amount'], numbers['Base Value'], numbers['Sgst'], numbers['Cgst'],
+        )
+        for date, total, patient_id, name, treatment, doctor, invoice, net, base, sgst, cgst in rows:
+            entries.append(LedgerEntry(
+                kind=LedgerEntry.SALES, branch=branch, category=category, date=date,
+                patient_id=_text(patient_id, 'patient_id'), patient_name=_text(name, 'patient_name'),
+                treatment=_text(treatment, 'treatment'), doctor=_text(doctor, 'doctor'),
+                invoice=_text(invoice, 'invoice'), amount=_decimal(total), net_amount=_decimal(net),
+                base_value=_decimal(base), sgst=_decimal(sgst), cgst=_decimal(cgst),
+            ))
+    return entries
+
+
+def receipt_entries(df, branch):
+    """Ledger rows for a receipt export; rows without a date, patient or amount are left out."""
+    if not {'Date', 'Pt Id', 'Amount'} <= set(df.columns):
+        return []
+    dates = parse_dates(df['Date'], source='receipt')
+    amounts = pd.to_numeric(df['Amount'], errors='coerce')
+    keep = (dates.notna() & amounts.notna() & df['Pt Id'].notna()).to_numpy()
+    rows = zip(
+        dates[keep].dt.date, amounts[keep], df['Pt Id'][keep],
+        _column(df, 'Patient')[keep], _column(df, 'Paid By')[keep], _column(df, 'Notes')[keep],
+    )
+    return [
+        LedgerEntry(
+            kind=LedgerEntry.RECEIPT, branch=branch, category=_text(notes, 'category'), date=date,
+            patient_id=_text(patient_id, 'patient_id'), patient_name=_text(name, 'patient_name'),
+            paid_by=_text(paid_by, 'paid_by'), amount=_decimal(amount),
+        )
+        for date, amount, patient_id, name, paid_by, notes in rows
+    ]
+
+
+def _own_connections():
+    # A worker forked from the web process must not reuse the connections it inherited
+    global _connections_pid
+    if os.getpid() != _connections_pid:
+        connections.close_all()
+        _connections_pid = os.getpid()
+
+
+def ingest(entries):
+    """Bulk insert ``entries``, skipping rows the ledger already holds.
+
+    Runs inside job workers; a database problem is logged rather than
+    raised, so it never costs the user the outputs they are waiting for.
+    """
+    if not entries:
+        return
+    try:
+        _own_connections()
+        with metrics.stage('ledger'):
+            LedgerEntry.objects.bulk_create(entries, batch_size=INGEST_BATCH_SIZE, ignore_conflicts=True)
+    except DatabaseError:
+        logger.exception('Ledger ingest of %d rows failed', len(entries))
+
+
+def entries_between(kind, start, end, branch=None):
+    """Entries of ``kind`` dated ``start`` to ``end`` inclusive, oldest first."""
+    entries = LedgerEntry.objects.filter(kind=kind, date__range=(start, end))
+    if branch:
+        entries = entries.filter(branch=branch)
+    return entries.order_by('date', 'id')
+
+
+def export(kind, start, end, directory, branch=None):
+    """Write the matching entries to a workbook in ``directory`` and return its path.
+
+    Rows go from the database cursor straight into the sheet, so the export
+    never holds the whole range in memory.
+    """
+    columns = EXPORT_COLUMNS[kind]
+    rows = entries_between(kind, start, end, branch).values_list(*[field for field, _ in columns])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f".ledger-{uuid.uuid4().hex}.xlsx")
+    write_rows([header for _, header in columns], rows.iterator(chunk_size=EXPORT_CHUNK_SIZE), path)
+    return path
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sales', 'Sales'), ('receipt', 'Receipt')], max_length=16)),
+                ('branch', models.CharField(max_length=32)),
+                ('category', models.CharField(blank=True, max_length=64)),
+                ('date', models.DateField()),
+                ('patient_id', models.CharField(max_length=32)),
+                ('patient_name', models.CharField(blank=True, max_length=128)),
+                ('treatment', models.CharField(blank=True, max_length=128)),
+                ('doctor', models.CharField(blank=True, max_length=128)),
+                ('invoice', models.CharField(blank=True, max_length=32)),
+                ('paid_by', models.CharField(blank=True, max_length=32)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('net_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('base_value', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('sgst', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('cgst', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('ingested_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='ledger_date_idx'), models.Index(fields=['branch', 'date'], name='ledger_branch_date_idx'), models.Index(fields=['category', 'date'], name='ledger_category_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'branch', 'patient_id', 'date', 'invoice', 'treatment', 'amount'), name='ledger_entry_unique_row')],
+            },
+        ),
+    ]
@@ -1,3 +1,49 @@
 from django.db import models
 
-# Create your models here.
+
+class LedgerEntry(models.Model):
+    """One processed sales or receipt row, kept after its upload's files are gone.
+
+    Rows are only ever inserted. Re-ingesting an export skips the rows the
+    ledger already holds: a row is the same when its kind, branch, patient,
+    date, invoice, treatment and amount match (receipts have no invoice or
+    treatment, so they are told apart by amount).
+    """
+    SALES = 'sales'
+    RECEIPT = 'receipt'
+    KIND_CHOICES = [(SALES, 'Sales'), (RECEIPT, 'Receipt')]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    branch = models.CharField(max_length=32)
+    # Output bucket for sales rows (e.g. 'Kalamassery_Dental_Consultation'), the 'Notes' department for receipts
+    category = models.CharField(max_length=64, blank=True)
+    date = models.DateField()
+    patient_id = models.CharField(max_length=32)
+    patient_name = models.CharField(max_length=128, blank=True)
+    treatment = models.CharField(max_length=128, blank=True)
+    doctor = models.CharField(max_length=128, blank=True)
+    invoice = models.CharField(max_length=32, blank=True)
+    paid_by = models.CharField(max_length=32, blank=True)
+    # Invoice total for sales rows, the paid amount for receipts
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    net_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    base_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    sgst = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    cgst = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    ingested_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'branch', 'patient_id', 'date', 'invoice', 'treatment', 'amount'],
+                name='ledger_entry_unique_row',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='ledger_date_idx'),
+            models.Index(fields=['branch', 'date'], name='ledger_branch_date_idx'),
+            models.Index(fields=['category', 'date'], name='ledger_category_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch} {self.kind} {self.date} {self.patient_id} {self.amount}"
@@ -1,3 +1,719 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import datetime
+import functools
+import io
+import multiprocessing
+import os
+import pstats
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+from openpyxl import Workbook, load_workbook
+
+from benchmarks.startup import profile_app
+from excel_engine import (
+    UNMATCHED,
+    JobQueue,
+    KeywordClassifier,
+    MemoryStore,
+    ResultCache,
+    TemplateRegistry,
+    gst_kernel,
+    memory_store,
+    plan_for_branch,
+    read_columns,
+    write_dataframe,
+    write_sheets,
+)
+from excel_engine.batch import map_files, merge_frames, unique_filenames
+from excel_engine.bundle import bundle_files, stream_zip
+from excel_engine.cli import main as cli_main
+from excel_engine.dates import parse_dates
+from excel_engine.frames import FrameCache
+from excel_engine.metrics import Metrics, metrics
+from excel_engine.namespaces import new_namespace, sweep
+from excel_engine.patients import PatientDepartments, patient_departments
+from excel_engine.preflight import PreflightError, preflight
+from excel_engine.profiling import ProfileStore
+from excel_engine import dates, warmup
+from excel_engine.warmup import warm_up
+
+from . import ledger, views
+from .models import LedgerEntry
+
+
+def sales_frame(rows):
+    columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice', 'Notes']
+    return pd.DataFrame(rows, columns=columns)
+
+
+RECEIPT_HEADER = ['Date', 'Pt Id', 'Patient', 'Amount', 'Paid By', 'Notes']
+
+
+def write_workbook(path, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+class TemplateRegistryTests(SimpleTestCase):
+    def test_headers_reload_when_template_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'template.xlsx')
+            write_workbook(path, [['Date', 'ID', 'Name'], ['07-10-2025', 'TNM1', 'A']])
+            registry = TemplateRegistry()
+            registry.register('receipt', path)
+            self.assertEqual(registry.headers('receipt'), ['Date', 'ID', 'Name'])
+
+            write_workbook(path, [['Date', 'ID', 'Name', 'Total Amount']])
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+            self.assertEqual(registry.headers('receipt'), ['Date', 'ID', 'Name', 'Total Amount'])
+
+
+class KeywordClassifierTests(SimpleTestCase):
+    def test_first_matching_bucket_wins(self):
+        classifier = KeywordClassifier([('consultation', ['consultation']), ('ortho', ['debonding', 'FPD'])])
+        codes = classifier.classify(pd.Series(['Consultation', 'fpd bridge', 'RCT', None, 'consultation debonding']))
+        self.assertEqual(codes.tolist(), [0, 1, UNMATCHED, UNMATCHED, 0])
+
+    def test_exact_mode_ignores_case_and_padding(self):
+        classifier = KeywordClassifier([('dental', ['dental']), ('skin', ['skin'])], exact=True)
+        codes = classifier.classify(pd.Series([' Dental', 'SKIN', 'skin care']))
+        self.assertEqual(codes.tolist(), [0, 1, UNMATCHED])
+
+
+class GstKernelTests(SimpleTestCase):
+    def test_rates_are_applied_per_row_in_paise(self):
+        base, sgst, cgst, taxed = gst_kernel(pd.Series([1000, 105, 'n/a', 500]), [1800, 500, 1800, -1])
+        self.assertEqual(base[:2].tolist(), [847.46, 100.0])
+        self.assertEqual(sgst[:2].tolist(), [76.27, 2.5])
+        self.assertEqual(cgst[:2].tolist(), [76.27, 2.5])
+        self.assertTrue(pd.isna(base[2:]).all())
+        self.assertEqual(taxed.tolist(), [True, True, True, False])
+
+    def test_half_paisa_rounds_away_from_zero(self):
+        _, sgst, _, _ = gst_kernel(pd.Series([0.21, -0.21]), [500, 500])
+        self.assertEqual(sgst.tolist(), [0.01, -0.01])
+
+
+class ReadColumnsTests(SimpleTestCase):
+    def test_projects_columns_and_trims_blank_rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'receipts.xlsx')
+            write_workbook(path, [
+                ['Type', 'Pt Id', 'Amount', 'Notes'],
+                ['Receipt', 'TMV1', 1000.0, 'DENTAL'],
+                ['Receipt', 'TMV2', 250.5, 'N/A'],
+                [None, None, None, None],
+            ])
+            df = read_columns(path, ['Pt Id', 'Amount', 'Notes', 'Paid By'])
+
+        self.assertEqual(list(df.columns), ['Pt Id', 'Amount', 'Notes'])
+        self.assertEqual(df['Amount'].tolist(), [1000, 250.5])
+        self.assertEqual(df['Notes'].tolist(), ['DENTAL', None])
+
+
+class ParseDatesTests(SimpleTestCase):
+    def test_known_formats_datetimes_and_summary_rows(self):
+        values = pd.Series([
+            datetime.datetime(2025, 11, 3, 9, 30), '04-11-2025', ' 05/11/2025 ', '2025-11-06',
+            'Total Amount: 95,260.00 | Cash: 39,120.00', None,
+        ])
+        with mock.patch.dict(dates._formats, clear=True):
+            parsed = parse_dates(values, source='receipt')
+            learned = dict(dates._formats)
+
+        self.assertEqual(parsed.tolist()[:4], [
+            pd.Timestamp('2025-11-03 09:30'), pd.Timestamp('2025-11-04'),
+            pd.Timestamp('2025-11-05'), pd.Timestamp('2025-11-06'),
+        ])
+        self.assertTrue(parsed[4:].isna().all())
+        # Day first, and remembered for the next export of the same shape
+        self.assertEqual(learned, {('receipt', '9/9/9'): '%d/%m/%Y'})
+
+    def test_learned_format_is_tried_first(self):
+        values = pd.Series(['03-11-2025', '04-11-2025'])
+        with mock.patch.dict(dates._formats, {('receipt', '9-9-9'): '%Y-%m-%d'}, clear=True):
+            parsed = parse_dates(values, source='receipt')
+
+        self.assertEqual(parsed.tolist(), [pd.Timestamp('2025-11-03'), pd.Timestamp('2025-11-04')])
+
+
+class FrameCacheTests(SimpleTestCase):
+    def test_reparse_is_served_from_the_sidecar(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'receipts.xlsx')
+            write_workbook(path, [
+                ['Date', 'Pt Id', 'Amount', 'Notes'],
+                ['05-11-2025', 'TMV1', 1000, 'DENTAL'],
+                [None, 17, 250.5, None],
+            ])
+            cache = FrameCache(os.path.join(tmp, 'frames'))
+            columns = ['Date', 'Pt Id', 'Amount', 'Notes']
+            parsed = cache.read(path, columns)
+            sidecars = os.listdir(cache.directory)
+            cached = cache.read(path, columns)
+
+            self.assertEqual(len(sidecars), 1)
+            self.assertTrue(cached.equals(parsed))
+            self.assertEqual(list(cached.dtypes), list(read_columns(path, columns).dtypes))
+            self.assertEqual(cached['Pt Id'].tolist(), ['TMV1', 17])
+
+            # Different columns of the same file are a different sidecar
+            cache.read(path, ['Pt Id'])
+            self.assertEqual(len(os.listdir(cache.directory)), 2)
+
+
+class WriteDataFrameTests(SimpleTestCase):
+    def test_streaming_backend_matches_pandas_output(self):
+        df = pd.DataFrame({
+            'Date': pd.to_datetime(['2025-11-03', None]),
+            'ID': ['TMV1', 'TMV2'],
+            'Base Value': [847.46, float('nan')],
+            'Sgst': ['', ''],
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            expected_path = write_dataframe(df, os.path.join(tmp, 'pandas.xlsx'), engine='openpyxl')
+            actual_path = write_dataframe(df, os.path.join(tmp, 'streaming.xlsx'), engine='streaming')
+            pd.testing.assert_frame_equal(pd.read_excel(actual_path), pd.read_excel(expected_path))
+
+    def test_date_only_columns_are_date_cells(self):
+        df = pd.DataFrame({
+            'Date': pd.to_datetime(['2025-11-03', None]),
+            'Time': pd.to_datetime(['2025-11-03 09:30', '2025-11-04 00:00']),
+            'Amount': [500, 1650],
+        })
+        for engine in ('streaming', 'openpyxl', 'xlsxwriter'):
+            buffer = io.BytesIO()
+            write_sheets([('Sheet1', df)], buffer, engine=engine, date_format='dd-mm-yyyy')
+            buffer.seek(0)
+            row = load_workbook(buffer).active[2]
+
+            self.assertEqual(row[0].value, datetime.datetime(2025, 11, 3), engine)
+            self.assertEqual(row[0].number_format, 'dd-mm-yyyy', engine)
+            self.assertNotEqual(row[1].number_format, 'dd-mm-yyyy', engine)
+            self.assertEqual(row[2].value, 500, engine)
+
+
+class BranchPlanTests(SimpleTestCase):
+    def test_kalamassery_buckets_and_gst(self):
+        df = sales_frame([
+            ['2025-11-05', 'TNM1', 'A', 'Consultation', 'Dr X', 118, 0, 118, 1, 'Dental'],
+            ['2025-11-05', 'TNM2', 'B', 'FPD', 'Dr X', 105, 0, 105, 2, 'dental'],
+            ['2025-11-05', 'TNM3', 'C', 'RCT', 'Dr X', 2000, 0, 2000, 3, 'dental'],
+            ['2025-11-05', 'TNM4', 'D', 'Hair PRP', 'Dr Y', 1180, 0, 1180, 4, 'hair'],
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            files = plan_for_branch('Kalamassery').run(df, tmp)
+            self.assertEqual(list(files), [
+                'Kalamassery_Dental_Consultation',
+                'Kalamassery_Dental_Ortho_Bonding',
+                'Kalamassery_Dental_Rest',
+                'Kalamassery_Hair',
+            ])
+            consultation = pd.read_excel(files['Kalamassery_Dental_Consultation'])
+            ortho = pd.read_excel(files['Kalamassery_Dental_Ortho_Bonding'])
+            rest = pd.read_excel(files['Kalamassery_Dental_Rest'])
+            hair = pd.read_excel(files['Kalamassery_Hair'])
+
+        self.assertEqual(consultation[['Base Value', 'Sgst', 'Cgst']].values.tolist(), [[100, 9, 9]])
+        self.assertEqual(consultation['Doctors  Name'].tolist(), ['Clinic'])
+        self.assertEqual(ortho[['Base Value', 'Sgst', 'Cgst']].values.tolist(), [[100, 2.5, 2.5]])
+        self.assertEqual(rest['ID'].tolist(), ['TNM3'])
+        self.assertTrue(rest['Base Value'].isna().all())
+        self.assertEqual(hair[['Total Amount', 'Sgst']].values.tolist(), [[1000, 90]])
+
+    def test_choondy_doctor_must_match_exactly(self):
+        df = sales_frame([
+            ['2025-11-05', 'TCH1', 'A', 'Skin peel', 'Redhina Raj', 100, 0, 100, 1, None],
+            ['2025-11-05', 'TCH2', 'B', 'Skin peel', 'REDHINA RAJ ', 100, 0, 100, 2, None],
+        ])
+        plan = plan_for_branch('Choondy')
+        ids = {plan.outputs[index][0]: frame['ID'].tolist() for index, frame in plan.split(df).items() if len(frame)}
+
+        self.assertEqual(ids, {'Choondy_Skin_Other': ['TCH1'], 'Choondy_Dental_Rest': ['TCH2']})
+
+    def test_missing_department_column_is_reported(self):
+        df = sales_frame([]).drop(columns='Notes')
+        with self.assertRaisesMessage(ValueError, "missing the 'Notes' column"):
+            plan_for_branch('Kalamassery').run(df, tempfile.gettempdir())
+
+    def test_outputs_render_into_memory_without_a_directory(self):
+        df = sales_frame([['2025-11-05', 'TNM4', 'D', 'Hair PRP', 'Dr Y', 1180, 0, 1180, 4, 'hair']])
+        files = plan_for_branch('Kalamassery').run(df, None)
+
+        self.assertEqual(files, {'Kalamassery_Hair': 'Kalamassery_Hair.xlsx'})
+        hair = pd.read_excel(io.BytesIO(memory_store.get('Kalamassery_Hair.xlsx')))
+        self.assertEqual(hair[['Total Amount', 'Sgst']].values.tolist(), [[1000, 90]])
+
+    def test_workbook_mode_writes_one_sheet_per_bucket(self):
+        df = sales_frame([
+            ['2025-11-05', 'TNM1', 'A', 'Consultation', 'Dr X', 118, 0, 118, 1, 'dental'],
+            ['2025-11-05', 'TNM4', 'D', 'Hair PRP', 'Dr Y', 1180, 0, 1180, 4, 'hair'],
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            files = plan_for_branch('Kalamassery').run(df, tmp, output_mode='workbook')
+            self.assertEqual(os.listdir(tmp), ['Kalamassery.xlsx'])
+            sheets = pd.read_excel(files['Kalamassery'], sheet_name=None)
+
+        self.assertEqual(list(sheets), ['Dental_Consultation', 'Dental_Ortho_Bonding', 'Dental_Rest', 'Hair'])
+        self.assertEqual(sheets['Dental_Consultation']['ID'].tolist(), ['TNM1'])
+        self.assertTrue(sheets['Dental_Rest'].empty)
+        self.assertEqual(sheets['Hair'][['Total Amount', 'Sgst']].values.tolist(), [[1000, 90]])
+
+
+def failing_job(message):
+    raise ValueError(message)
+
+
+def crashing_job():
+    # Dies the way an OOM-killed worker does, without raising
+    os._exit(1)
+
+
+class PatientDepartmentsTests(SimpleTestCase):
+    def test_repeat_receipts_do_not_multiply_sales_rows(self):
+        receipts = pd.DataFrame({
+            'Pt Id': ['TMV1', 'TMV1', 'tmv2 ', 'TMV1'],
+            'Notes': ['Dental', 'Dental', 'Skin', 'Economy'],
+        })
+        frames = plan_for_branch('Vedimara').split(sales_frame([
+            ['2025-11-05', 'TMV1', 'A', 'Consultation', 'Dr X', 118, 0, 118, 1, None],
+            ['2025-11-05', 'TMV2', 'B', 'Botox', 'Dr Y', 105, 0, 105, 2, None],
+            ['2025-11-05', 'TMV3', 'C', 'RCT', 'Dr X', 2000, 0, 2000, 3, None],
+        ]), receipts)
+
+        outputs = {plan_for_branch('Vedimara').outputs[index][0]: frame['ID'].tolist() for index, frame in frames.items()}
+        self.assertEqual(outputs['Vedimara_Economy_Consultation'], ['TMV1'])
+        self.assertEqual(outputs['Vedimara_Skin_Other'], ['TMV2'])
+        self.assertEqual(sum(len(ids) for ids in outputs.values()), 2)
+
+    def test_index_persists_and_later_receipts_win(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'departments.npz')
+            PatientDepartments(path).update(['TMV1', 'TMV2', None], ['Dental', 'Skin', 'Dental'])
+            index = PatientDepartments(path)
+            self.assertEqual(index.lookup(['TMV2', 'TMV9', 'TMV1']).fillna('').tolist(), ['Skin', '', 'Dental'])
+
+            PatientDepartments(path).update(['TMV1', 'TMV3'], ['Economy', 'Skin'])
+            self.assertEqual(index.lookup(['TMV1', 'TMV3']).tolist(), ['Economy', 'Skin'])
+            self.assertEqual(len(index), 3)
+
+
+class BatchTests(SimpleTestCase):
+    def test_merged_splits_match_one_combined_export(self):
+        hair = ['2025-11-05', 'TNM4', 'D', 'Hair PRP', 'Dr Y', 1180, 0, 1180, 4, 'hair']
+        dental = ['2025-11-05', 'TNM1', 'A', 'Consultation', 'Dr X', 118, 0, 118, 1, 'Dental']
+        plan = plan_for_branch('Kalamassery')
+        merged = merge_frames([plan.split(sales_frame([hair])), plan.split(sales_frame([dental, hair]))])
+        together = plan.split(sales_frame([hair, dental, hair]))
+
+        self.assertEqual(list(merged), list(together))
+        for index, frame in merged.items():
+            self.assertEqual(frame.values.tolist(), together[index].values.tolist())
+
+    def test_repeated_filenames_are_suffixed(self):
+        self.assertEqual(
+            unique_filenames(['a.xlsx', 'b.xlsx', 'a.xlsx', 'combined.xlsx'], taken=['combined.xlsx']),
+            ['a.xlsx', 'b.xlsx', 'a_2.xlsx', 'combined_2.xlsx'],
+        )
+
+
+class CliTests(SimpleTestCase):
+    def test_sales_directory_is_processed_per_file(self):
+        header = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice', 'Notes']
+        with tempfile.TemporaryDirectory() as tmp:
+            inputs = os.path.join(tmp, 'in')
+            os.makedirs(inputs)
+            for name in ['a.xlsx', 'b.xlsx']:
+                write_workbook(os.path.join(inputs, name), [header, ['05-11-2025', 'TNM1', 'A', 'Consultation', 'Dr X', 118, 0, 118, 1, '']])
+            write_workbook(os.path.join(inputs, '~$a.xlsx'), [header])
+            output = os.path.join(tmp, 'out')
+            with contextlib.redirect_stdout(io.StringIO()) as report:
+                status = cli_main(['sales', inputs, '-o', output, '--workers', '1'])
+
+            self.assertEqual(status, 0)
+            self.assertEqual(sorted(os.listdir(output)), ['a', 'b'])
+            consultation = pd.read_excel(os.path.join(output, 'a', 'Treatments_Done_Consultation.xlsx'))
+        self.assertEqual(consultation['Base Value'].tolist(), [100])
+        self.assertIn('2 file(s), 0 failed, 2 rows', report.getvalue())
+
+    def test_spawned_workers_set_up_their_own_state(self):
+        # Spawned workers inherit nothing from the parent's modules, unlike forked ones
+        spawn = functools.partial(map_files, mp_context=multiprocessing.get_context('spawn'))
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ['a.xlsx', 'b.xlsx']:
+                write_workbook(os.path.join(tmp, name), [RECEIPT_HEADER, [datetime.datetime(2025, 11, 5), 'TMV1', 'A', 100, 'Cash', 'dental']])
+            output = os.path.join(tmp, 'out')
+            with mock.patch('excel_engine.cli.map_files', spawn), contextlib.redirect_stdout(io.StringIO()) as report:
+                status = cli_main([
+                    'receipts', os.path.join(tmp, '*.xlsx'), '-o', output, '--bank', 'SBI BANK',
+                    '--workers', '2', '--frame-cache', os.path.join(tmp, 'frames'),
+                ])
+            frames = os.listdir(os.path.join(tmp, 'frames'))
+
+        self.assertEqual(status, 0, report.getvalue())
+        self.assertIn('2 file(s), 0 failed, 2 rows', report.getvalue())
+        self.assertTrue(frames)
+
+    def test_spawned_workers_read_the_patient_index(self):
+        spawn = functools.partial(map_files, mp_context=multiprocessing.get_context('spawn'))
+        header = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice', 'Notes']
+        with tempfile.TemporaryDirectory() as tmp:
+            receipt = os.path.join(tmp, 'receipt.xlsx')
+            write_workbook(receipt, [RECEIPT_HEADER, [datetime.datetime(2025, 11, 5), 'TMV1', 'A', 100, 'Cash', 'Dental']])
+            os.makedirs(os.path.join(tmp, 'sales'))
+            for name, patient in [('known.xlsx', 'TMV1'), ('unknown.xlsx', 'TMV9')]:
+                write_workbook(os.path.join(tmp, 'sales', name), [header, ['05-11-2025', patient, 'A', 'RCT', 'Dr X', 2000, 0, 2000, 1, None]])
+            with mock.patch('excel_engine.cli.map_files', spawn), \
+                    mock.patch('excel_engine.cli.patient_departments', PatientDepartments()), \
+                    contextlib.redirect_stdout(io.StringIO()) as report:
+                status = cli_main([
+                    'sales', os.path.join(tmp, 'sales', '*.xlsx'), '-o', os.path.join(tmp, 'out'), '--branch', 'Vedimara',
+                    '--receipt', receipt, '--patient-index', os.path.join(tmp, 'index', 'patients.json'), '--workers', '2',
+                ])
+
+        self.assertEqual(status, 1)
+        self.assertIn('2 file(s), 1 failed, 1 rows', report.getvalue())
+        self.assertRegex(report.getvalue(), r'known\.xlsx\s+1\s+1\s')
+        self.assertIn('unknown.xlsx  failed', report.getvalue())
+
+
+class LedgerTests(TestCase):
+    def test_reingested_rows_are_skipped_and_ranges_export(self):
+        plan = plan_for_branch('Kalamassery')
+        frames = plan.split(sales_frame([
+            ['2025-11-05', 'TNM1', 'A', 'Consultation', 'Dr X', 118, 0, 118, 1, 'Dental'],
+            ['2025-11-06', 'TNM4', 'D', 'Hair PRP', 'Dr Y', 1180, 0, 1180, 4, 'hair'],
+            ['2025-12-01', 'TNM5', 'E', 'Hair PRP', 'Dr Y', 590, 0, 590, 5, 'hair'],
+            ['Total', None, None, None, None, 1888, 0, 1888, None, None],
+        ]))
+        ledger.ingest(ledger.sales_entries(plan, frames, 'Kalamassery'))
+        ledger.ingest(ledger.sales_entries(plan, frames, 'Kalamassery'))
+        self.assertEqual(LedgerEntry.objects.count(), 3)
+
+        response = self.client.get('/processor/ledger/export/', {'start': '2025-11-01', 'end': '2025-11-30'})
+        self.assertEqual(response.status_code, 200)
+        rows = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(rows['ID'].tolist(), ['TNM1', 'TNM4'])
+        self.assertEqual(rows['Category'].tolist(), ['Kalamassery_Dental_Consultation', 'Kalamassery_Hair'])
+        self.assertEqual(rows[['Base Value', 'Sgst', 'Total inv']].values.tolist(), [[100, 9, 118], [1000, 90, 1180]])
+
+    def test_bad_range_is_rejected(self):
+        response = self.client.get('/processor/ledger/export/', {'start': '05-11-2025', 'end': '2025-11-30'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_request_histograms_are_merged_across_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = Metrics()
+            registry.configure(tmp, app='test')
+            with registry.request(kind='sales', branch='Kalamassery'):
+                with registry.stage('read'):
+                    pass
+                registry.add(rows=120, bytes_in=5000, bytes_out=3000, outputs=2)
+            # A second worker process that saw the same request
+            shutil.copy(os.path.join(tmp, f"{os.getpid()}.json"), os.path.join(tmp, '1.json'))
+            text = registry.render()
+
+        labels = 'app="test",branch="Kalamassery",kind="sales"'
+        self.assertIn('# TYPE excel_stage_seconds histogram', text)
+        self.assertIn(f'excel_stage_seconds_count{{{labels},stage="read"}} 2', text)
+        self.assertIn(f'excel_request_rows_bucket{{{labels},le="100"}} 0', text)
+        self.assertIn(f'excel_request_rows_bucket{{{labels},le="1000"}} 2', text)
+        self.assertIn(f'excel_request_rows_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'excel_request_rows_sum{{{labels}}} 240', text)
+        self.assertIn(f'excel_request_outputs_count{{{labels}}} 2', text)
+
+    def test_exited_processes_are_folded_and_a_reused_pid_starts_empty(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = Metrics()
+            registry.configure(tmp, app='test')
+            with registry.request(kind='sales', branch='Kalamassery'):
+                pass
+            child = subprocess.Popen([sys.executable, '-c', ''])
+            child.wait()
+            shutil.copy(os.path.join(tmp, f"{os.getpid()}.json"), os.path.join(tmp, f"{child.pid}.json"))
+
+            # A new process that got this pid finds the old file under it
+            fresh = Metrics()
+            fresh.configure(tmp, app='test')
+            series = dict(fresh._series)
+            text = fresh.render()
+            files = sorted(name for name in os.listdir(tmp) if not name.startswith('.'))
+
+        self.assertEqual(series, {})
+        self.assertEqual(files, [f"{os.getpid()}.json", 'exited.json'])
+        self.assertIn('excel_request_seconds_count{app="test",branch="Kalamassery",kind="sales"} 2', text)
+
+    def test_endpoint_serves_the_text_format(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn(b'# TYPE excel_request_seconds histogram', response.content)
+
+
+class ProfilingTests(SimpleTestCase):
+    def test_profile_records_input_shape_and_stage_timings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'receipts.xlsx')
+            write_workbook(path, [['Date', 'Pt Id', 'Amount'], ['05-11-2025', 'TMV1', 1000], ['06-11-2025', 'TMV2', 250]])
+            store = ProfileStore(os.path.join(tmp, 'profiles'), token='secret', keep=1)
+            first, second = new_namespace(), new_namespace()
+            func, *args = store.job(first, 'receipts Aluva', FrameCache().read, path, ['Date', 'Pt Id', 'Amount'])
+            df = func(*args)
+            record = store.get(first)
+            stats = pstats.Stats(store.path(first))
+            size = os.path.getsize(path)
+            # keep=1: the next profile replaces this one
+            store.call(second, 'receipts Aluva', len, [])
+            kept = store.records()
+            replaced = store.path(first)
+
+        self.assertEqual(len(df), 2)
+        self.assertEqual(record['label'], 'receipts Aluva')
+        self.assertEqual(record['inputs'], [
+            {'name': 'receipts.xlsx', 'rows': 2, 'columns': ['Date', 'Pt Id', 'Amount'], 'bytes': size},
+        ])
+        self.assertEqual([stage['stage'] for stage in record['stages']], ['read'])
+        self.assertIn('read_columns', record['summary'])
+        self.assertGreater(stats.total_calls, 0)
+        self.assertEqual([entry['id'] for entry in kept], [second])
+        self.assertNotIn('summary', kept[0])
+        self.assertIsNone(replaced)
+
+    def test_only_the_token_turns_profiling_on(self):
+        store = ProfileStore('unused', token='secret')
+        self.assertTrue(store.authorised('secret'))
+        self.assertFalse(store.authorised('wrong'))
+        self.assertFalse(store.authorised(None))
+        self.assertFalse(ProfileStore('unused', token='').authorised(''))
+        self.assertEqual(store.job(None, 'unused', len, []), (len, []))
+
+    def test_views_need_the_token(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ProfileStore(tmp, token='secret')
+            profile_id = new_namespace()
+            store.run(profile_id, 'sales Kalamassery', len, [])
+            with mock.patch.object(views, 'profiles', store):
+                hidden = self.client.get('/processor/profiles/')
+                listed = self.client.get('/processor/profiles/', HTTP_X_EXCEL_PROFILE='secret')
+                download = self.client.get(f'/processor/profiles/{profile_id}/download/', {'token': 'secret'})
+                content = b''.join(download.streaming_content)
+                download.close()
+                missing = self.client.get('/processor/profiles/jobs/download/', {'token': 'secret'})
+
+        self.assertEqual(hidden.status_code, 404)
+        self.assertEqual([entry['id'] for entry in listed.json()['profiles']], [profile_id])
+        self.assertEqual(download['Content-Disposition'], f'attachment; filename="{profile_id}.prof"')
+        self.assertTrue(content)
+        self.assertEqual(missing.status_code, 404)
+
+
+class UploadViewTests(SimpleTestCase):
+    async def test_upload_view_is_async(self):
+        form = await self.async_client.get('/processor/upload/')
+        missing = await self.async_client.post('/processor/upload/', {'branch': 'Kalamassery'})
+
+        self.assertTrue(asyncio.iscoroutinefunction(views.upload_file))
+        self.assertEqual(form.status_code, 200)
+        self.assertContains(missing, 'Please upload a sales file.')
+
+
+def receipt_export(rows=3, dimension=True):
+    """A receipt export as bytes; without ``dimension`` its sheet has no <dimension> element, like the clinic's."""
+    buffer = io.BytesIO()
+    write_workbook(buffer, [RECEIPT_HEADER] + [[datetime.datetime(2025, 11, 5), f'TMV{i}', 'A', 100, 'Cash', 'dental'] for i in range(rows)])
+    if dimension:
+        return buffer.getvalue()
+    stripped = io.BytesIO()
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(stripped, 'w') as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                data = re.sub(rb'<dimension [^>]*/>', b'', data)
+            target.writestr(item, data)
+    return stripped.getvalue()
+
+
+class PreflightTests(SimpleTestCase):
+    def test_header_and_limits_are_checked_before_parsing(self):
+        upload = io.BytesIO(receipt_export(rows=3, dimension=False))
+        plan = plan_for_branch('Kalamassery')
+
+        names, rows = preflight(upload, 'export.xlsx', RECEIPT_HEADER, kind='receipt')
+        with self.assertRaisesRegex(PreflightError, r"missing the column\(s\): Pt ID, Treatment Name.* looks like a receipt export"):
+            preflight(upload, 'export.xlsx', plan.required_columns, kind='sales')
+        with self.assertRaisesRegex(PreflightError, 'has 3 rows; uploads are limited to 2'):
+            preflight(upload, 'export.xlsx', RECEIPT_HEADER, max_rows=2)
+        with self.assertRaisesRegex(PreflightError, 'uploads are limited to 0.0 MB'):
+            preflight(upload, 'export.xlsx', RECEIPT_HEADER, max_bytes=10)
+        with self.assertRaisesRegex(PreflightError, 'could not be opened'):
+            preflight(io.BytesIO(b'not a workbook'), 'export.xlsx', RECEIPT_HEADER)
+
+        self.assertEqual((names, rows), (RECEIPT_HEADER, 3))
+        self.assertEqual(preflight(io.BytesIO(receipt_export(rows=5)), 'export.xlsx', [])[1], 5)
+        self.assertEqual(upload.tell(), 0)
+
+    async def test_wrong_export_is_rejected_before_it_is_saved(self):
+        upload = SimpleUploadedFile('receipts.xlsx', receipt_export())
+        with mock.patch.object(views, 'save_upload') as save:
+            response = await self.async_client.post(
+                '/processor/upload/', {'branch': 'Kalamassery', 'excel_file': upload}, headers={'Accept': 'application/json'},
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('looks like a receipt export', response.json()['error'])
+        save.assert_not_called()
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_warm_up_leaves_no_trace(self):
+        before, patients = metrics.collect(), len(patient_departments)
+        warm_up()
+
+        self.assertEqual(metrics.collect(), before)
+        self.assertEqual(len(patient_departments), patients)
+
+    def test_ready_once_warm_and_alive_before(self):
+        with mock.patch.object(warmup, '_ready', threading.Event()):
+            self.assertEqual(self.client.get('/healthz').status_code, 200)
+            self.assertEqual(self.client.get('/readyz').status_code, 503)
+            warm_up()
+            self.assertEqual(self.client.get('/readyz').status_code, 200)
+
+    def test_app_starts_without_the_processing_stack(self):
+        self.assertEqual(profile_app('django')['heavy'], [])
+
+
+class JobQueueTests(SimpleTestCase):
+    def test_inline_jobs_record_result_and_errors(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, 'jobs.sqlite3'), max_workers=0)
+            done = queue.get(queue.submit('sales', dict, [('Kalamassery_Hair', 'Kalamassery_Hair.xlsx')]))
+            failed = queue.get(queue.submit('sales', failing_job, 'missing Notes'))
+            self.assertIsNone(queue.get('unknown'))
+
+        self.assertEqual(done['status'], 'done')
+        self.assertEqual(done['result'], {'Kalamassery_Hair': 'Kalamassery_Hair.xlsx'})
+        self.assertEqual(failed['status'], 'failed')
+        self.assertEqual(failed['error'], 'missing Notes')
+
+    def test_pool_is_replaced_after_a_worker_dies(self):
+        def wait(job_id):
+            for _ in range(300):
+                job = queue.get(job_id)
+                if job['status'] in ('done', 'failed'):
+                    return job
+                time.sleep(0.05)
+            self.fail(f"job {job_id} did not finish")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, 'jobs.sqlite3'), max_workers=1)
+            try:
+                crashed = wait(queue.submit('sales', crashing_job))
+                after = wait(queue.submit('sales', dict, [('Kalamassery_Hair', 'Kalamassery_Hair.xlsx')]))
+            finally:
+                if queue._executor is not None:
+                    queue._executor.shutdown()
+
+        self.assertEqual(crashed['status'], 'failed')
+        self.assertEqual(after['status'], 'done')
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_hit_restores_outputs_and_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = os.path.join(tmp, 'outputs')
+            os.makedirs(outputs)
+            cache = ResultCache(os.path.join(tmp, 'cache'), max_bytes=200)
+            first, second = cache.key('sales', 'a' * 64, 'Kalamassery'), cache.key('sales', 'b' * 64, 'Kalamassery')
+            self.assertNotEqual(first, cache.key('sales', 'a' * 64, 'Choondy'))
+
+            for key, name in ((first, 'first.xlsx'), (second, 'second.xlsx')):
+                with open(os.path.join(outputs, name), 'wb') as f:
+                    f.write(b'x' * 60)
+                cache.put(key, outputs, {'rest_path': name})
+            os.remove(os.path.join(outputs, 'first.xlsx'))
+            self.assertEqual(cache.get(first, outputs), {'rest_path': 'first.xlsx'})
+            self.assertTrue(os.path.exists(os.path.join(outputs, 'first.xlsx')))
+
+            with open(os.path.join(outputs, 'third.xlsx'), 'wb') as f:
+                f.write(b'x' * 60)
+            cache.put(cache.key('sales', 'c' * 64, 'Kalamassery'), outputs, {'rest_path': 'third.xlsx'})
+            # 'second' was used least recently, so it makes room for the new entry
+            self.assertIsNone(cache.get(second, outputs))
+            self.assertIsNotNone(cache.get(first, outputs))
+
+
+class StreamZipTests(SimpleTestCase):
+    def test_outputs_are_streamed_as_stored_entries(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('Kalamassery_Hair.xlsx', 'Kalamassery_Dental_Rest.xlsx'):
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(name.encode() * 5000)
+            queue = JobQueue(os.path.join(tmp, 'jobs.sqlite3'), max_workers=0)
+            job = queue.get(queue.record('sales', {
+                'Kalamassery_Hair': 'Kalamassery_Hair.xlsx',
+                'Kalamassery_Dental_Rest': 'Kalamassery_Dental_Rest.xlsx',
+            }))
+            chunks = list(stream_zip(bundle_files(job['result'], tmp), chunk_size=4096))
+
+        self.assertEqual(job['status'], 'done')
+        self.assertGreater(len(chunks), 2)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), ['Kalamassery_Hair.xlsx', 'Kalamassery_Dental_Rest.xlsx'])
+        self.assertEqual({info.compress_type for info in archive.infolist()}, {zipfile.ZIP_STORED})
+        self.assertEqual(archive.read('Kalamassery_Hair.xlsx'), b'Kalamassery_Hair.xlsx' * 5000)
+
+
+class MemoryStoreTests(SimpleTestCase):
+    def test_entries_expire_and_oldest_are_evicted_past_the_budget(self):
+        store = MemoryStore(max_bytes=10, ttl=60)
+        store.put('a.xlsx', b'12345')
+        store.put('b.xlsx', b'12345')
+        store.put('c.xlsx', b'123')
+        self.assertIsNone(store.get('a.xlsx'))
+        self.assertEqual(store.get('b.xlsx'), b'12345')
+        self.assertEqual(store.size, 8)
+
+        expired = MemoryStore(ttl=0)
+        expired.put('a.xlsx', b'12345')
+        self.assertIsNone(expired.get('a.xlsx'))
+        self.assertEqual(len(expired), 0)
+
+
+class OutputSweepTests(SimpleTestCase):
+    def test_namespaces_are_evicted_by_age_then_size(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ages = {}
+            for age in (3 * 86400, 7200, 3600, 60):
+                namespace = new_namespace()
+                os.makedirs(os.path.join(tmp, namespace))
+                with open(os.path.join(tmp, namespace, 'Kalamassery_Hair.xlsx'), 'wb') as f:
+                    f.write(b'x' * 100)
+                mtime = 1_000_000 - age
+                os.utime(os.path.join(tmp, namespace), (mtime, mtime))
+                ages[age] = namespace
+            open(os.path.join(tmp, 'jobs.sqlite3'), 'wb').close()
+
+            removed = sweep(tmp, max_age=86400, max_bytes=250, now=1_000_000)
+            remaining = sorted(os.listdir(tmp))
+
+        # The expired namespace goes first, then the oldest until 250 bytes fit; the fresh one is spared
+        self.assertEqual(removed, [ages[3 * 86400], ages[7200]])
+        self.assertEqual(remaining, sorted([ages[3600], ages[60], 'jobs.sqlite3']))
@@ -4,5 +4,13 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('upload/', views.upload_file, name='upload_file'),
-    path('download/<str:filename>/', views.download_file, name='download_file'),
+    path('download/<path:filename>/', views.download_file, name='download_file'),
+    path('jobs/<str:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<str:job_id>/result/', views.job_result, name='job_result'),
+    path('jobs/<str:job_id>/download/', views.job_bundle, name='job_bundle'),
+    path('ledger/export/', views.ledger_export, name='ledger_export'),
+    path('ledger/month-to-date/', views.ledger_month_to_date, name='ledger_month_to_date'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
+    path('profiles/<str:profile_id>/download/', views.profile_download, name='profile_download'),
 ]
\ No newline at end of file
@@ -1,480 +1,129 @@
+import asyncio
+import datetime
+import io
 import os
 import shutil
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from django.shortcuts import render
-from django.http import HttpResponse, FileResponse, Http404
+from django.urls import reverse
+from django.http import HttpResponse, HttpResponseBadRequest, FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.db import close_old_connections
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils import timezone
+from django.utils._os import safe_join
 from django.views.decorators.csrf import csrf_exempt
-import pandas as pd
+
+from excel_engine import RECEIPT_COLUMNS, SALES_COLUMNS, JobQueue, ResultCache
+from excel_engine.bundle import bundle_files, stream_zip
+from excel_engine.cache import run_cached, save_upload
+from excel_engine.frames import frame_cache
+from excel_engine.jobs import DONE
+from excel_engine.lazy import lazy_import
+from excel_engine.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from excel_engine.namespaces import Janitor, new_namespace
+from excel_engine.patients import patient_departments
+from excel_engine.preflight import PreflightError, preflight
+from excel_engine.profiling import PROFILE_HEADER, ProfileStore
+from excel_engine.store import STORAGE_MODE, memory_store
+from excel_engine.warmup import ready
+
+from .models import LedgerEntry
+
+# The branch plans and the ledger bring in pandas; they load on the first upload or during warm-up
+rules = lazy_import('excel_engine.rules')
+ledger = lazy_import('processor.ledger')
 
 
 UPLOAD_DIRECTORY = os.path.join(settings.BASE_DIR, 'processor', 'temp')
+# Threads the async upload view hands its blocking work to; uploads beyond this wait without holding the event loop
+UPLOAD_THREADS = int(os.environ.get('EXCEL_UPLOAD_THREADS', '4'))
+
+# Uploads are processed on a local process pool; job state is shared through SQLite
+job_queue = JobQueue(os.path.join(UPLOAD_DIRECTORY, 'jobs.sqlite3'))
+# Finished outputs keyed by upload hash and parameters; repeat uploads skip processing
+result_cache = ResultCache(os.path.join(UPLOAD_DIRECTORY, 'cache'))
+# Parsed uploads keyed by content; re-runs for another branch skip the Excel parse
+frame_cache.configure(os.path.join(UPLOAD_DIRECTORY, 'cache', 'frames'))
+if STORAGE_MODE != 'memory':
+    # Patients' departments from every receipt export so far; Vedimara uploads only need receipts for new patients
+    patient_departments.configure(os.path.join(UPLOAD_DIRECTORY, 'patients', 'departments.npz'))
+# Each upload gets its own namespace directory; the janitor keeps them bounded by age and size.
+# Started by ProcessorConfig.ready, not as a side effect of importing the views.
+janitor = Janitor([UPLOAD_DIRECTORY])
+# Stage histograms of the web and job worker processes, merged by /metrics
+metrics.configure(None if STORAGE_MODE == 'memory' else os.path.join(UPLOAD_DIRECTORY, 'metrics'), app='django')
+# Profiles of uploads sent with the X-Excel-Profile header
+profiles = ProfileStore(os.path.join(UPLOAD_DIRECTORY, 'profiles'))
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_THREADS, thread_name_prefix='upload')
 
 def process_excel_file_logic(sales_file_path: str, receipt_file_path: str, output_directory: str, branch: str):
-    
-    df = pd.read_excel(sales_file_path)
-
-    if branch == "Kalamassery":
-        # Kalamassery
-        if 'Notes' not in df.columns:
-            raise ValueError("The uploaded file for the Kalamassery branch is missing the 'Notes' column.")
-        
-        
-        df['Notes'] = df['Notes'].str.lower().str.strip()
-        dental_df = df[df['Notes'] == 'dental'].copy()
-        skin_df = df[df['Notes'] == 'skin'].copy()
-        hair_df = df[df['Notes'] == 'hair'].copy()
-
-        processed_files = {}
-
-        # Dental
-        if not dental_df.empty:
-            # (Same as original logic)
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = dental_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-            consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-            consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-            consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-            consultation_df['Total Amount'] = consultation_df['Base Value']
-            consultation_df['Doctors  Name'] = 'Clinic'
-
-            ortho_keywords = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'VENEERS', 'Ortho Scaling', 'FACING CERAMIC CROWN', 'FPD', 'TOVALIGN', 'METAL CERAMIC CROWN', 'RPD SUNFLEX']
-            ortho_pattern = '|'.join(ortho_keywords)
-            ortho_bonding_df = df_modified[df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)].copy()
-            ortho_bonding_df['Base Value'] = pd.to_numeric(ortho_bonding_df['Total inv'], errors='coerce') / 1.05
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Base Value'] = ortho_bonding_df['Base Value'].round(2)
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Sgst'].round(2)
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Cgst'].round(2)
-            ortho_bonding_df['Total Amount'] = ortho_bonding_df['Base Value']
-
-            consultation_mask = df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)
-            ortho_mask = df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)
-            matched_rows_mask = consultation_mask | ortho_mask
-            rest_df = df_modified[~matched_rows_mask].copy()
-            rest_df = rest_df[~rest_df['Date'].astype(str).str.contains('Count:', case=False, na=False)]
-            rest_df['Base Value'] = ''
-            rest_df['Sgst'] = ''
-            rest_df['Cgst'] = ''
-
-            consultation_output_path = os.path.join(output_directory, "Kalamassery_Dental_Consultation.xlsx")
-            ortho_output_path = os.path.join(output_directory, "Kalamassery_Dental_Ortho_Bonding.xlsx")
-            rest_output_path = os.path.join(output_directory, "Kalamassery_Dental_Rest.xlsx")
-            consultation_df.to_excel(consultation_output_path, index=False)
-            ortho_bonding_df.to_excel(ortho_output_path, index=False)
-            rest_df.to_excel(rest_output_path, index=False)
-            processed_files.update({
-                "Kalamassery_Dental_Consultation": consultation_output_path,
-                "Kalamassery_Dental_Ortho_Bonding": ortho_output_path,
-                "Kalamassery_Dental_Rest": rest_output_path
-            })
-
-        # Skin
-        if not skin_df.empty:
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = skin_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-            consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-            consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-            consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-            consultation_df['Total Amount'] = consultation_df['Base Value']
-            consultation_df['Doctors  Name'] = 'Clinic'
-
-            other_treatments_df = df_modified[~df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            other_treatments_df['Base Value'] = pd.to_numeric(other_treatments_df['Total inv'], errors='coerce') / 1.05
-            other_treatments_df['Sgst'] = other_treatments_df['Base Value'] * 0.025
-            other_treatments_df['Cgst'] = other_treatments_df['Base Value'] * 0.025
-            other_treatments_df['Base Value'] = other_treatments_df['Base Value'].round(2)
-            other_treatments_df['Sgst'] = other_treatments_df['Sgst'].round(2)
-            other_treatments_df['Cgst'] = other_treatments_df['Cgst'].round(2)
-            other_treatments_df['Total Amount'] = other_treatments_df['Base Value']
-            
-            consultation_output_path = os.path.join(output_directory, "Kalamassery_Skin_Consultation.xlsx")
-            other_output_path = os.path.join(output_directory, "Kalamassery_Skin_Other.xlsx")
-            consultation_df.to_excel(consultation_output_path, index=False)
-            other_treatments_df.to_excel(other_output_path, index=False)
-            processed_files.update({
-                "Kalamassery_Skin_Consultation": consultation_output_path,
-                "Kalamassery_Skin_Other": other_output_path
-            })
-
-        # Hair
-        if not hair_df.empty:
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = hair_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            df_modified['Base Value'] = pd.to_numeric(df_modified['Total inv'], errors='coerce') / 1.18
-            df_modified['Sgst'] = df_modified['Base Value'] * 0.09
-            df_modified['Cgst'] = df_modified['Base Value'] * 0.09
-            df_modified['Base Value'] = df_modified['Base Value'].round(2)
-            df_modified['Sgst'] = df_modified['Sgst'].round(2)
-            df_modified['Cgst'] = df_modified['Cgst'].round(2)
-            df_modified['Total Amount'] = df_modified['Base Value']
-            
-            
-            df_modified.loc[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False), 'Doctors  Name'] = 'Clinic'
-
-            hair_output_path = os.path.join(output_directory, "Kalamassery_Hair.xlsx")
-            df_modified.to_excel(hair_output_path, index=False)
-            processed_files["Kalamassery_Hair"] = hair_output_path
-
-        return processed_files
-
-    elif branch == "Vedimara":
-        receipt_df = pd.read_excel(receipt_file_path)
-        receipt_df.rename(columns={'Pt Id': 'Pt ID'}, inplace=True)
-        merged_df = pd.merge(df, receipt_df[['Pt ID', 'Notes']], on='Pt ID', how='left')
-        
-        merged_df['Notes_y'] = merged_df['Notes_y'].str.lower().str.strip()
-        dental_df = merged_df[merged_df['Notes_y'] == 'dental'].copy()
-        economy_df = merged_df[merged_df['Notes_y'] == 'economy'].copy()
-        skin_df = merged_df[merged_df['Notes_y'] == 'skin'].copy()
-
-        processed_files = {}
-
-        # Dental
-        if not dental_df.empty:
-            # (Same as original logic)
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = dental_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-            consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-            consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-            consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-            consultation_df['Total Amount'] = consultation_df['Base Value']
-            consultation_df['Doctors  Name'] = 'Clinic'
-
-            ortho_keywords = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'VENEERS', 'Ortho Scaling', 'FACING CERAMIC CROWN', 'FPD', 'TOVALIGN', 'METAL CERAMIC CROWN', 'RPD SUNFLEX']
-            ortho_pattern = '|'.join(ortho_keywords)
-            ortho_bonding_df = df_modified[df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)].copy()
-            ortho_bonding_df['Base Value'] = pd.to_numeric(ortho_bonding_df['Total inv'], errors='coerce') / 1.05
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Base Value'] = ortho_bonding_df['Base Value'].round(2)
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Sgst'].round(2)
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Cgst'].round(2)
-            ortho_bonding_df['Total Amount'] = ortho_bonding_df['Base Value']
-
-            consultation_mask = df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)
-            ortho_mask = df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)
-            matched_rows_mask = consultation_mask | ortho_mask
-            rest_df = df_modified[~matched_rows_mask].copy()
-            rest_df = rest_df[~rest_df['Date'].astype(str).str.contains('Count:', case=False, na=False)]
-            rest_df['Base Value'] = ''
-            rest_df['Sgst'] = ''
-            rest_df['Cgst'] = ''
-
-            consultation_output_path = os.path.join(output_directory, "Vedimara_Dental_Consultation.xlsx")
-            ortho_output_path = os.path.join(output_directory, "Vedimara_Dental_Ortho_Bonding.xlsx")
-            rest_output_path = os.path.join(output_directory, "Vedimara_Dental_Rest.xlsx")
-            consultation_df.to_excel(consultation_output_path, index=False)
-            ortho_bonding_df.to_excel(ortho_output_path, index=False)
-            rest_df.to_excel(rest_output_path, index=False)
-            processed_files.update({
-                "Vedimara_Dental_Consultation": consultation_output_path,
-                "Vedimara_Dental_Ortho_Bonding": ortho_output_path,
-                "Vedimara_Dental_Rest": rest_output_path
-            })
-
-        # Economy
-        if not economy_df.empty:
-            # (Same as original logic)
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = economy_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-            consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-            consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-            consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-            consultation_df['Total Amount'] = consultation_df['Base Value']
-            consultation_df['Doctors  Name'] = 'Clinic'
-
-            ortho_keywords = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'METAL CERAMIC CROWN', 'RPD SUNFLEX']
-            ortho_pattern = '|'.join(ortho_keywords)
-            ortho_bonding_df = df_modified[df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)].copy()
-            ortho_bonding_df['Base Value'] = pd.to_numeric(ortho_bonding_df['Total inv'], errors='coerce') / 1.05
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Base Value'] = ortho_bonding_df['Base Value'].round(2)
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Sgst'].round(2)
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Cgst'].round(2)
-            ortho_bonding_df['Total Amount'] = ortho_bonding_df['Base Value']
-
-            consultation_mask = df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)
-            ortho_mask = df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)
-            matched_rows_mask = consultation_mask | ortho_mask
-            rest_df = df_modified[~matched_rows_mask].copy()
-            rest_df = rest_df[~rest_df['Date'].astype(str).str.contains('Count:', case=False, na=False)]
-            rest_df['Base Value'] = ''
-            rest_df['Sgst'] = ''
-            rest_df['Cgst'] = ''
-
-            consultation_output_path = os.path.join(output_directory, "Vedimara_Economy_Consultation.xlsx")
-            ortho_output_path = os.path.join(output_directory, "Vedimara_Economy_Ortho_Bonding.xlsx")
-            rest_output_path = os.path.join(output_directory, "Vedimara_Economy_Rest.xlsx")
-            consultation_df.to_excel(consultation_output_path, index=False)
-            ortho_bonding_df.to_excel(ortho_output_path, index=False)
-            rest_df.to_excel(rest_output_path, index=False)
-            processed_files.update({
-                "Vedimara_Economy_Consultation": consultation_output_path,
-                "Vedimara_Economy_Ortho_Bonding": ortho_output_path,
-                "Vedimara_Economy_Rest": rest_output_path
-            })
-
-        # Skin
-        if not skin_df.empty:
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = skin_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-            consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-            consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-            consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-            consultation_df['Total Amount'] = consultation_df['Base Value']
-            consultation_df['Doctors  Name'] = 'Clinic'
-
-            other_treatments_df = df_modified[~df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            other_treatments_df['Base Value'] = pd.to_numeric(other_treatments_df['Total inv'], errors='coerce') / 1.05
-            other_treatments_df['Sgst'] = other_treatments_df['Base Value'] * 0.025
-            other_treatments_df['Cgst'] = other_treatments_df['Base Value'] * 0.025
-            other_treatments_df['Base Value'] = other_treatments_df['Base Value'].round(2)
-            other_treatments_df['Sgst'] = other_treatments_df['Sgst'].round(2)
-            other_treatments_df['Cgst'] = other_treatments_df['Cgst'].round(2)
-            other_treatments_df['Total Amount'] = other_treatments_df['Base Value']
-            
-            consultation_output_path = os.path.join(output_directory, "Vedimara_Skin_Consultation.xlsx")
-            other_output_path = os.path.join(output_directory, "Vedimara_Skin_Other.xlsx")
-            consultation_df.to_excel(consultation_output_path, index=False)
-            other_treatments_df.to_excel(other_output_path, index=False)
-            processed_files.update({
-                "Vedimara_Skin_Consultation": consultation_output_path,
-                "Vedimara_Skin_Other": other_output_path
-            })
-
-        return processed_files
-
-    elif branch == "Choondy":
-        # Choondy 
-        
-        skin_df = df[df['Doctor'] == 'Redhina Raj'].copy()
-        dental_df = df[df['Doctor'] != 'Redhina Raj'].copy()
-
-        processed_files = {}
-
-        # Dental
-        if not dental_df.empty:
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = dental_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-            consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-            consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-            consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-            consultation_df['Total Amount'] = consultation_df['Base Value']
-            consultation_df['Doctors  Name'] = 'Clinic'
-
-            ortho_keywords = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'VENEERS', 'Ortho Scaling', 'FACING CERAMIC CROWN', 'FPD', 'TOVALIGN', 'METAL CERAMIC CROWN', 'RPD SUNFLEX']
-            ortho_pattern = '|'.join(ortho_keywords)
-            ortho_bonding_df = df_modified[df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)].copy()
-            ortho_bonding_df['Base Value'] = pd.to_numeric(ortho_bonding_df['Total inv'], errors='coerce') / 1.05
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Base Value'] * 0.025
-            ortho_bonding_df['Base Value'] = ortho_bonding_df['Base Value'].round(2)
-            ortho_bonding_df['Sgst'] = ortho_bonding_df['Sgst'].round(2)
-            ortho_bonding_df['Cgst'] = ortho_bonding_df['Cgst'].round(2)
-            ortho_bonding_df['Total Amount'] = ortho_bonding_df['Base Value']
-
-            consultation_mask = df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)
-            ortho_mask = df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)
-            matched_rows_mask = consultation_mask | ortho_mask
-            rest_df = df_modified[~matched_rows_mask].copy()
-            rest_df = rest_df[~rest_df['Date'].astype(str).str.contains('Count:', case=False, na=False)]
-            rest_df['Base Value'] = ''
-            rest_df['Sgst'] = ''
-            rest_df['Cgst'] = ''
-
-            consultation_output_path = os.path.join(output_directory, "Choondy_Dental_Consultation.xlsx")
-            ortho_output_path = os.path.join(output_directory, "Choondy_Dental_Ortho_Bonding.xlsx")
-            rest_output_path = os.path.join(output_directory, "Choondy_Dental_Rest.xlsx")
-            consultation_df.to_excel(consultation_output_path, index=False)
-            ortho_bonding_df.to_excel(ortho_output_path, index=False)
-            rest_df.to_excel(rest_output_path, index=False)
-            processed_files.update({
-                "Choondy_Dental_Consultation": consultation_output_path,
-                "Choondy_Dental_Ortho_Bonding": ortho_output_path,
-                "Choondy_Dental_Rest": rest_output_path
-            })
-
-        # Skin
-        if not skin_df.empty:
-            desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-            df_filtered = skin_df[desired_columns]
-            net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-            df_modified = df_filtered.copy()
-            df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-            df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-            new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-            df_modified.columns = new_column_names
-
-            consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-            consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-            consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-            consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-            consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-            consultation_df['Total Amount'] = consultation_df['Base Value']
-            consultation_df['Doctors  Name'] = 'Clinic'
-
-            other_treatments_df = df_modified[~df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-            other_treatments_df['Base Value'] = pd.to_numeric(other_treatments_df['Total inv'], errors='coerce') / 1.05
-            other_treatments_df['Sgst'] = other_treatments_df['Base Value'] * 0.025
-            other_treatments_df['Cgst'] = other_treatments_df['Base Value'] * 0.025
-            other_treatments_df['Base Value'] = other_treatments_df['Base Value'].round(2)
-            other_treatments_df['Sgst'] = other_treatments_df['Sgst'].round(2)
-            other_treatments_df['Cgst'] = other_treatments_df['Cgst'].round(2)
-            other_treatments_df['Total Amount'] = other_treatments_df['Base Value']
-            
-            consultation_output_path = os.path.join(output_directory, "Choondy_Skin_Consultation.xlsx")
-            other_output_path = os.path.join(output_directory, "Choondy_Skin_Other.xlsx")
-            consultation_df.to_excel(consultation_output_path, index=False)
-            other_treatments_df.to_excel(other_output_path, index=False)
-            processed_files.update({
-                "Choondy_Skin_Consultation": consultation_output_path,
-                "Choondy_Skin_Other": other_output_path
-            })
-
-        return processed_files
-
-    else: # Original logic 
-        
-        desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-        df_filtered = df[desired_columns]
-
-       
-        net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-        df_modified = df_filtered.copy()
-        df_modified.insert(net_amount_idx + 1, 'Blank Col 1', [''] * len(df_modified))
-        df_modified.insert(net_amount_idx + 2, 'Blank Col 2', [''] * len(df_modified))
-
-        
-        new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-        df_modified.columns = new_column_names
-
-        
-        consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-        consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-        consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-        consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-        consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-        consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-        consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-        consultation_df['Total Amount'] = consultation_df['Base Value']
-        consultation_df['Doctors  Name'] = 'Clinic'
-
-        ortho_keywords = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'VENEERS', 'Ortho Scaling', 'FACING CERAMIC CROWN', 'FPD', 'TOVALIGN', 'METAL CERAMIC CROWN', 'RPD SUNFLEX']
-        ortho_pattern = '|'.join(ortho_keywords)
-        ortho_bonding_df = df_modified[df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)].copy()
-        ortho_bonding_df['Base Value'] = pd.to_numeric(ortho_bonding_df['Total inv'], errors='coerce') / 1.05
-        ortho_bonding_df['Sgst'] = ortho_bonding_df['Base Value'] * 0.025
-        ortho_bonding_df['Cgst'] = ortho_bonding_df['Base Value'] * 0.025
-        ortho_bonding_df['Base Value'] = ortho_bonding_df['Base Value'].round(2)
-        ortho_bonding_df['Sgst'] = ortho_bonding_df['Sgst'].round(2)
-        ortho_bonding_df['Cgst'] = ortho_bonding_df['Cgst'].round(2)
-        ortho_bonding_df['Total Amount'] = ortho_bonding_df['Base Value']
-
-        consultation_mask = df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)
-        ortho_mask = df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)
-        matched_rows_mask = consultation_mask | ortho_mask
-        rest_df = df_modified[~matched_rows_mask].copy()
-        rest_df = rest_df[~rest_df['Date'].astype(str).str.contains('Count:', case=False, na=False)]
-        rest_df['Base Value'] = ''
-        rest_df['Sgst'] = ''
-        rest_df['Cgst'] = ''
-
-        consultation_output_path = os.path.join(output_directory, "Treatments_Done_Consultation.xlsx")
-        ortho_output_path = os.path.join(output_directory, "Treatments_Done_Ortho_Bonding.xlsx")
-        rest_output_path = os.path.join(output_directory, "Treatments_Done_Rest.xlsx")
-        consultation_df.to_excel(consultation_output_path, index=False)
-        ortho_bonding_df.to_excel(ortho_output_path, index=False)
-        rest_df.to_excel(rest_output_path, index=False)
-
-        return {
-            "consultation_path": consultation_output_path,
-            "ortho_path": ortho_output_path,
-            "rest_path": rest_output_path
-        }
+    # Branch rules live in excel_engine.rules and are compiled once at import.
+    # The inputs may also be the uploaded file objects themselves (diskless mode)
+    plan = rules.plan_for_branch(branch)
+    ledger_branch = branch or plan.branch
+    with metrics.request(kind='sales', branch=ledger_branch):
+        df = frame_cache.read(sales_file_path, SALES_COLUMNS)
+
+        receipt_df = None
+        if plan.rules.receipt_join and receipt_file_path:
+            # All the receipt columns, not just the join's, so the receipts reach the ledger too
+            receipt_df = frame_cache.read(receipt_file_path, RECEIPT_COLUMNS)
+
+        frames = plan.split(df, receipt_df)
+        processed_files = plan.write(frames, output_directory)
+
+        entries = ledger.sales_entries(plan, frames, ledger_branch)
+        if receipt_df is not None:
+            entries += ledger.receipt_entries(receipt_df, ledger_branch)
+        ledger.ingest(entries)
+    return processed_files
+
+def relative_outputs(processed_files):
+    return {key: os.path.relpath(path, UPLOAD_DIRECTORY) for key, path in processed_files.items()}
+
+def process_uploaded_files(sales_upload_path, receipt_upload_path, branch, output_directory):
+    """Job body for the upload view; returns {link label: output path relative to UPLOAD_DIRECTORY}."""
+    try:
+        processed_files = process_excel_file_logic(sales_upload_path, receipt_upload_path, output_directory, branch)
+    finally:
+        os.remove(sales_upload_path)
+        if receipt_upload_path:
+            os.remove(receipt_upload_path)
+    return relative_outputs(processed_files)
+
+def finished_response(request, result):
+    """Answer an upload whose files are already there (cache hit or diskless mode) without a job round trip."""
+    job_id = job_queue.record('sales', result)
+    bundle_url = reverse('job_bundle', args=[job_id])
+    if request.headers.get('Accept') == 'application/json':
+        return JsonResponse({'job_id': job_id, 'status': DONE, 'download_links': result, 'bundle_url': bundle_url})
+    return render(request, 'processor/upload.html', {'download_links': result, 'bundle_url': bundle_url, 'message': 'File processed successfully!'})
+
+def rejected_response(request, error):
+    """Answer an upload turned away by the preflight, before any of it was saved or parsed."""
+    if request.headers.get('Accept') == 'application/json':
+        return JsonResponse({'status': 'rejected', 'error': error}, status=400)
+    return render(request, 'processor/upload.html', {'error': error}, status=400)
 
 def home(request):
     return render(request, 'processor/home.html')
 
 @csrf_exempt
-def upload_file(request):
+async def upload_file(request):
+    """Upload form; under ASGI the body arrives without blocking the event loop, the rest runs on ``upload_executor``."""
+    return await asyncio.get_running_loop().run_in_executor(upload_executor, handle_upload, request)
+
+def handle_upload(request):
+    """The blocking part of an upload: multipart parsing, saving and hashing, and any inline processing."""
+    try:
+        return upload_response(request)
+    finally:
+        # Executor threads outlive the request, so their database connections are closed here
+        close_old_connections()
+
+def upload_response(request):
     if request.method == 'POST':
         if 'excel_file' in request.FILES:
             sales_file = request.FILES['excel_file']
@@ -484,59 +133,200 @@ def upload_file(request):
             if not sales_file.name.endswith(('.xlsx', '.xls')):
                 return render(request, 'processor/upload.html', {'error': 'Invalid file type for sales file. Only .xlsx and .xls are allowed.'})
 
-            if branch == 'Vedimara' and not receipt_file:
+            plan = rules.plan_for_branch(branch)
+            if plan.rules.receipt_join and not receipt_file and not len(patient_departments):
                 return render(request, 'processor/upload.html', {'error': 'Receipt file is required for Vedimara branch.'})
 
             if receipt_file and not receipt_file.name.endswith(('.xlsx', '.xls')):
                 return render(request, 'processor/upload.html', {'error': 'Invalid file type for receipt file. Only .xlsx and .xls are allowed.'})
 
+            try:
+                preflight(sales_file, sales_file.name, plan.required_columns, kind='sales')
+                if receipt_file and plan.rules.receipt_join:
+                    preflight(receipt_file, receipt_file.name, plan.receipt_columns, kind='receipt')
+            except PreflightError as e:
+                return rejected_response(request, str(e))
+
+            # Fixed output names would collide between requests; each one writes to its own namespace
+            namespace = new_namespace()
+            output_directory = os.path.join(UPLOAD_DIRECTORY, namespace)
+            profile_id = namespace if profiles.authorised(request.headers.get(PROFILE_HEADER)) else None
+            profile_label = f"sales {plan.branch} {os.path.basename(sales_file.name)}"
+
+            if STORAGE_MODE == 'memory':
+                # Parsed from the upload buffers and rendered into the memory store; nothing touches the disk
+                try:
+                    processed_files = profiles.call(
+                        profile_id, profile_label,
+                        process_excel_file_logic, sales_file, receipt_file, output_directory, branch,
+                    )
+                except Exception as e:
+                    return render(request, 'processor/upload.html', {'error': f"Error processing Excel file: {e}"})
+                return finished_response(request, relative_outputs(processed_files))
+
             sales_file_extension = os.path.splitext(sales_file.name)[1]
             unique_sales_filename = f"{uuid.uuid4()}{sales_file_extension}"
-            sales_upload_path = os.path.join(UPLOAD_DIRECTORY, unique_sales_filename)
+            sales_upload_path = os.path.join(output_directory, unique_sales_filename)
 
-            os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+            os.makedirs(output_directory)
 
-            with open(sales_upload_path, "wb+") as destination:
-                for chunk in sales_file.chunks():
-                    destination.write(chunk)
+            sales_hash = save_upload(sales_file.chunks(), sales_upload_path)
 
             receipt_upload_path = ""
+            receipt_hash = None
             if receipt_file:
                 receipt_file_extension = os.path.splitext(receipt_file.name)[1]
                 unique_receipt_filename = f"{uuid.uuid4()}{receipt_file_extension}"
-                receipt_upload_path = os.path.join(UPLOAD_DIRECTORY, unique_receipt_filename)
-                with open(receipt_upload_path, "wb+") as destination:
-                    for chunk in receipt_file.chunks():
-                        destination.write(chunk)
-
-            try:
-                processed_files = process_excel_file_logic(sales_upload_path, receipt_upload_path, UPLOAD_DIRECTORY, branch)
-                
+                receipt_upload_path = os.path.join(output_directory, unique_receipt_filename)
+                receipt_hash = save_upload(receipt_file.chunks(), receipt_upload_path)
+
+            # Departments of patients missing from the receipt come from the patient index as it is now
+            receipt_key = (receipt_hash, patient_departments.version()) if plan.rules.receipt_join else None
+            cache_key = result_cache.key('sales', sales_hash, receipt_key, plan.branch, plan.rules)
+            # A profiled upload is processed again even when its outputs are cached
+            cached = None if profile_id else result_cache.get(cache_key, output_directory)
+            if cached is not None:
                 os.remove(sales_upload_path)
                 if receipt_upload_path:
                     os.remove(receipt_upload_path)
-
-                download_links = {}
-                for key, path in processed_files.items():
-                    filename = os.path.basename(path)
-                    download_links[key] = filename
-
-                return render(request, 'processor/upload.html', {'download_links': download_links, 'message': 'File processed successfully!'})
-            except Exception as e:
-                if os.path.exists(sales_upload_path):
-                    os.remove(sales_upload_path)
-                if receipt_upload_path and os.path.exists(receipt_upload_path):
-                    os.remove(receipt_upload_path)
-                return render(request, 'processor/upload.html', {'error': f"Error processing Excel file: {e}"})
+                return finished_response(request, {key: f"{namespace}/{name}" for key, name in cached.items()})
+
+            job_id = job_queue.submit('sales', *profiles.job(
+                profile_id, profile_label, run_cached, result_cache, cache_key, UPLOAD_DIRECTORY,
+                process_uploaded_files, sales_upload_path, receipt_upload_path, branch, output_directory,
+            ))
+            if request.headers.get('Accept') == 'application/json':
+                return JsonResponse({'job_id': job_id, 'status_url': reverse('job_status', args=[job_id])}, status=202)
+            return render(request, 'processor/upload.html', {'job_id': job_id})
         else:
             return render(request, 'processor/upload.html', {'error': 'Please upload a sales file.'})
     return render(request, 'processor/upload.html')
 
 
 def download_file(request, filename):
-    file_path = os.path.join(UPLOAD_DIRECTORY, filename)
-    if os.path.exists(file_path):
+    try:
+        file_path = safe_join(UPLOAD_DIRECTORY, filename)
+    except SuspiciousFileOperation:
+        raise Http404("File not found")
+    download_name = os.path.basename(file_path)
+    data = memory_store.get(file_path)
+    if data is not None:
+        response = FileResponse(io.BytesIO(data))
+        response['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        return response
+    if os.path.isfile(file_path):
         response = FileResponse(open(file_path, 'rb'))
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Content-Disposition'] = f'attachment; filename="{download_name}"'
         return response
-    raise Http404("File not found")
\ No newline at end of file
+    raise Http404("File not found")
+
+
+def job_status(request, job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise Http404("Job not found")
+    return JsonResponse({'status': job['status'], 'error': job['error'], 'result_url': reverse('job_result', args=[job_id])})
+
+
+def job_result(request, job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise Http404("Job not found")
+    if job['status'] != DONE:
+        return JsonResponse({'status': job['status'], 'error': job['error']}, status=409)
+    return JsonResponse({'status': job['status'], 'download_links': job['result'], 'bundle_url': reverse('job_bundle', args=[job_id])})
+
+
+def job_bundle(request, job_id):
+    """Stream every output of a finished job as one ZIP, built while it is sent."""
+    job = job_queue.get(job_id)
+    if job is None or job['status'] != DONE:
+        raise Http404("Job not found")
+    files = bundle_files(job['result'], UPLOAD_DIRECTORY)
+    if files is None:
+        raise Http404("File not found")
+    response = StreamingHttpResponse(stream_zip(files), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{job["kind"]}_{job_id}.zip"'
+    return response
+
+
+def ledger_export(request):
+    """Ledger rows dated ``start`` to ``end`` (inclusive, YYYY-MM-DD) as one workbook."""
+    try:
+        start = datetime.date.fromisoformat(request.GET['start'])
+        end = datetime.date.fromisoformat(request.GET['end'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('start and end must be dates in YYYY-MM-DD format.')
+    return ledger_workbook(request, start, end)
+
+
+def ledger_month_to_date(request):
+    today = timezone.localdate()
+    return ledger_workbook(request, today.replace(day=1), today)
+
+
+def ledger_workbook(request, start, end):
+    kind = request.GET.get('kind', LedgerEntry.SALES)
+    if kind not in ledger.EXPORT_COLUMNS:
+        return HttpResponseBadRequest(f"kind must be one of: {', '.join(ledger.EXPORT_COLUMNS)}.")
+    branch = request.GET.get('branch') or None
+    path = ledger.export(kind, start, end, UPLOAD_DIRECTORY, branch)
+    # Already open, so the file can go now; the response streams it from the open handle
+    workbook = open(path, 'rb')
+    os.remove(path)
+    download_name = f"ledger_{kind}_{branch or 'all'}_{start}_{end}.xlsx"
+    response = FileResponse(workbook)
+    response['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
+
+
+def healthz(request):
+    """Liveness: the process answers; nothing is loaded or checked."""
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    """Readiness: the processing stack is warm, so an upload will not wait for it."""
+    if not ready():
+        return JsonResponse({'status': 'warming up'}, status=503)
+    return JsonResponse({'status': 'ready'})
+
+
+def prometheus_metrics(request):
+    """Stage latency and upload size histograms, in the Prometheus text format."""
+    return HttpResponse(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+def profiles_authorised(request):
+    return profiles.authorised(request.headers.get(PROFILE_HEADER) or request.GET.get('token'))
+
+
+def profile_list(request):
+    """Saved upload profiles, newest first: input shapes, stage timings and links to the full profiles."""
+    if not profiles_authorised(request):
+        raise Http404("Profile not found")
+    return JsonResponse({'profiles': [
+        {
+            **record,
+            'url': reverse('profile_detail', args=[record['id']]),
+            'download_url': reverse('profile_download', args=[record['id']]),
+        }
+        for record in profiles.records()
+    ]})
+
+
+def profile_detail(request, profile_id):
+    record = profiles.get(profile_id) if profiles_authorised(request) else None
+    if record is None:
+        raise Http404("Profile not found")
+    return JsonResponse(record)
+
+
+def profile_download(request, profile_id):
+    """The raw ``cProfile`` output, for ``pstats`` or snakeviz."""
+    path = profiles.path(profile_id) if profiles_authorised(request) else None
+    if path is None:
+        raise Http404("Profile not found")
+    response = FileResponse(open(path, 'rb'))
+    response['Content-Disposition'] = f'attachment; filename="{profile_id}.prof"'
+    return response
@@ -0,0 +1,47 @@
+"""Shared Excel processing engine used by the Flask and Django apps.
+
+Names are looked up in their submodules on first use, so importing the
+package does not import pandas.
+"""
+import importlib
+
+# name: submodule it lives in
+_EXPORTS = {
+    'BRANCH_RULES': 'rules',
+    'BranchRules': 'rules',
+    'Category': 'rules',
+    'Department': 'rules',
+    'JobQueue': 'jobs',
+    'KeywordClassifier': 'classify',
+    'MemoryStore': 'store',
+    'OUTPUT_MODE': 'writer',
+    'RECEIPT_COLUMNS': 'reader',
+    'ResultCache': 'cache',
+    'SALES_COLUMNS': 'reader',
+    'STORAGE_MODE': 'store',
+    'TemplateRegistry': 'template_registry',
+    'UNMATCHED': 'classify',
+    'WRITER_ENGINE': 'writer',
+    'compile_rules': 'rules',
+    'gst_kernel': 'gst',
+    'memory_store': 'store',
+    'plan_for_branch': 'rules',
+    'read_columns': 'reader',
+    'template_registry': 'template_registry',
+    'write_dataframe': 'writer',
+    'write_sheets': 'writer',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
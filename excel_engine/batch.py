@@ -0,0 +1,66 @@
+"""Multi-file uploads processed in parallel.
+
+Each file of a batch is read, transformed and written on its own worker of
+a process pool, so a month of daily exports takes about as long as the
+slowest few files rather than all of them in turn. Workers hand their
+output frames back, and ``merge_frames`` concatenates them into the
+combined output of every bucket.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Worker processes per batch; 0 uses one per CPU core
+BATCH_WORKERS = int(os.environ.get('EXCEL_BATCH_WORKERS', '0')) or os.cpu_count() or 1
+
+
+def map_files(func, *iterables, max_workers=None, initializer=None, initargs=(), mp_context=None):
+    """Return ``[func(*args) for args in zip(*iterables)]``, computed on a process pool.
+
+    ``func`` must be a module-level function. A single file, or
+    ``max_workers=1``, runs in the calling process. Workers only inherit
+    the caller's module state when the pool forks them, so state they need
+    (registered templates, configured caches) is set up by
+    ``initializer(*initargs)``, which runs once in every worker; the caller
+    sets up its own. ``mp_context`` picks the start method.
+    """
+    calls = list(zip(*iterables))
+    workers = min(max_workers or BATCH_WORKERS, len(calls))
+    if workers <= 1:
+        return [func(*args) for args in calls]
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=mp_context, initializer=initializer, initargs=initargs,
+    ) as pool:
+        return list(pool.map(func, *zip(*calls)))
+
+
+def merge_frames(splits):
+    """Concatenate dicts of {bucket: frame}, bucket by bucket, in file order; buckets come out sorted."""
+    merged = {}
+    for frames in splits:
+        for key, frame in frames.items():
+            merged.setdefault(key, []).append(frame)
+    combined = {}
+    for key, parts in sorted(merged.items()):
+        # Empty buckets only carry the columns; concatenating them would muddle the dtypes
+        rows = [frame for frame in parts if len(frame)] or parts[:1]
+        combined[key] = pd.concat(rows, ignore_index=True)
+    return combined
+
+
+def unique_filenames(filenames, taken=()):
+    """Suffix repeated names (``a.xlsx``, ``a_2.xlsx``) so every file of a batch keeps its own outputs."""
+    seen = set(taken)
+    unique = []
+    for filename in filenames:
+        stem, extension = os.path.splitext(filename)
+        candidate, n = filename, 1
+        while candidate in seen:
+            n += 1
+            candidate = f"{stem}_{n}{extension}"
+        seen.add(candidate)
+        unique.append(candidate)
+    return unique
@@ -0,0 +1,80 @@
+"""Streamed ZIP bundles of a request's outputs.
+
+The archive is produced chunk by chunk while it is being sent, so nothing
+is staged on disk and memory stays at one chunk whatever the bundle size.
+Entries are stored rather than deflated: xlsx files are already zip
+archives and would not shrink.
+"""
+import io
+import os
+import time
+import zipfile
+
+from .store import memory_store
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Sink(io.RawIOBase):
+    # Unseekable, so zipfile writes sizes in data descriptors instead of seeking back
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _pending(sink):
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _open_source(arcname, source):
+    if isinstance(source, bytes):
+        info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+        info.file_size = len(source)
+        return info, io.BytesIO(source)
+    return zipfile.ZipInfo.from_file(source, arcname), open(source, 'rb')
+
+
+def stream_zip(files, chunk_size=CHUNK_SIZE):
+    """Yield the bytes of a ZIP holding ``files``, a list of (archive name, path or bytes)."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for arcname, source in files:
+            info, source = _open_source(arcname, source)
+            with source, archive.open(info, 'w') as entry:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    entry.write(chunk)
+                    yield from _pending(sink)
+            yield from _pending(sink)
+    yield from _pending(sink)
+
+
+def bundle_files(result, directory):
+    """(archive name, source) pairs for the distinct files of a job result, or ``None`` if one is gone.
+
+    Result values are paths relative to ``directory`` (``None`` for the root
+    of the in-memory store). Sources are bytes from the in-memory store
+    when it holds the file, otherwise paths on disk.
+    """
+    files = []
+    for name in dict.fromkeys(result.values()):
+        path = name if directory is None else os.path.join(directory, name)
+        source = memory_store.get(path)
+        if source is None and directory is not None and os.path.isfile(path):
+            source = path
+        if source is None:
+            return None
+        files.append((os.path.basename(name), source))
+    return files
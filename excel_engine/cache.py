@@ -0,0 +1,133 @@
+"""Content-addressed cache of finished outputs.
+
+An upload is hashed while it is streamed to disk. The hash, the request
+parameters and the engine/rules/template fingerprint together form the
+cache key, so a repeated request is answered by linking the stored outputs
+back into place without parsing anything. Entries are evicted least
+recently used first once the cache grows past its byte budget.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from .metrics import metrics
+
+# Bump when a code change alters output for the same input and parameters
+ENGINE_VERSION = '3'
+RESULT_CACHE_BYTES = int(os.environ.get('EXCEL_RESULT_CACHE_BYTES', str(256 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+MANIFEST = 'manifest.json'
+
+
+def iter_stream(stream, chunk_size=CHUNK_SIZE):
+    return iter(lambda: stream.read(chunk_size), b'')
+
+
+def save_upload(chunks, path):
+    """Write ``chunks`` to ``path`` and return their SHA-256 hex digest."""
+    digest = hashlib.sha256()
+    with metrics.stage('upload_save'), open(path, 'wb') as destination:
+        for chunk in chunks:
+            digest.update(chunk)
+            destination.write(chunk)
+    return digest.hexdigest()
+
+
+def _touch(path):
+    # Explicit nanosecond stamp; kernel file times can be too coarse to order recent uses
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def _link(source, destination):
+    # Outputs are always replaced atomically, never rewritten in place, so sharing an inode is safe
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=RESULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, *parts):
+        """Digest of the engine version, the writer settings and ``parts`` (upload hash, parameters, rules)."""
+        from .writer import OUTPUT_MODE, WRITER_ENGINE
+
+        digest = hashlib.sha256()
+        for part in (ENGINE_VERSION, WRITER_ENGINE, OUTPUT_MODE) + parts:
+            digest.update(repr(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key, output_directory):
+        """Link a cached result's files into ``output_directory`` and return its {label: filename}."""
+        entry = os.path.join(self.directory, key)
+        manifest_path = os.path.join(entry, MANIFEST)
+        try:
+            with open(manifest_path) as f:
+                result = json.load(f)
+            os.makedirs(output_directory, exist_ok=True)
+            for filename in set(result.values()):
+                _link(os.path.join(entry, filename), os.path.join(output_directory, filename))
+            _touch(manifest_path)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key, output_directory, result):
+        """Store the files of ``result`` under ``key``.
+
+        Result values are paths relative to ``output_directory`` (they may
+        include the request's namespace); the cache keeps bare filenames.
+        """
+        entry = os.path.join(self.directory, key)
+        if os.path.exists(entry):
+            return
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+        try:
+            for name in set(result.values()):
+                _link(os.path.join(output_directory, name), os.path.join(staging, os.path.basename(name)))
+            with open(os.path.join(staging, MANIFEST), 'w') as f:
+                json.dump({label: os.path.basename(name) for label, name in result.items()}, f)
+            _touch(os.path.join(staging, MANIFEST))
+            os.rename(staging, entry)
+        except OSError:
+            # Another worker stored the same key first, or an output vanished
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            try:
+                last_used = os.stat(os.path.join(entry, MANIFEST)).st_mtime_ns
+                size = sum(f.stat().st_size for f in os.scandir(entry))
+            except OSError:
+                continue
+            entries.append((last_used, size, entry))
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def run_cached(cache, key, output_directory, func, *args):
+    """Run a job body and remember its result; returns what ``func`` returns."""
+    result = func(*args)
+    cache.put(key, output_directory, result)
+    return result
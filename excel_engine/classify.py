@@ -0,0 +1,62 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+UNMATCHED = -1
+
+
+class KeywordClassifier:
+    """Assigns every row to the first bucket whose keywords match its text.
+
+    ``buckets`` is an ordered list of ``(label, keywords)``. With
+    ``exact=False`` a keyword matches anywhere in the value, case-insensitively,
+    like ``str.contains(case=False)``; with ``exact=True`` the stripped,
+    lower-cased value must equal a keyword, or the value as it is with
+    ``normalise=False``. Patterns are only evaluated once
+    per distinct value, so the cost of a scan does not grow with the number
+    of buckets.
+    """
+
+    def __init__(self, buckets, exact=False, normalise=True):
+        self.buckets = [(label, list(keywords)) for label, keywords in buckets]
+        self.labels = [label for label, _ in buckets]
+        if exact:
+            self._matchers = [
+                frozenset(k.strip().lower() if normalise else k for k in keywords) for _, keywords in buckets
+            ]
+        else:
+            self._matchers = [
+                re.compile('|'.join(re.escape(k) for k in keywords), re.IGNORECASE)
+                for _, keywords in buckets
+            ]
+        self.exact = exact
+        self.normalise = normalise
+
+    def __repr__(self):
+        # Stable across processes, so it can take part in cache keys
+        return f"KeywordClassifier({self.buckets!r}, exact={self.exact!r}, normalise={self.normalise!r})"
+
+    def match(self, value):
+        if not isinstance(value, str):
+            return UNMATCHED
+        if self.exact:
+            if self.normalise:
+                value = value.strip().lower()
+            for code, keywords in enumerate(self._matchers):
+                if value in keywords:
+                    return code
+        else:
+            for code, pattern in enumerate(self._matchers):
+                if pattern.search(value):
+                    return code
+        return UNMATCHED
+
+    def classify(self, values):
+        """Return an int16 array with one bucket code per row (``UNMATCHED`` for none)."""
+        codes, uniques = pd.factorize(values)
+        # Missing values get factorize code -1, which lands on the trailing UNMATCHED slot
+        table = np.full(len(uniques) + 1, UNMATCHED, dtype=np.int16)
+        for i, value in enumerate(uniques):
+            table[i] = self.match(value)
+        return table[codes]
@@ -0,0 +1,215 @@
+"""Command-line batch processing, for backfills that should not go through the web forms.
+
+    python -m excel_engine receipts 'exports/Receipt__*.xlsx' --branch Kalamassery --bank "SBI BANK" -o out/
+    python -m excel_engine sales exports/sales/ --branch Vedimara --receipt exports/receipts.xlsx -o out/
+
+Inputs are files, directories (every Excel file directly inside) or glob
+patterns. Each file is processed on its own worker process with the same
+engine code the web apps run, and one line per file reports its row counts
+and timing. Receipt outputs carry the input's filename and all go to the
+output directory; sales outputs have fixed names, so every input gets a
+subdirectory named after it.
+"""
+import argparse
+import glob
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .batch import BATCH_WORKERS, map_files, unique_filenames
+from .frames import frame_cache
+from .patients import patient_departments
+from .reader import SALES_COLUMNS
+from .receipts import read_receipt_file, receipt_buckets, write_receipt_buckets
+from .rules import SALES_FORM_PLAN, plan_for_branch
+from .store import STORAGE_MODE
+from .template_registry import template_registry
+from .writer import OUTPUT_MODES
+
+BRANCHES = ('Aluva', 'Kalamassery', 'Vedimara', 'Choondy')
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+# The receipt app's output template, used unless --template names another
+RECEIPT_TEMPLATE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'flask_app', 'templates', 'Receipt Template - dental - g pay..xlsx',
+)
+
+
+@dataclass
+class FileReport:
+    filename: str
+    rows: int = 0
+    written: int = 0
+    outputs: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def is_excel_file(path):
+    name = os.path.basename(path)
+    # Skip the lock files Excel leaves next to open workbooks
+    return name.lower().endswith(EXCEL_EXTENSIONS) and not name.startswith(('~$', '.'))
+
+
+def expand_inputs(patterns):
+    """Return the sorted, de-duplicated files named by ``patterns``; raises ValueError for one that names nothing."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [path for path in glob.glob(os.path.join(glob.escape(pattern), '*')) if is_excel_file(path)]
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = [path for path in glob.glob(pattern) if os.path.isfile(path) and is_excel_file(path)]
+        if not matches:
+            raise ValueError(f"No Excel files match '{pattern}'.")
+        paths.extend(matches)
+
+    unique, seen = [], set()
+    for path in sorted(paths):
+        if os.path.abspath(path) not in seen:
+            seen.add(os.path.abspath(path))
+            unique.append(path)
+    return unique
+
+
+def process_receipts(path, filename, output_directory, bank_name, branch, output_mode):
+    df, departments = read_receipt_file(path, filename, branch)
+    buckets = receipt_buckets(df, bank_name, departments)
+    outputs = write_receipt_buckets(buckets, filename, output_directory, departments, output_mode)
+    return len(df), sum(len(frame) for frame in buckets.values()), len(outputs)
+
+
+def process_sales(path, filename, output_directory, branch, sales_form, receipt_df, output_mode):
+    plan = SALES_FORM_PLAN if sales_form else plan_for_branch(branch)
+    df = frame_cache.read(path, SALES_COLUMNS, filename=filename)
+    frames = plan.split(df, receipt_df)
+    written = sum(len(frame) for frame in frames.values())
+    if len(df) and not written:
+        hint = '; the receipt export and patient index have none of its patients' if plan.rules.receipt_join else ''
+        raise ValueError(f"none of its {len(df)} rows matched a department{hint}")
+    # Output names are fixed, so each input writes into a directory of its own
+    directory = os.path.join(output_directory, os.path.splitext(filename)[0])
+    outputs = plan.write(frames, directory, output_mode)
+    return len(df), written, len(outputs)
+
+
+PROCESSORS = {'receipts': process_receipts, 'sales': process_sales}
+
+
+def process_file(command, path, filename, output_directory, options):
+    """Worker body: process one input and report on it, catching its errors so the rest of the batch carries on."""
+    start = time.perf_counter()
+    try:
+        rows, written, outputs = PROCESSORS[command](path, filename, output_directory, **options)
+    except Exception as e:
+        return FileReport(filename, seconds=time.perf_counter() - start, error=str(e) or e.__class__.__name__)
+    return FileReport(filename, rows, written, outputs, time.perf_counter() - start)
+
+
+def configure_worker(frame_cache_directory=None, template=None, patient_index=None):
+    """Set up the module state a run needs: in the parent, and in every worker as the pool's initializer."""
+    if frame_cache_directory:
+        frame_cache.configure(frame_cache_directory)
+    if template:
+        template_registry.register('receipt', template)
+        template_registry.preload()
+    if patient_index:
+        # Workers read the index the parent filled from its file
+        patient_departments.configure(patient_index)
+
+
+def format_reports(reports, elapsed, workers):
+    width = max([len('file')] + [len(report.filename) for report in reports])
+    lines = [f"{'file':<{width}}  {'rows':>8}  {'written':>8}  {'outputs':>7}  {'seconds':>8}"]
+    for report in reports:
+        if report.error is not None:
+            lines.append(f"{report.filename:<{width}}  failed after {report.seconds:.2f} s: {report.error}")
+            continue
+        lines.append(
+            f"{report.filename:<{width}}  {report.rows:>8}  {report.written:>8}  {report.outputs:>7}  {report.seconds:>8.2f}"
+        )
+    failed = sum(report.error is not None for report in reports)
+    rows = sum(report.rows for report in reports)
+    lines.append(
+        f"{len(reports)} file(s), {failed} failed, {rows} rows in {elapsed:.2f} s on {workers} worker(s)"
+    )
+    return '\n'.join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m excel_engine', description='Process Excel exports in bulk.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('inputs', nargs='+', help='Export files, directories or glob patterns')
+    common.add_argument('-o', '--output', required=True, help='Directory the outputs are written to')
+    common.add_argument('--branch', choices=BRANCHES, default='Aluva')
+    common.add_argument('--workers', type=int, default=BATCH_WORKERS, help='Worker processes (default: %(default)s)')
+    common.add_argument('--output-mode', choices=OUTPUT_MODES, help='Defaults to EXCEL_OUTPUT_MODE')
+    common.add_argument('--frame-cache', help='Directory that keeps parsed inputs, so re-runs skip the Excel parse')
+
+    receipts = commands.add_parser('receipts', parents=[common], help='Clean receipt exports')
+    receipts.add_argument('--bank', required=True, help="Name written in place of 'Card' and 'Wallet' payments")
+    receipts.add_argument('--template', default=RECEIPT_TEMPLATE_PATH, help='Receipt output template')
+
+    sales = commands.add_parser('sales', parents=[common], help='Split sales exports by treatment and compute GST')
+    sales.add_argument('--receipt', help='Receipt export the Vedimara branch takes departments from')
+    sales.add_argument(
+        '--patient-index',
+        help='File that keeps the departments of every patient seen in a receipt export, so --receipt is only '
+             'needed for new patients',
+    )
+    sales.add_argument(
+        '--sales-form', action='store_true',
+        help="Apply the receipt app's sales form rules instead of the branch's",
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if STORAGE_MODE == 'memory':
+        parser.error('EXCEL_STORAGE=memory keeps outputs inside a web process; unset it to write files.')
+    try:
+        paths = expand_inputs(args.inputs)
+    except ValueError as e:
+        parser.error(str(e))
+    # Spawned workers start from fresh modules, so they get the same set-up through the pool's initializer
+    if args.command == 'receipts':
+        state = (args.frame_cache, args.template, None)
+    else:
+        state = (args.frame_cache, None, args.patient_index)
+    configure_worker(*state)
+
+    if args.command == 'receipts':
+        options = {'bank_name': args.bank, 'branch': args.branch, 'output_mode': args.output_mode}
+    else:
+        receipt_df = None
+        if not args.sales_form and plan_for_branch(args.branch).rules.receipt_join:
+            if not args.receipt and not len(patient_departments):
+                parser.error(f"The {args.branch} branch needs --receipt.")
+            if args.receipt:
+                receipt_df = frame_cache.read(args.receipt, ['Pt Id', 'Notes'])
+            if receipt_df is not None and args.patient_index:
+                # Added to the index once here instead of by every worker
+                patient_departments.update(receipt_df['Pt Id'], receipt_df['Notes'])
+                receipt_df = None
+        options = {
+            'branch': args.branch, 'sales_form': args.sales_form,
+            'receipt_df': receipt_df, 'output_mode': args.output_mode,
+        }
+
+    os.makedirs(args.output, exist_ok=True)
+    filenames = unique_filenames([os.path.basename(path) for path in paths])
+    count = len(paths)
+    workers = max(1, min(args.workers, count))
+    start = time.perf_counter()
+    reports = map_files(
+        process_file, [args.command] * count, paths, filenames, [args.output] * count, [options] * count,
+        max_workers=workers, initializer=configure_worker, initargs=state,
+    )
+    print(format_reports(reports, time.perf_counter() - start, workers))
+    return 1 if any(report.error is not None for report in reports) else 0
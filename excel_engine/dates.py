@@ -0,0 +1,114 @@
+"""Format-aware parsing of the exports' ``Date`` columns.
+
+Most exports store real Excel dates, which the reader already returns as
+datetimes; the rest are the summary rows at the bottom (``Total Amount:
+...``) and, from some clinic software versions, dates typed as text.
+``parse_dates`` converts the datetimes as they are, tries the text against
+the formats the clinic software is known to write, vectorised one format
+at a time, and leaves only what none of them match to pandas' per-element
+inference. The format that matched is remembered per source signature
+(the caller's source name and the shape of its first text date), so the
+next upload from the same export starts with it.
+"""
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Formats the clinic software writes text dates in; day first, as everywhere the clinics are
+DATE_FORMATS = (
+    '%d-%m-%Y',
+    '%d/%m/%Y',
+    '%d-%m-%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S',
+    '%d-%m-%Y %H:%M',
+    '%d/%m/%Y %H:%M',
+    '%d.%m.%Y',
+    '%d-%b-%Y',
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+)
+# Signatures remembered per process; the table is cleared when it grows past this
+MAX_SIGNATURES = 256
+
+_formats = {}
+_formats_lock = threading.Lock()
+
+
+def _shape(text):
+    # '05-11-2025 10:30' -> '9-9-9 9:9', '05-Nov-2025' -> '9-a-9'; separators and order tell formats apart
+    return re.sub(r'[A-Za-z]+', 'a', re.sub(r'\d+', '9', text.strip()))
+
+
+# Shape of the text each format parses, e.g. '%d-%m-%Y' -> '9-9-9'
+FORMAT_SHAPES = {f: _shape(re.sub(r'%[dmYHMS]', '0', f).replace('%b', 'Nov')) for f in DATE_FORMATS}
+
+
+def _formats_for(source, sample):
+    """``DATE_FORMATS`` in the order to try them for text like ``sample``, and the signature to learn under."""
+    if not isinstance(sample, str):
+        return DATE_FORMATS, None
+    shape = _shape(sample)
+    signature = (source, shape)
+    learned = _formats.get(signature)
+    first = [learned] if learned is not None else []
+    first += [f for f in DATE_FORMATS if FORMAT_SHAPES[f] == shape and f != learned]
+    return (*first, *(f for f in DATE_FORMATS if f not in first)), signature
+
+
+def _learn(signature, date_format):
+    if signature is None or _formats.get(signature) == date_format:
+        return
+    with _formats_lock:
+        if len(_formats) >= MAX_SIGNATURES:
+            _formats.clear()
+        _formats[signature] = date_format
+
+
+def parse_dates(values, source=None):
+    """``values`` as a ``datetime64[ns]`` Series; what is not a date becomes ``NaT``.
+
+    ``source`` names the kind of export (``'receipt'``, ``'sales'``), so the
+    remembered formats of one never reorder the other's.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values
+    objects = values.to_numpy(dtype=object)
+    head = objects[:64]
+    head = head[pd.notna(head)]
+    formats, signature = _formats_for(source, head[0] if len(head) else None)
+    # Datetime cells convert in this same pass, whatever the format, without being parsed
+    result = pd.to_datetime(values, format=formats[0], errors='coerce').to_numpy()
+    missing = np.flatnonzero(np.isnat(result))
+    missing = missing[pd.notna(objects[missing])]
+    if not len(missing):
+        if signature is not None:
+            _learn(signature, formats[0])
+        return pd.Series(result, index=values.index, name=values.name)
+
+    # Cells the first format left: text in the other formats, summary rows, stray values
+    text = pd.Series(objects[missing]).str.strip()
+    strings = text.notna().to_numpy()
+    others, positions, text = missing[~strings], missing[strings], text[strings]
+    if len(positions):
+        formats, signature = _formats_for(source, text.iloc[0])
+        for date_format in formats:
+            parsed = pd.to_datetime(text, format=date_format, errors='coerce').to_numpy()
+            matched = ~np.isnat(parsed)
+            if not matched.any():
+                continue
+            result[positions[matched]] = parsed[matched]
+            _learn(signature, date_format)
+            signature = None
+            positions, text = positions[~matched], text[~matched]
+            if text.empty:
+                break
+
+    rest = np.concatenate([positions, others])
+    if len(rest):
+        # Unknown formats and anything else: pandas infers them one at a time
+        parsed = pd.to_datetime(pd.Series(objects[rest]), errors='coerce', format='mixed').to_numpy()
+        matched = ~np.isnat(parsed)
+        result[rest[matched]] = parsed[matched]
+    return pd.Series(result, index=values.index, name=values.name)
@@ -0,0 +1,180 @@
+"""Sidecar cache of parsed uploads.
+
+Parsing a workbook's XML is the slowest step of a run, and users often
+re-upload the same export only to change the bank or the branch, which
+misses the result cache. ``FrameCache`` keeps the projected frame
+``read_columns`` returns, keyed by the file's contents and the columns
+read, so such a re-run loads it instead of parsing the workbook again.
+
+Frames are stored as uncompressed Feather files when pyarrow is installed
+(read back memory-mapped) and as NumPy ``.npz`` archives otherwise, or when
+a frame does not survive the Arrow round trip unchanged (mixed-type
+columns). Least recently used sidecars are dropped once the cache grows
+past its byte budget.
+"""
+import hashlib
+import importlib.util
+import os
+import uuid
+
+from .cache import _touch, iter_stream
+from .lazy import lazy_import
+from .metrics import metrics
+from .reader import read_columns
+
+# Imported on the first sidecar read or write, so configuring the cache at start-up stays cheap
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+# optional; the .npz format needs nothing beyond numpy
+feather = lazy_import('pyarrow.feather') if importlib.util.find_spec('pyarrow') is not None else None
+
+FRAME_CACHE_BYTES = int(os.environ.get('EXCEL_FRAME_CACHE_BYTES', str(256 * 1024 * 1024)))
+# Bump when read_columns returns something different for the same file
+READER_VERSION = '1'
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter_stream(f):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_feather(df, path):
+    feather.write_feather(df, path, compression='uncompressed')
+    # Arrow may widen a column (ints with gaps come back as floats); keep the exact frame instead
+    if not _load_feather(path).equals(df):
+        raise ValueError('frame does not round-trip through Arrow')
+
+
+def _load_feather(path):
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def _save_npz(df, path):
+    arrays = {f"c{i}": df[name].to_numpy() for i, name in enumerate(df.columns)}
+    with open(path, 'wb') as f:
+        np.savez(f, _columns=np.array(list(df.columns), dtype=str), **arrays)
+
+
+def _load_npz(path):
+    # Object columns are pickled; the cache directory is only ever written by this module
+    with np.load(path, allow_pickle=True) as data:
+        columns = data['_columns'].tolist()
+        return pd.DataFrame({name: data[f"c{i}"] for i, name in enumerate(columns)}, columns=columns)
+
+
+def _input_size(source):
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    size = getattr(source, 'size', None)  # Django upload objects
+    if size is None:
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END)
+        source.seek(position)
+    return size
+
+
+def _input_name(source, filename=None):
+    if filename:
+        return filename
+    return os.path.basename(source) if isinstance(source, str) else getattr(source, 'name', '') or ''
+
+
+# Preferred format first
+FORMATS = ([('.feather', _save_feather, _load_feather)] if feather is not None else []) + [
+    ('.npz', _save_npz, _load_npz),
+]
+
+
+class FrameCache:
+    """Disabled until ``configure`` gives it a directory; reads then go through the sidecars."""
+
+    def __init__(self, directory=None, max_bytes=FRAME_CACHE_BYTES):
+        self.directory = None
+        self.max_bytes = max_bytes
+        if directory is not None:
+            self.configure(directory)
+
+    def configure(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def key(self, path, columns, filename=None):
+        digest = hashlib.sha256()
+        legacy = str(filename or path).lower().endswith('.xls')
+        for part in (READER_VERSION, file_digest(path), tuple(columns), legacy):
+            digest.update(repr(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def read(self, path, columns, filename=None):
+        """``read_columns(path, columns, filename)``, served from a sidecar when this file was parsed before."""
+        with metrics.stage('read'):
+            df = self._read(path, columns, filename)
+        size = _input_size(path)
+        metrics.add(rows=len(df), bytes_in=size)
+        metrics.note(input=_input_name(path, filename), rows=len(df), columns=list(df.columns), bytes=size)
+        return df
+
+    def _read(self, path, columns, filename):
+        if self.directory is None or not isinstance(path, str):
+            # Upload buffers (diskless mode) are parsed once anyway
+            return read_columns(path, columns, filename=filename)
+
+        key = self.key(path, columns, filename)
+        for extension, _, load in FORMATS:
+            sidecar = os.path.join(self.directory, key + extension)
+            if not os.path.exists(sidecar):
+                continue
+            try:
+                df = load(sidecar)
+            except Exception:
+                # A damaged sidecar is only a miss
+                continue
+            _touch(sidecar)
+            return df
+
+        df = read_columns(path, columns, filename=filename)
+        self.put(key, df)
+        return df
+
+    def put(self, key, df):
+        for extension, save, _ in FORMATS:
+            sidecar = os.path.join(self.directory, key + extension)
+            temporary = os.path.join(self.directory, f".{uuid.uuid4().hex}{extension}")
+            try:
+                save(df, temporary)
+                os.replace(temporary, sidecar)
+            except Exception:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                continue
+            break
+        self.evict()
+
+    def evict(self):
+        sidecars = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            sidecars.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(sidecars):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+frame_cache = FrameCache()
@@ -0,0 +1,67 @@
+"""GST split of tax-inclusive totals, computed in integer paise.
+
+Totals are converted to paise once and every bucket's rate is applied from
+a per-row basis-point array, so one call covers all taxed rows of an
+export. Each figure is rounded half away from zero to the nearest paisa
+with integer arithmetic, which keeps results identical across platforms
+and column sums exact.
+"""
+import numpy as np
+import pandas as pd
+
+BASIS_POINTS = 10000
+
+
+def rate_to_basis_points(rate):
+    """0.18 -> 1800; ``None`` (untaxed) -> -1."""
+    return -1 if rate is None else int(round(rate * BASIS_POINTS))
+
+
+def to_paise(values):
+    """Parse amounts once into int64 paise plus a validity mask."""
+    amounts = pd.to_numeric(values, errors='coerce')
+    amounts = np.asarray(amounts, dtype=np.float64)
+    valid = ~np.isnan(amounts)
+    paise = np.zeros(len(amounts), dtype=np.int64)
+    paise[valid] = np.round(amounts[valid] * 100).astype(np.int64)
+    return paise, valid
+
+
+def _divide_half_up(numerator, denominator):
+    # Round numerator / denominator half away from zero, entirely in integers
+    magnitude = (2 * np.abs(numerator) + denominator) // (2 * denominator)
+    return np.sign(numerator) * magnitude
+
+
+def split_inclusive_paise(total_paise, rate_bp):
+    """Return (base, sgst, cgst) in paise for totals that include GST at ``rate_bp``.
+
+    SGST and CGST are half the rate each and, like the base, are rounded
+    from the exact value rather than from the rounded base.
+    """
+    denominator = BASIS_POINTS + rate_bp
+    base = _divide_half_up(total_paise * BASIS_POINTS, denominator)
+    half = _divide_half_up(total_paise * rate_bp, 2 * denominator)
+    return base, half, half.copy()
+
+
+def gst_kernel(total_inv, rate_bp):
+    """Compute base, SGST and CGST in rupees for every row at once.
+
+    ``total_inv`` is the raw 'Total inv' column and ``rate_bp`` an int
+    array of per-row rates in basis points (negative for untaxed rows).
+    Returns float64 arrays with NaN where the row is untaxed or the total
+    is not a number, plus the boolean mask of taxed rows.
+    """
+    total_paise, valid = to_paise(total_inv)
+    rate_bp = np.asarray(rate_bp, dtype=np.int64)
+    taxed = rate_bp >= 0
+    computed = taxed & valid
+
+    results = []
+    for paise in split_inclusive_paise(total_paise[computed], rate_bp[computed]):
+        rupees = np.full(len(rate_bp), np.nan)
+        rupees[computed] = paise / 100
+        results.append(rupees)
+    base, sgst, cgst = results
+    return base, sgst, cgst, taxed
@@ -0,0 +1,165 @@
+"""Background processing of uploads on a local process pool.
+
+Job state lives in a small SQLite file so that any web worker can answer a
+status poll, whichever worker queued the job. No outside services are needed.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .warmup import wait_for_warm_up
+
+# Worker processes per web process; 0 runs jobs inline in the request (useful for debugging)
+JOB_WORKERS = int(os.environ.get('EXCEL_JOB_WORKERS', '2'))
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+def _execute(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def _set_status(db_path, job_id, status, result=None, error=None):
+    _execute(
+        db_path,
+        'UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?',
+        (status, None if result is None else json.dumps(result), error, time.time(), job_id),
+    )
+
+
+def run_job(db_path, job_id, func, args):
+    """Run one job and record its outcome; executed inside a pool worker."""
+    _set_status(db_path, job_id, RUNNING)
+    try:
+        result = func(*args)
+    except Exception as e:
+        logger.exception('Job %s failed', job_id)
+        _set_status(db_path, job_id, FAILED, error=str(e))
+        return
+    _set_status(db_path, job_id, DONE, result=result)
+
+
+class JobQueue:
+    def __init__(self, db_path, max_workers=None):
+        self.db_path = db_path
+        self.max_workers = JOB_WORKERS if max_workers is None else max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        _execute(db_path, SCHEMA)
+
+    def _pool(self):
+        # Created on first use so importing the app never forks. A background warm-up still importing
+        # pandas must finish first: a worker forked mid-import could inherit a half-initialised module.
+        wait_for_warm_up()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _discard(self, executor):
+        # A worker that died (OOM kill, segfault) breaks its whole pool; the next submit starts a fresh one
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _submit(self, job_id, func, args):
+        executor = self._pool()
+        try:
+            future = executor.submit(run_job, self.db_path, job_id, func, args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+        future.add_done_callback(lambda f: self._on_done(job_id, f, executor))
+
+    def submit(self, kind, func, *args):
+        """Queue ``func(*args)`` and return the job id straight away.
+
+        ``func`` must be a module-level function and its return value
+        JSON-serialisable; it becomes the job's result.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        _execute(
+            self.db_path,
+            'INSERT INTO jobs (id, kind, status, created, updated) VALUES (?, ?, ?, ?, ?)',
+            (job_id, kind, QUEUED, now, now),
+        )
+        if self.max_workers == 0:
+            run_job(self.db_path, job_id, func, args)
+            return job_id
+
+        try:
+            self._submit(job_id, func, args)
+        except BrokenProcessPool:
+            # The pool broke since the last job finished; retried once on a fresh one
+            self._submit(job_id, func, args)
+        return job_id
+
+    def record(self, kind, result):
+        """Store an already finished result (e.g. a cache hit) as a done job and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        _execute(
+            self.db_path,
+            'INSERT INTO jobs (id, kind, status, result, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, DONE, json.dumps(result), now, now),
+        )
+        return job_id
+
+    def _on_done(self, job_id, future, executor):
+        # A crashed worker never gets to record its own failure
+        error = future.exception()
+        if error is not None:
+            _set_status(self.db_path, job_id, FAILED, error=str(error) or error.__class__.__name__)
+        if isinstance(error, BrokenProcessPool) or getattr(executor, '_broken', False):
+            self._discard(executor)
+
+    def get(self, job_id):
+        """Return the job as a dict, or ``None`` for an unknown id."""
+        rows = _execute(
+            self.db_path,
+            'SELECT id, kind, status, result, error, created, updated FROM jobs WHERE id = ?',
+            (job_id,),
+        )
+        if not rows:
+            return None
+        job_id, kind, status, result, error, created, updated = rows[0]
+        return {
+            'id': job_id,
+            'kind': kind,
+            'status': status,
+            'result': None if result is None else json.loads(result),
+            'error': error,
+            'created': created,
+            'updated': updated,
+        }
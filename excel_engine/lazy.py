@@ -0,0 +1,34 @@
+"""Deferred imports of the heavy libraries.
+
+pandas, numpy and openpyxl take most of a web process's start-up, and a
+sleeping free-tier dyno makes its first visitor wait for all of it. The
+modules the web apps import at start-up bind those libraries with
+``lazy_import`` instead. The library is then imported the first time one
+of its attributes is used, i.e. on the first upload or during warm-up.
+"""
+import importlib
+import sys
+
+
+class LazyModule:
+    """Stands in for a module until an attribute is first looked up on it."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        module = self._module
+        if module is None:
+            # The import system's own locks make concurrent first uses safe
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}{' (loaded)' if self._module is not None else ''}>"
+
+
+def lazy_import(name):
+    """``name``'s module if it is already imported, otherwise a stand-in that imports it on first use."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
@@ -0,0 +1,327 @@
+"""Per-stage latency and size histograms, exposed in the Prometheus text format.
+
+The engine times its hot stages (``read``, ``parse_dates``, ``classify``,
+``gst``, ``write``, ...) with ``metrics.stage``; the apps wrap each job body
+in ``metrics.request``, which supplies the labels (kind of upload, branch)
+and, when the job ends, records the request's totals: seconds, rows read,
+bytes read and written, and outputs written.
+
+Jobs run on pool worker processes and the web apps may run several
+workers, so every process keeps its own histograms and, once ``configure``
+gives it a directory, writes them to a file of its own there after each
+request. ``render`` merges every process's file into one exposition, and
+folds the files of processes that have exited (recycled web workers,
+replaced pool workers) into a single one, so the directory holds one file
+per live process. The servers ``clear`` it when they start.
+When nothing is configured a stage costs only a clock read and a
+dictionary update.
+
+``trace`` additionally collects the stages and inputs of whatever runs
+inside it, in order; the profiler uses it to save them with a profile.
+"""
+import contextlib
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows; files of exited processes are then left in place
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+ROW_BUCKETS = (10, 100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+BYTE_BUCKETS = tuple(1024 * 4 ** power for power in range(11))  # 1 KiB .. 1 GiB
+OUTPUT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Histograms of every process that has exited, folded together
+EXITED_FILE = 'exited.json'
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'excel_stage_seconds': ('Time spent in one processing stage of an upload.', LATENCY_BUCKETS),
+    'excel_request_seconds': ('Time to process one upload, from the first read to the last output.', LATENCY_BUCKETS),
+    'excel_request_rows': ('Rows read from the inputs of one upload.', ROW_BUCKETS),
+    'excel_request_bytes_in': ('Bytes of the input workbooks of one upload.', BYTE_BUCKETS),
+    'excel_request_bytes_out': ('Bytes of the output workbooks one upload wrote.', BYTE_BUCKETS),
+    'excel_request_outputs': ('Output workbooks one upload wrote.', OUTPUT_BUCKETS),
+}
+
+# Labels and running totals of the request the current job is processing
+_current = contextvars.ContextVar('excel_metrics_request', default=None)
+# Events collected by ``Metrics.trace``; None when nothing is tracing
+_trace = contextvars.ContextVar('excel_metrics_trace', default=None)
+# Set while warm-up work runs, so it never shows up as traffic
+_muted = contextvars.ContextVar('excel_metrics_muted', default=False)
+
+
+class _Request:
+    def __init__(self, labels):
+        self.labels = labels
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.outputs = 0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}' if labels else ''
+
+
+def _exited(filename):
+    """Whether ``filename`` is a ``<pid>.json`` whose process is gone; POSIX only, where signal 0 only probes."""
+    stem, extension = os.path.splitext(filename)
+    if extension != '.json' or not stem.isdigit():
+        return False
+    try:
+        os.kill(int(stem), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # Alive, but another user's
+        return False
+    return False
+
+
+def _merge(total, series):
+    return list(series) if total is None else [a + b for a, b in zip(total, series)]
+
+
+def _format_number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metrics:
+    """Histograms of this process; shared with other processes through ``directory`` once configured."""
+
+    def __init__(self):
+        self.directory = None
+        self.constant_labels = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # (name, sorted label pairs) -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+
+    def configure(self, directory=None, **constant_labels):
+        """Label every series with ``constant_labels`` (e.g. ``app='flask'``) and share them through ``directory``."""
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.constant_labels = constant_labels
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        # A process forked from the web process would report the parent's observations again, so it starts
+        # empty. A file already under its pid was left by an exited process that had the same pid.
+        self._pid = os.getpid()
+        self._series = {}
+        if self.directory and os.path.exists(self._path()):
+            self._fold([self._path()])
+
+    def _path(self):
+        return os.path.join(self.directory, f"{self._pid}.json")
+
+    def observe(self, name, value, labels=None):
+        if _muted.get():
+            return
+        buckets = HISTOGRAMS[name][1]
+        key = (name, tuple(sorted({**self.constant_labels, **(labels or {})}.items())))
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._reset()
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(buckets) + 2)
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            series[index] += 1
+            series[-1] += value
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time one stage of the current request."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            request = _current.get()
+            self.observe('excel_stage_seconds', elapsed, {
+                **(request.labels if request is not None else {}), 'stage': name,
+            })
+            self.note(stage=name, seconds=elapsed)
+            if request is None:
+                # Web-process stages such as upload saves have no request end to share them
+                self.flush()
+
+    @contextlib.contextmanager
+    def request(self, **labels):
+        """Label the stages run inside with ``labels``; record the request's totals and share them at the end."""
+        request = _Request({name: '' if value is None else value for name, value in labels.items()})
+        token = _current.set(request)
+        start = time.perf_counter()
+        try:
+            yield request
+        finally:
+            _current.reset(token)
+            self.observe('excel_request_seconds', time.perf_counter() - start, request.labels)
+            self.observe('excel_request_rows', request.rows, request.labels)
+            self.observe('excel_request_bytes_in', request.bytes_in, request.labels)
+            self.observe('excel_request_bytes_out', request.bytes_out, request.labels)
+            self.observe('excel_request_outputs', request.outputs, request.labels)
+            self.flush()
+
+    def add(self, rows=0, bytes_in=0, bytes_out=0, outputs=0):
+        """Add to the totals of the current request, if there is one."""
+        request = _current.get()
+        if request is not None:
+            request.rows += rows
+            request.bytes_in += bytes_in
+            request.bytes_out += bytes_out
+            request.outputs += outputs
+
+    @contextlib.contextmanager
+    def muted(self):
+        """Record nothing that runs inside."""
+        token = _muted.set(True)
+        try:
+            yield
+        finally:
+            _muted.reset(token)
+
+    @contextlib.contextmanager
+    def trace(self):
+        """Collect the ``note``s (every stage, every input read) of what runs inside, as a list of dicts."""
+        events = []
+        token = _trace.set(events)
+        try:
+            yield events
+        finally:
+            _trace.reset(token)
+
+    def note(self, **event):
+        """Add ``event`` to the current trace, if there is one."""
+        events = _trace.get()
+        if events is not None:
+            events.append(event)
+
+    def flush(self):
+        """Write this process's histograms to the shared directory."""
+        if self.directory is None:
+            return
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._reset()
+            data = [[name, labels, series] for (name, labels), series in self._series.items()]
+            path = self._path()
+        temporary = os.path.join(self.directory, f".{uuid.uuid4().hex}.json")
+        try:
+            with open(temporary, 'w') as f:
+                json.dump(data, f)
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _fold(self, paths):
+        """Add the histograms in ``paths`` to ``EXITED_FILE`` and remove them."""
+        if fcntl is None:
+            return
+        exited = os.path.join(self.directory, EXITED_FILE)
+        with self._directory_lock():
+            # Another process may have folded some of them since they were listed
+            paths = [path for path in paths if os.path.exists(path)]
+            if not paths:
+                return
+            merged = self._load(exited)
+            for path in paths:
+                for key, series in self._load(path).items():
+                    merged[key] = _merge(merged.get(key), series)
+            temporary = os.path.join(self.directory, f".{uuid.uuid4().hex}.json")
+            try:
+                with open(temporary, 'w') as f:
+                    json.dump([[name, labels, series] for (name, labels), series in merged.items()], f)
+                os.replace(temporary, exited)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+            for path in paths:
+                os.remove(path)
+
+    def clear(self):
+        """Remove every process's histograms; for server start-up, when they all belong to an earlier run."""
+        if self.directory is None:
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                os.remove(entry.path)
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {(name, tuple(tuple(pair) for pair in labels)): series for name, labels, series in data}
+
+    def collect(self):
+        """Every series of every process, merged: {(name, labels): [bucket counts..., sum]}."""
+        if self.directory is None:
+            with self._lock:
+                return {key: list(series) for key, series in self._series.items()}
+        self.flush()
+        if fcntl is not None:
+            exited = [entry.path for entry in os.scandir(self.directory) if _exited(entry.name)]
+            if exited:
+                self._fold(exited)
+        merged = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.') or not entry.name.endswith('.json'):
+                continue
+            for key, series in self._load(entry.path).items():
+                if key[0] in HISTOGRAMS:
+                    merged[key] = _merge(merged.get(key), series)
+        return merged
+
+    def render(self):
+        """The histograms in the Prometheus text exposition format."""
+        collected = self.collect()
+        lines = []
+        for name, (description, buckets) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for (series_name, labels), series in sorted(collected.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (math.inf,), series[:-1]):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels + (('le', _format_number(bound)),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(series[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+metrics = Metrics()
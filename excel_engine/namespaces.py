@@ -0,0 +1,106 @@
+"""Per-request output namespaces and the janitor that keeps them bounded.
+
+Every upload writes its files into its own ``<root>/<namespace>/``
+directory, so concurrent requests never overwrite each other's outputs
+even though the output names are fixed. A background ``Janitor`` removes
+namespaces past a maximum age and, oldest first, while a root holds more
+than its byte budget. Only namespace directories are touched; anything
+else under a root (job state, the result cache, sample files) is left alone.
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+OUTPUT_MAX_AGE = float(os.environ.get('EXCEL_OUTPUT_MAX_AGE', str(24 * 60 * 60)))
+OUTPUT_MAX_BYTES = int(os.environ.get('EXCEL_OUTPUT_MAX_BYTES', str(1024 * 1024 * 1024)))
+# Seconds between sweeps; 0 disables the janitor
+JANITOR_INTERVAL = float(os.environ.get('EXCEL_JANITOR_INTERVAL', '600'))
+# Namespaces touched this recently may still be in use by a job and are never evicted for size
+GRACE_PERIOD = 300
+
+NAMESPACE_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+logger = logging.getLogger(__name__)
+
+
+def new_namespace():
+    return uuid.uuid4().hex
+
+
+def _directory_size(path):
+    total = 0
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.stat(os.path.join(directory, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def sweep(root, max_age=OUTPUT_MAX_AGE, max_bytes=OUTPUT_MAX_BYTES, now=None):
+    """Evict namespaces under ``root`` by age, then by total size; returns the removed names."""
+    now = time.time() if now is None else now
+    try:
+        names = [name for name in os.listdir(root) if NAMESPACE_PATTERN.match(name)]
+    except FileNotFoundError:
+        return []
+
+    namespaces = []
+    for name in names:
+        path = os.path.join(root, name)
+        try:
+            modified = os.stat(path).st_mtime
+        except OSError:
+            continue
+        namespaces.append((modified, name, path, _directory_size(path)))
+    namespaces.sort()
+
+    removed = []
+    total = sum(size for _, _, _, size in namespaces)
+    for modified, name, path, size in namespaces:
+        expired = now - modified > max_age
+        if not expired and (total <= max_bytes or now - modified < GRACE_PERIOD):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed.append(name)
+    return removed
+
+
+class Janitor:
+    """Sweeps ``roots`` every ``interval`` seconds on a daemon thread."""
+
+    def __init__(self, roots, interval=JANITOR_INTERVAL, max_age=OUTPUT_MAX_AGE, max_bytes=OUTPUT_MAX_BYTES):
+        self.roots = roots
+        self.interval = interval
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        for root in self.roots:
+            removed = sweep(root, self.max_age, self.max_bytes)
+            if removed:
+                logger.info('Removed %d output namespace(s) from %s', len(removed), root)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('Output sweep failed')
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='excel-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
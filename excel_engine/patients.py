@@ -0,0 +1,148 @@
+"""Patient id -> department index for branches that take departments from receipts.
+
+The Vedimara sales export has no department column; each patient's
+department comes from the ``Notes`` of their receipts. ``PatientDepartments``
+keeps one department per patient (the latest receipt wins) in a hashed
+index, so mapping a sales export is one lookup per row, and a patient with
+several receipts still maps to exactly one department instead of
+multiplying their treatment rows.
+
+Once ``configure`` gives it a path the index is kept on disk and grows with
+every receipt export it sees, so later sales exports only need a receipt
+export for patients it has not seen before. Writers take a file lock and
+merge into the latest copy on disk; readers pick up another process's
+changes by the file's modification time.
+"""
+import contextlib
+import os
+import threading
+import uuid
+
+from .lazy import lazy_import
+
+# Imported on first use, so configuring the index at start-up stays cheap
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+try:
+    import fcntl
+except ImportError:  # Windows; concurrent writers there fall back to last one wins
+    fcntl = None
+
+
+def normalise_ids(values):
+    """Patient ids as upper-case stripped strings; blank ids become missing."""
+    ids = pd.Series(values).reset_index(drop=True)
+    if ids.dtype.kind == 'f':
+        # Numeric ids read from a column with gaps come back as floats
+        ids = ids.astype('Int64')
+    ids = ids.astype('string').str.strip().str.upper()
+    return ids.mask(ids.eq(''))
+
+
+class PatientDepartments:
+    """In-memory only until ``configure`` gives it a file to persist to."""
+
+    def __init__(self, path=None):
+        self.path = None
+        self._lock = threading.Lock()
+        # Built on first use; ``configure`` only records the path
+        self._mapping = None
+        self._stamp = None
+        if path is not None:
+            self.configure(path)
+
+    def configure(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._stamp = None
+
+    def __len__(self):
+        self._refresh()
+        return len(self._mapping)
+
+    def version(self):
+        """Changes whenever the index does; lets callers key cached results on it."""
+        self._refresh()
+        return self._stamp
+
+    def update(self, ids, departments):
+        """Record the department of every patient in ``ids``; later rows win over earlier ones and the index."""
+        ids = normalise_ids(ids)
+        departments = pd.Series(departments).reset_index(drop=True).astype('string').str.strip()
+        keep = (ids.notna() & departments.notna() & departments.ne('')).to_numpy()
+        new = pd.Series(departments[keep].to_numpy(dtype=object), index=ids[keep].to_numpy(dtype=object))
+        new = new[~new.index.duplicated(keep='last')]
+        if new.empty:
+            return
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            current = self._mapping
+            known = current.reindex(new.index).astype(object)
+            if known.eq(new).all():
+                return
+            mapping = pd.concat([current[~current.index.isin(new.index)].astype(object), new])
+            self._mapping = mapping.astype('category')
+            if self.path is not None:
+                self._save()
+
+    def lookup(self, ids):
+        """Department of every id in ``ids`` (missing for patients the index has not seen), in order."""
+        self._refresh()
+        departments = self._mapping.reindex(normalise_ids(ids).to_numpy(dtype=object, na_value=None))
+        return pd.Series(departments.to_numpy(dtype=object), index=ids.index if isinstance(ids, pd.Series) else None)
+
+    def _refresh(self):
+        if self._mapping is None:
+            self._mapping = pd.Series([], index=pd.Index([], dtype=object), dtype='category')
+        if self.path is None:
+            return
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+        # allow_pickle stays off: the file only ever holds strings and integer codes
+        with np.load(self.path, allow_pickle=False) as data:
+            categories = pd.Index(data['departments'].astype(object))
+            codes = data['codes']
+            ids = pd.Index(data['ids'].astype(object))
+        self._mapping = pd.Series(pd.Categorical.from_codes(codes, categories), index=ids)
+        self._stamp = stamp
+
+    def _save(self):
+        directory = os.path.dirname(self.path) or '.'
+        temporary = os.path.join(directory, f".{uuid.uuid4().hex}.npz")
+        values = self._mapping.array
+        try:
+            with open(temporary, 'wb') as f:
+                np.savez(
+                    f,
+                    ids=np.array(self._mapping.index, dtype=str),
+                    codes=values.codes.astype(np.int32),
+                    departments=np.array(values.categories, dtype=str),
+                )
+            os.replace(temporary, self.path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        stat = os.stat(self.path)
+        self._stamp = (stat.st_mtime_ns, stat.st_size)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        if self.path is None or fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+patient_departments = PatientDepartments()
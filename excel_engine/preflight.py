@@ -0,0 +1,197 @@
+"""Turn away unusable uploads before they are parsed.
+
+``preflight`` looks at an upload the way a person glancing at it would: its
+size, its header row and how many rows its first sheet has. Only the first
+row of the sheet is parsed, so a wrong export, an empty file or one too big
+to process in a request is rejected in milliseconds with a message naming
+the problem, instead of after the whole sheet was read, on a job worker.
+
+The row count comes from the sheet's ``<dimension>`` element. The clinic's
+exports leave it out; their sheet XML is then scanned for row tags without
+parsing a cell, which the byte limit keeps cheap. Legacy ``.xls`` workbooks
+only get the byte limit, since they are not zip packages.
+
+This module imports nothing heavy, so the apps can call it before warm-up.
+"""
+import os
+import posixpath
+import re
+import zipfile
+from xml.etree import ElementTree
+
+from .metrics import metrics
+from .reader import RECEIPT_COLUMNS, SALES_COLUMNS
+
+MAX_UPLOAD_BYTES = int(os.environ.get('EXCEL_MAX_UPLOAD_BYTES', str(32 * 1024 * 1024)))
+MAX_UPLOAD_ROWS = int(os.environ.get('EXCEL_MAX_UPLOAD_ROWS', '250000'))
+
+# Columns only one kind of export has, for telling users which one they sent instead
+EXPORT_SIGNATURES = {
+    'receipt': [col for col in RECEIPT_COLUMNS if col not in SALES_COLUMNS],
+    'sales': [col for col in SALES_COLUMNS if col not in RECEIPT_COLUMNS],
+}
+# Uncompressed sheet XML read per step while counting row tags
+CHUNK_BYTES = 1 << 20
+
+MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+PACKAGE_RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# The last row of a dimension reference such as 'A1:W24'
+LAST_ROW = re.compile(r'(\d+)$')
+# A worksheet row's start tag, and the row number among its attributes
+ROW_TAG = re.compile(rb'<row\b([^>]*)>')
+ROW_NUMBER = re.compile(rb'\sr=["\'](\d+)')
+
+
+class PreflightError(ValueError):
+    """An upload turned away by ``preflight``; the message is meant for the user."""
+
+
+def _size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    position = source.tell()
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(position)
+    return size
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def _first_sheet_part(archive):
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find(f'{MAIN}sheets/{MAIN}sheet')
+    if sheet is None:
+        raise KeyError('workbook has no sheets')
+    relationships = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relationship in relationships.iter(f'{PACKAGE_RELATIONSHIPS}Relationship'):
+        if relationship.get('Id') == sheet.get(RELATIONSHIP):
+            target = relationship.get('Target')
+            return target[1:] if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    raise KeyError('first sheet has no part')
+
+
+def _shared_strings(archive, indexes):
+    """The shared strings at ``indexes``; the table is parsed no further than the largest of them."""
+    strings = {}
+    if not indexes:
+        return strings
+    last = max(indexes)
+    with archive.open('xl/sharedStrings.xml') as xml:
+        position = 0
+        for _, element in ElementTree.iterparse(xml):
+            if element.tag != f'{MAIN}si':
+                continue
+            if position in indexes:
+                # Plain text, or rich text runs joined; phonetic hints are not part of the text
+                runs = element.findall(f'{MAIN}r/{MAIN}t') or element.findall(f'{MAIN}t')
+                strings[position] = ''.join(t.text or '' for t in runs)
+            element.clear()
+            if position == last:
+                break
+            position += 1
+    return strings
+
+
+def _count_rows(archive, part):
+    """The number of the sheet's last row, read off its row tags without parsing a cell."""
+    rows = 0
+    tail = b''
+    with archive.open(part) as xml:
+        for chunk in iter(lambda: xml.read(CHUNK_BYTES), b''):
+            data = tail + chunk
+            # A tag cut off at the end of the chunk is matched with the next one
+            cut = data.rfind(b'<')
+            if cut == -1:
+                cut = len(data)
+            for match in ROW_TAG.finditer(data, 0, cut):
+                # Rows skip numbers past blank rows; a row without a number follows the previous one
+                number = ROW_NUMBER.search(match.group(1))
+                rows = int(number.group(1)) if number else rows + 1
+            tail = data[cut:]
+    return rows
+
+
+def _read_header(source):
+    """The first sheet's header names and its row count, header included, from the first row and the dimensions only.
+
+    The package is read directly rather than through ``openpyxl.load_workbook``,
+    which scans a whole sheet for its dimensions when it has none.
+    """
+    with zipfile.ZipFile(source) as archive:
+        part = _first_sheet_part(archive)
+        cells = []
+        rows = None
+        with archive.open(part) as xml:
+            for event, element in ElementTree.iterparse(xml, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == f'{MAIN}dimension':
+                        match = LAST_ROW.search(element.get('ref', ''))
+                        rows = int(match.group(1)) if match else None
+                    continue
+                if element.tag == f'{MAIN}c':
+                    inline = element.find(f'{MAIN}is')
+                    if inline is not None:
+                        cells.append((None, ''.join(t.text or '' for t in inline.iter(f'{MAIN}t'))))
+                    else:
+                        value = element.find(f'{MAIN}v')
+                        if value is not None and value.text is not None:
+                            cells.append((element.get('t'), value.text))
+                elif element.tag == f'{MAIN}row':
+                    break
+
+        strings = _shared_strings(archive, {int(value) for kind, value in cells if kind == 's'})
+        names = [strings[int(value)] if kind == 's' else value for kind, value in cells]
+        if not rows or rows <= 1:
+            # No dimensions, or a placeholder one: count the rows in the sheet XML instead
+            rows = _count_rows(archive, part)
+    return names, rows
+
+
+def preflight(source, filename, required, kind=None, max_rows=None, max_bytes=None):
+    """Check an upload against the limits and ``required`` columns before it is parsed.
+
+    ``source`` is a path or a seekable binary file object, such as an upload
+    buffer, which is rewound afterwards; ``filename`` names it in messages.
+    ``kind`` (``'receipt'`` or ``'sales'``) lets a message say when the file
+    looks like the other kind of export. ``max_rows`` and ``max_bytes``
+    default to ``EXCEL_MAX_UPLOAD_ROWS`` and ``EXCEL_MAX_UPLOAD_BYTES``.
+
+    Returns the names in the header row and the number of data rows, both
+    ``None`` for ``.xls`` files. Raises ``PreflightError``.
+    """
+    max_rows = MAX_UPLOAD_ROWS if max_rows is None else max_rows
+    max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    with metrics.stage('preflight'):
+        size = _size(source)
+        if size > max_bytes:
+            raise PreflightError(f"{filename} is {_megabytes(size)}; uploads are limited to {_megabytes(max_bytes)}.")
+        if size == 0:
+            raise PreflightError(f"{filename} is empty.")
+        if str(filename).lower().endswith('.xls'):
+            return None, None
+
+        try:
+            names, rows = _read_header(source)
+        except (zipfile.BadZipFile, KeyError, OSError, ElementTree.ParseError) as e:
+            raise PreflightError(f"{filename} could not be opened as an Excel workbook.") from e
+        finally:
+            if not isinstance(source, (str, os.PathLike)):
+                source.seek(0)
+
+        missing = [col for col in required if col not in names]
+        if missing:
+            message = f"{filename} is missing the column(s): {', '.join(missing)}."
+            others = [other for other, columns in EXPORT_SIGNATURES.items() if other != kind and all(col in names for col in columns)]
+            if kind is not None and others:
+                message += f" It looks like a {others[0]} export; check which file was uploaded."
+            raise PreflightError(message)
+        rows = max(rows - 1, 0)
+        if rows > max_rows:
+            raise PreflightError(
+                f"{filename} has {rows:,} rows; uploads are limited to {max_rows:,}. Split the export by date range."
+            )
+    return names, rows
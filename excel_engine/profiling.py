@@ -0,0 +1,190 @@
+"""Opt-in profiles of single uploads.
+
+When one clinic's file is slow it can be profiled where it is uploaded
+rather than reproduced elsewhere: an upload that carries the
+``X-Excel-Profile`` header, set to the value of ``EXCEL_PROFILE_TOKEN``,
+runs its job body under ``cProfile``. The profile is saved as
+``<id>.prof`` (readable with ``pstats`` or snakeviz), next to ``<id>.json``
+with the input shapes, the stage timings collected by ``metrics.trace``
+and the functions with the most cumulative time. The id is the upload's
+namespace, the directory its download links point into.
+
+Uploads without the header are submitted exactly as before. Profiling and
+the profile views stay off while no token is set.
+"""
+import cProfile
+import datetime
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+
+from .metrics import metrics
+
+PROFILE_HEADER = 'X-Excel-Profile'
+# Value the header (or the views' ``token`` parameter) must carry; profiling is off while unset
+PROFILE_TOKEN = os.environ.get('EXCEL_PROFILE_TOKEN', '')
+# Profiles kept; the oldest are removed past this many
+PROFILE_KEEP = int(os.environ.get('EXCEL_PROFILE_KEEP', '50'))
+# Functions listed in a profile's summary
+SUMMARY_LINES = 40
+
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+logger = logging.getLogger(__name__)
+
+# One profiler per process at a time; Python 3.12+ refuses to enable a second one
+_active = threading.Lock()
+
+
+def _reset_after_fork():
+    # A job worker forked while the web process was profiling would otherwise never profile
+    global _active
+    _active = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):  # not on Windows, which has no fork
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_profiled(store, profile_id, label, func, *args):
+    """Job body wrapper: run ``func(*args)`` under the profiler and save the profile to ``store``."""
+    return store.run(profile_id, label, func, *args)
+
+
+class ProfileStore:
+    """Profiles of opted-in uploads, kept in ``directory``."""
+
+    def __init__(self, directory, token=PROFILE_TOKEN, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.token = token
+        self.keep = keep
+
+    def authorised(self, token):
+        """Whether ``token``, from the header or a view's query string, unlocks profiling."""
+        if not self.token or not token:
+            return False
+        return hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8'))
+
+    def job(self, profile_id, label, func, *args):
+        """``(func, *args)`` to submit to a job queue; wrapped in ``run_profiled`` when ``profile_id`` is set."""
+        if profile_id is None:
+            return (func, *args)
+        return (run_profiled, self, profile_id, label, func, *args)
+
+    def call(self, profile_id, label, func, *args):
+        """``func(*args)``, profiled when ``profile_id`` is set; for the uploads processed in the request."""
+        if profile_id is None:
+            return func(*args)
+        return self.run(profile_id, label, func, *args)
+
+    def run(self, profile_id, label, func, *args):
+        """Run ``func(*args)`` under the profiler; the profile is saved whether it returns or raises."""
+        if not _active.acquire(blocking=False):
+            logger.warning('Another profile is running in this process; %s runs unprofiled', label)
+            return func(*args)
+        try:
+            profiler = cProfile.Profile()
+            error = None
+            start = time.perf_counter()
+            with metrics.trace() as events:
+                profiler.enable()
+                try:
+                    return func(*args)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    profiler.disable()
+                    self.save(profile_id, label, profiler, events, time.perf_counter() - start, error)
+        finally:
+            _active.release()
+
+    def save(self, profile_id, label, profiler, events, seconds, error=None):
+        """Write the profile and its record; a failure is logged so it never costs the upload its result."""
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        record = {
+            'id': profile_id,
+            'label': label,
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'seconds': seconds,
+            'error': error,
+            'inputs': [
+                {'name': event['input'], 'rows': event['rows'], 'columns': event['columns'], 'bytes': event['bytes']}
+                for event in events if 'input' in event
+            ],
+            'stages': [event for event in events if 'stage' in event],
+            'summary': summary.getvalue(),
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # The record goes last, so a profile is only listed once both files are there
+            self._replace(f"{profile_id}.prof", profiler.dump_stats)
+            self._replace(f"{profile_id}.json", lambda path: self._dump(record, path))
+            self.prune()
+        except OSError:
+            logger.exception('Saving profile %s failed', profile_id)
+
+    @staticmethod
+    def _dump(record, path):
+        with open(path, 'w') as f:
+            json.dump(record, f, indent=1)
+
+    def _replace(self, name, write):
+        temporary = os.path.join(self.directory, f".{uuid.uuid4().hex}")
+        try:
+            write(temporary)
+            os.replace(temporary, os.path.join(self.directory, name))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _records(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+        records = []
+        for entry in entries:
+            try:
+                with open(entry.path) as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(records, key=lambda record: record['created'], reverse=True)
+
+    def records(self):
+        """Every saved profile's record without its summary, newest first."""
+        return [{key: value for key, value in record.items() if key != 'summary'} for record in self._records()]
+
+    def get(self, profile_id):
+        """The full record of one profile, or ``None``."""
+        if not PROFILE_ID.match(profile_id or ''):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def path(self, profile_id):
+        """Path of one profile's ``.prof`` file, or ``None``."""
+        if not PROFILE_ID.match(profile_id or ''):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.prof")
+        return path if os.path.isfile(path) else None
+
+    def prune(self):
+        for record in self._records()[self.keep:]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, f"{record['id']}{extension}"))
+                except FileNotFoundError:
+                    pass
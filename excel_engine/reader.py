@@ -0,0 +1,83 @@
+from .lazy import lazy_import
+
+# Imported on the first read, so the web apps start without them
+openpyxl = lazy_import('openpyxl')
+pd = lazy_import('pandas')
+
+# Columns each processing path actually uses; everything else in the export is skipped
+RECEIPT_COLUMNS = ['Date', 'Pt Id', 'Patient', 'Amount', 'Paid By', 'Notes']
+SALES_COLUMNS = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice', 'Notes']
+
+# Strings pandas.read_excel treats as missing by default
+NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+
+def _header_names(row):
+    names = []
+    for i, value in enumerate(row):
+        names.append(f"Unnamed: {i}" if value is None else str(value))
+    return names
+
+
+def _convert(value):
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+        return value
+    if isinstance(value, str) and value in NA_STRINGS:
+        return None
+    return value
+
+
+def read_columns(path, columns, filename=None):
+    """Read only ``columns`` from the first sheet of an Excel export.
+
+    Rows are streamed with openpyxl's read-only iterator and only the
+    projected cells are converted, so the unused columns of a wide export
+    never become pandas objects. Missing columns are simply left out, the
+    same as selecting them afterwards would fail for the caller.
+
+    ``path`` may also be a binary file object, such as an upload buffer;
+    ``filename`` then names it so legacy ``.xls`` files are recognised.
+    """
+    if str(filename or path).lower().endswith('.xls'):
+        # openpyxl cannot open legacy workbooks
+        wanted = set(columns)
+        return pd.read_excel(path, usecols=lambda name: name in wanted)
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+
+        names = _header_names(next(rows, ()))
+        wanted = set(columns)
+        positions = []
+        for index, name in enumerate(names):
+            if name in wanted:
+                positions.append((name, index))
+                wanted.discard(name)
+
+        data = {name: [] for name, _ in positions}
+        row_count = 0
+        last_row_with_data = 0
+        for row in rows:
+            row_count += 1
+            width = len(row)
+            if row.count(None) != width:
+                last_row_with_data = row_count
+            for name, index in positions:
+                data[name].append(_convert(row[index]) if index < width else None)
+    finally:
+        workbook.close()
+
+    # Trailing blank rows are formatting leftovers, not data
+    for name in data:
+        del data[name][last_row_with_data:]
+    return pd.DataFrame(data, columns=[name for name, _ in positions])
@@ -0,0 +1,163 @@
+"""Receipt export cleaning, shared by the Flask receipt app and the command line.
+
+Output headers come from the ``'receipt'`` entry of the template registry,
+which the caller registers before processing.
+"""
+import numpy as np
+import pandas as pd
+
+from .classify import UNMATCHED, KeywordClassifier
+from .dates import parse_dates
+from .frames import frame_cache
+from .metrics import metrics
+from .reader import RECEIPT_COLUMNS
+from .template_registry import template_registry
+from .writer import OUTPUT_MODE, SHEET_NAME, save_output, split_common_prefix
+
+# How the output's Date cells display, as the exports' text dates did
+RECEIPT_DATE_FORMAT = 'dd-mm-yyyy'
+
+# Department buckets per branch, matched against the receipt 'Notes' column (first match wins)
+RECEIPT_DEPARTMENTS = {
+    'Kalamassery': KeywordClassifier([
+        ('Kalamassery_Dental', ['dental']),
+        ('Kalamassery_Skin', ['skin']),
+        ('Kalamassery_Hair', ['hair']),
+    ]),
+    'Vedimara': KeywordClassifier([
+        ('Vedimara_Dental', ['dental']),
+        ('Vedimara_Skin', ['skin']),
+        ('Vedimara_Economy', ['economy']),
+    ]),
+    'Choondy': KeywordClassifier([
+        ('Choondy_Dental', ['dental']),
+        ('Choondy_Skin_Hair', ['skin', 'hair']),
+    ]),
+}
+
+
+def receipt_columns(branch):
+    """Columns a receipt export for ``branch`` must have; branches split by department also need ``Notes``."""
+    columns = RECEIPT_COLUMNS[:5]
+    return columns + ['Notes'] if branch in RECEIPT_DEPARTMENTS else columns
+
+
+def receipt_link_label(label, is_card):
+    if label is None:
+        return 'Card File' if is_card else 'Cleaned File'
+    return f"{label}_Card" if is_card else label
+
+
+def receipt_buckets(df, bank_name, departments=None):
+    """Clean a receipt export and split it into department and payment buckets.
+
+    Each row gets a single bucket code (department from ``Notes`` when a
+    classifier is given, times card/non-card from ``Paid By``) and every
+    bucket is cut from one groupby over those codes. Returns a dict mapping
+    ``(department code, is_card)`` to the bucket's rows; the code is 0 when
+    no classifier is given.
+    """
+    df = df.copy() # Explicitly work on a copy to avoid SettingWithCopyWarning
+    with metrics.stage('classify'):
+        if departments is not None:
+            department_codes = departments.classify(df['Notes'])
+        else:
+            department_codes = np.zeros(len(df), dtype=np.int16)
+    # Departments present before cleaning still get a (possibly empty) cleaned file
+    present_departments = np.unique(department_codes[department_codes != UNMATCHED]) if departments is not None else [0]
+
+    columns_to_keep = ['Date', 'Pt Id', 'Patient', 'Amount', 'Paid By']
+    existing_columns = [col for col in columns_to_keep if col in df.columns]
+    df = df[existing_columns]
+    df['_bucket'] = department_codes * 2
+    if 'Date' in df.columns:
+        with metrics.stage('parse_dates'):
+            # Kept as datetimes: the writer stores them as date cells, not strings
+            df['Date'] = parse_dates(df['Date'], source='receipt')
+            df.dropna(subset=['Date'], inplace=True)
+    df.dropna(subset=existing_columns, inplace=True)
+    if 'Amount' in df.columns:
+        # The summary rows are gone, so the amounts are numbers unless an export typed one as text
+        amounts = pd.to_numeric(df['Amount'], errors='coerce')
+        if amounts.notna().all():
+            df['Amount'] = amounts
+
+    if 'Paid By' in df.columns:
+        df['_bucket'] += df['Paid By'].eq('Card').to_numpy()
+        df['Paid By'] = df['Paid By'].replace({'Card': bank_name, 'Cash': 'Cash Collection', 'Wallet': bank_name})
+
+    new_headers = template_registry.headers('receipt')
+    groups = dict(tuple(df.groupby('_bucket', sort=True)))
+    empty = df.iloc[:0]
+
+    buckets = {}
+    for department in present_departments:
+        for is_card in (False, True):
+            bucket_df = groups.get(department * 2 + is_card)
+            if bucket_df is None:
+                if is_card:
+                    continue
+                bucket_df = empty
+            bucket_df = bucket_df.drop(columns='_bucket')
+            bucket_df.columns = new_headers[:len(bucket_df.columns)]
+            buckets[(int(department), is_card)] = bucket_df
+    return buckets
+
+
+def write_receipt_buckets(buckets, original_filename, directory, departments=None, output_mode=None):
+    """Write one workbook per bucket of ``receipt_buckets`` into ``directory``.
+
+    Returns a dict mapping ``(department label, is_card)`` to the written
+    filename; the label is ``None`` when no classifier is given. With
+    ``output_mode='workbook'`` every bucket is a sheet of a single workbook,
+    returned as ``(None, False)``. ``directory=None`` renders the files into
+    the in-memory store.
+    """
+    labels = departments.labels if departments is not None else [None]
+    outputs = [(labels[department], is_card, bucket_df) for (department, is_card), bucket_df in sorted(buckets.items())]
+
+    if (output_mode or OUTPUT_MODE) == 'workbook' and outputs:
+        # One workbook, one sheet per bucket, named without the branch prefix every bucket shares
+        _, sheet_names = split_common_prefix([receipt_link_label(label, is_card) for label, is_card, _ in outputs])
+        cleaned_filename = f"cleaned_{original_filename}"
+        save_output(
+            [(name, bucket_df) for name, (_, _, bucket_df) in zip(sheet_names, outputs)],
+            directory, cleaned_filename, date_format=RECEIPT_DATE_FORMAT,
+        )
+        return {(None, False): cleaned_filename}
+
+    cleaned_files = {}
+    for label, is_card, bucket_df in outputs:
+        prefix = f"{label}_{original_filename}" if label else original_filename
+        cleaned_filename = f"{'card_cleaned' if is_card else 'cleaned'}_{prefix}"
+        save_output([(SHEET_NAME, bucket_df)], directory, cleaned_filename, date_format=RECEIPT_DATE_FORMAT)
+        cleaned_files[(label, is_card)] = cleaned_filename
+
+    return cleaned_files
+
+
+def process_receipt_dataframe(df, bank_name, original_filename, directory, departments=None, output_mode=None):
+    """Clean a receipt export and write one workbook per department and payment bucket."""
+    buckets = receipt_buckets(df, bank_name, departments)
+    return write_receipt_buckets(buckets, original_filename, directory, departments, output_mode)
+
+
+def read_receipt_file(file_path, filename, branch):
+    """Read a receipt export; returns the frame and the branch's department classifier (or ``None``)."""
+    df = frame_cache.read(file_path, RECEIPT_COLUMNS, filename=filename)
+
+    # Branches split by department; the default Aluva logic keeps one department
+    departments = RECEIPT_DEPARTMENTS.get(branch)
+    if departments is not None and 'Notes' not in df.columns:
+        raise ValueError(f'The uploaded file for {branch} branch is missing the \'Notes\' column.')
+    return df, departments
+
+
+def split_receipt_file(file_path, filename, bank_name, branch, directory):
+    """Batch worker: write one file's outputs and return them with its buckets for the combined files."""
+    try:
+        df, departments = read_receipt_file(file_path, filename, branch)
+    except ValueError as e:
+        raise ValueError(f"{filename}: {e}") from e
+    buckets = receipt_buckets(df, bank_name, departments)
+    return write_receipt_buckets(buckets, filename, directory, departments), buckets
@@ -0,0 +1,343 @@
+"""Declarative branch -> department -> treatment category -> GST rules for sales exports.
+
+Each branch is described as data in ``BRANCH_RULES`` and compiled once into
+an ``ExecutionPlan``. A plan classifies every row of the export into a
+global category in one vectorised pass, computes GST for all taxed rows at
+once and cuts every output workbook from a single groupby, so a branch with
+more buckets costs the same number of passes as one with fewer.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .classify import UNMATCHED, KeywordClassifier
+from .gst import gst_kernel, rate_to_basis_points
+from .metrics import metrics
+from .patients import PatientDepartments, patient_departments
+from .writer import OUTPUT_MODE, OUTPUT_MODES, SHEET_NAME, save_output, split_common_prefix
+
+STANDARD_GST = 0.18
+REDUCED_GST = 0.05
+
+SALES_INPUT_COLUMNS = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
+OUTPUT_COLUMNS = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
+
+CONSULTATION_KEYWORDS = ['consultation']
+ORTHO_KEYWORDS = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'VENEERS', 'Ortho Scaling', 'FACING CERAMIC CROWN', 'FPD', 'TOVALIGN', 'METAL CERAMIC CROWN', 'RPD SUNFLEX']
+ECONOMY_ORTHO_KEYWORDS = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'METAL CERAMIC CROWN', 'RPD SUNFLEX']
+SALES_FORM_ORTHO_KEYWORDS = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'VENEERS', 'Ortho Scaling']
+
+
+@dataclass
+class Category:
+    """Treatment bucket inside a department.
+
+    ``keywords=None`` makes the category the fallback for rows no other
+    category matched. Categories that share an ``output`` suffix are written
+    to the same workbook, in the original row order.
+    """
+    name: str
+    keywords: Optional[List[str]]
+    tax_rate: Optional[float] = None
+    doctor: Optional[str] = None
+    drop_summary_rows: bool = False
+    output: Optional[str] = None
+    key: Optional[str] = None
+
+    @property
+    def output_suffix(self):
+        return self.name if self.output is None else self.output
+
+
+@dataclass
+class Department:
+    """Slice of a branch's rows, written under ``prefix``.
+
+    ``match`` lists the values of the branch's department column that select
+    the department (``None`` for the fallback department).
+    """
+    prefix: str
+    categories: List[Category]
+    match: Optional[List[str]] = None
+
+
+@dataclass
+class BranchRules:
+    departments: List[Department]
+    # Column whose value picks the department; None means one department for every row
+    department_column: Optional[str] = None
+    # Take the department column from the receipt export, joined on patient id
+    receipt_join: bool = False
+    required_columns: List[str] = field(default_factory=list)
+    # Department values are stripped and lower-cased before matching; off, they must equal a match as written
+    normalise_departments: bool = True
+
+
+def dental_categories(ortho_keywords, keys=None):
+    keys = keys or {}
+    return [
+        Category('Consultation', CONSULTATION_KEYWORDS, STANDARD_GST, doctor='Clinic', key=keys.get('Consultation')),
+        Category('Ortho_Bonding', ortho_keywords, REDUCED_GST, key=keys.get('Ortho_Bonding')),
+        Category('Rest', None, drop_summary_rows=True, key=keys.get('Rest')),
+    ]
+
+
+SKIN_CATEGORIES = [
+    Category('Consultation', CONSULTATION_KEYWORDS, STANDARD_GST, doctor='Clinic'),
+    Category('Other', None, REDUCED_GST),
+]
+
+# Hair treatments are all taxed at the standard rate and written to a single workbook
+HAIR_CATEGORIES = [
+    Category('Consultation', CONSULTATION_KEYWORDS, STANDARD_GST, doctor='Clinic', output=''),
+    Category('Other', None, STANDARD_GST, output=''),
+]
+
+DEFAULT_OUTPUT_KEYS = {'Consultation': 'consultation_path', 'Ortho_Bonding': 'ortho_path', 'Rest': 'rest_path'}
+
+BRANCH_RULES = {
+    'Kalamassery': BranchRules(
+        department_column='Notes',
+        required_columns=['Notes'],
+        departments=[
+            Department('Kalamassery_Dental', dental_categories(ORTHO_KEYWORDS), match=['dental']),
+            Department('Kalamassery_Skin', SKIN_CATEGORIES, match=['skin']),
+            Department('Kalamassery_Hair', HAIR_CATEGORIES, match=['hair']),
+        ],
+    ),
+    'Vedimara': BranchRules(
+        department_column='Notes',
+        receipt_join=True,
+        departments=[
+            Department('Vedimara_Dental', dental_categories(ORTHO_KEYWORDS), match=['dental']),
+            Department('Vedimara_Economy', dental_categories(ECONOMY_ORTHO_KEYWORDS), match=['economy']),
+            Department('Vedimara_Skin', SKIN_CATEGORIES, match=['skin']),
+        ],
+    ),
+    'Choondy': BranchRules(
+        department_column='Doctor',
+        # Only this exact spelling of the doctor's name, as before the rules were declarative
+        normalise_departments=False,
+        departments=[
+            Department('Choondy_Dental', dental_categories(ORTHO_KEYWORDS)),
+            Department('Choondy_Skin', SKIN_CATEGORIES, match=['Redhina Raj']),
+        ],
+    ),
+    'default': BranchRules(
+        departments=[
+            Department('Treatments_Done', dental_categories(ORTHO_KEYWORDS, DEFAULT_OUTPUT_KEYS)),
+        ],
+    ),
+}
+
+# The Flask sales form applies the default branch rules with its own, shorter ortho keyword list
+SALES_FORM_RULES = BranchRules(
+    departments=[
+        Department('Treatments_Done', dental_categories(SALES_FORM_ORTHO_KEYWORDS, DEFAULT_OUTPUT_KEYS)),
+    ],
+)
+
+
+def checked_output_mode(output_mode=None):
+    output_mode = output_mode or OUTPUT_MODE
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{output_mode}'. Choose one of: {', '.join(OUTPUT_MODES)}.")
+    return output_mode
+
+
+class ExecutionPlan:
+    """Compiled form of a ``BranchRules`` entry."""
+
+    def __init__(self, rules, branch=None):
+        self.rules = rules
+        self.branch = branch
+        departments = rules.departments
+
+        matched = [(i, d) for i, d in enumerate(departments) if d.match is not None]
+        self.department_classifier = KeywordClassifier(
+            [(d.prefix, d.match) for _, d in matched], exact=True, normalise=rules.normalise_departments,
+        )
+        fallback = [i for i, d in enumerate(departments) if d.match is None]
+        # Classifier code -> department index; the trailing slot serves unmatched rows
+        self.department_lookup = np.array(
+            [i for i, _ in matched] + [fallback[0] if fallback else UNMATCHED], dtype=np.int16
+        )
+
+        # Flatten (department, category) into global category ids with per-id attributes
+        self.treatment_classifiers = []
+        self.category_lookups = []
+        self.outputs = []
+        self.output_departments = []
+        rates, doctors, drops, outputs = [], [], [], []
+        for index, department in enumerate(departments):
+            keyed = [(i, c) for i, c in enumerate(department.categories) if c.keywords is not None]
+            fallback = [i for i, c in enumerate(department.categories) if c.keywords is None]
+            offset = len(rates)
+            self.treatment_classifiers.append(KeywordClassifier([(c.name, c.keywords) for _, c in keyed]))
+            self.category_lookups.append(np.array(
+                [offset + i for i, _ in keyed] + [offset + fallback[0] if fallback else UNMATCHED],
+                dtype=np.int32,
+            ))
+
+            output_ids = {}
+            for category in department.categories:
+                suffix = category.output_suffix
+                if suffix not in output_ids:
+                    output_ids[suffix] = len(self.outputs)
+                    name = f"{department.prefix}_{suffix}" if suffix else department.prefix
+                    self.outputs.append((category.key or name, f"{name}.xlsx"))
+                    self.output_departments.append(index)
+                rates.append(rate_to_basis_points(category.tax_rate))
+                doctors.append(category.doctor)
+                drops.append(category.drop_summary_rows)
+                outputs.append(output_ids[suffix])
+
+        # In workbook mode every output becomes a sheet named without the prefix all outputs share
+        self.workbook_name, self.sheet_names = split_common_prefix([filename[:-len('.xlsx')] for _, filename in self.outputs])
+
+        # The trailing slot of every per-category table serves UNMATCHED (-1) rows
+        self.category_rates = np.array(rates + [-1], dtype=np.int64)
+        self.category_doctors = np.array(doctors + [None], dtype=object)
+        self.category_drops = np.array(drops + [False], dtype=bool)
+        self.category_outputs = np.array(outputs + [UNMATCHED], dtype=np.int32)
+
+    @property
+    def required_columns(self):
+        """Columns a sales export must have for this plan, checked by ``check_columns`` and the upload preflight."""
+        return [*self.rules.required_columns, *(col for col in SALES_INPUT_COLUMNS if col not in self.rules.required_columns)]
+
+    @property
+    def receipt_columns(self):
+        """Columns the receipt export of a ``receipt_join`` plan must have."""
+        return ['Pt Id', self.rules.department_column] if self.rules.receipt_join else []
+
+    def check_columns(self, df):
+        missing = [col for col in self.rules.required_columns if col not in df.columns]
+        if missing:
+            branch = f" for the {self.branch} branch" if self.branch else ''
+            raise ValueError(f"The uploaded file{branch} is missing the '{missing[0]}' column.")
+        missing = [col for col in SALES_INPUT_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"The uploaded sales file is missing the column(s): {', '.join(missing)}.")
+
+    def department_values(self, df, receipt_df=None):
+        """Return the department of every row of ``df``.
+
+        Branches with ``receipt_join`` look each patient up in the patient
+        index, after adding the receipt export's patients to it. Without a
+        persisted index (``patient_departments.configure``) only the given
+        receipt export is used.
+        """
+        if not self.rules.receipt_join:
+            return df[self.rules.department_column]
+        index = patient_departments if patient_departments.path is not None else PatientDepartments()
+        if receipt_df is not None:
+            index.update(receipt_df['Pt Id'], receipt_df[self.rules.department_column])
+        return index.lookup(df['Pt ID'])
+
+    def classify_categories(self, treatment_names, department_codes):
+        names, uniques = pd.factorize(treatment_names)
+        # One row per department (plus one for unmatched rows), one column per distinct treatment name
+        table = np.full((len(self.treatment_classifiers) + 1, len(uniques) + 1), UNMATCHED, dtype=np.int32)
+        for index, classifier in enumerate(self.treatment_classifiers):
+            local = [classifier.match(value) for value in uniques] + [UNMATCHED]
+            table[index] = self.category_lookups[index][local]
+        return table[department_codes, names]
+
+    def split(self, df, receipt_df=None):
+        """Apply the plan to ``df``; returns {output index: frame} for every output to write.
+
+        Outputs of departments with no rows are left out, so merging the
+        splits of several files (``batch.merge_frames``) and writing the
+        result gives the same files as one export holding all of their rows.
+        """
+        self.check_columns(df)
+        with metrics.stage('classify'):
+            if self.rules.department_column is None:
+                department_codes = np.zeros(len(df), dtype=np.int16)
+            else:
+                values = self.department_values(df, receipt_df)
+                department_codes = self.department_lookup[self.department_classifier.classify(values)]
+            categories = self.classify_categories(df['Treatment Name'], department_codes)
+
+        out = df[SALES_INPUT_COLUMNS].reset_index(drop=True)
+        out.insert(6, 'Blank Col 1', '')
+        out.insert(7, 'Blank Col 2', '')
+        out.columns = OUTPUT_COLUMNS
+
+        with metrics.stage('gst'):
+            # GST for every taxed row at once, in integer paise
+            base, sgst, cgst, taxed = gst_kernel(out['Total inv'], self.category_rates[categories])
+            for column, values in (('Base Value', base), ('Sgst', sgst), ('Cgst', cgst)):
+                column_values = np.full(len(out), '', dtype=object)
+                column_values[taxed] = values[taxed]
+                out[column] = column_values
+            total_amount = out['Total Amount'].to_numpy(dtype=object, copy=True)
+            total_amount[taxed] = base[taxed]
+            out['Total Amount'] = total_amount
+
+        doctors = self.category_doctors[categories]
+        overridden = pd.notna(doctors)
+        doctor_names = out['Doctors  Name'].to_numpy(dtype=object, copy=True)
+        doctor_names[overridden] = doctors[overridden]
+        out['Doctors  Name'] = doctor_names
+
+        output_codes = self.category_outputs[categories]
+        drops = self.category_drops[categories]
+        if drops.any():
+            # Remove the export's summary row (e.g. "Count: 7 6090 6090") from buckets that ask for it
+            summary = out['Date'].astype(str).str.contains('Count:', case=False, na=False).to_numpy()
+            output_codes = np.where(drops & summary, UNMATCHED, output_codes)
+
+        # Departments with no rows produce no files; a branch without departments always does
+        present = np.zeros(len(self.rules.departments), dtype=bool)
+        if self.rules.department_column is None:
+            present[:] = True
+        else:
+            present[department_codes[department_codes != UNMATCHED]] = True
+
+        groups = dict(tuple(out.groupby(output_codes, sort=False)))
+        empty = out.iloc[:0]
+        return {
+            index: groups.get(index, empty)
+            for index in range(len(self.outputs)) if present[self.output_departments[index]]
+        }
+
+    def write(self, frames, output_directory, output_mode=None):
+        """Write the frames of ``split``; returns {key: path}.
+
+        With ``output_mode='workbook'`` the outputs are written as the sheets
+        of one workbook, returned under its name. ``output_directory=None``
+        renders the outputs into the in-memory store and returns their names.
+        """
+        if checked_output_mode(output_mode) == 'workbook':
+            if not frames:
+                return {}
+            sheets = [(self.sheet_names[index], frame) for index, frame in sorted(frames.items())]
+            return {self.workbook_name: save_output(sheets, output_directory, f"{self.workbook_name}.xlsx")}
+
+        processed_files = {}
+        for index, frame in sorted(frames.items()):
+            key, filename = self.outputs[index]
+            processed_files[key] = save_output([(SHEET_NAME, frame)], output_directory, filename)
+        return processed_files
+
+    def run(self, df, output_directory, receipt_df=None, output_mode=None):
+        """Apply the plan to ``df`` and write every output; returns {key: path}."""
+        checked_output_mode(output_mode)
+        return self.write(self.split(df, receipt_df), output_directory, output_mode)
+
+
+def compile_rules(rules, branch=None):
+    return ExecutionPlan(rules, branch)
+
+
+# Compiled once at import; every request reuses the same plan
+BRANCH_PLANS = {branch: compile_rules(rules, branch) for branch, rules in BRANCH_RULES.items()}
+SALES_FORM_PLAN = compile_rules(SALES_FORM_RULES)
+
+
+def plan_for_branch(branch):
+    return BRANCH_PLANS.get(branch, BRANCH_PLANS['default'])
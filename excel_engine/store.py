@@ -0,0 +1,68 @@
+"""In-process store for outputs rendered without touching the filesystem.
+
+With ``EXCEL_STORAGE=memory`` uploads are parsed straight from the request
+buffer, processed in the web process and their outputs rendered into
+bytes kept here, where the download views find them. Entries expire after
+a TTL and the oldest are dropped once the store passes its byte budget.
+The store lives in one process, so this mode suits the single-process
+deployments (one gunicorn worker, ``runserver``) the apps ship with.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 'disk' writes uploads and outputs to the filesystem; 'memory' keeps small daily files off it entirely
+STORAGE_MODE = os.environ.get('EXCEL_STORAGE', 'disk')
+MEMORY_STORE_BYTES = int(os.environ.get('EXCEL_MEMORY_STORE_BYTES', str(128 * 1024 * 1024)))
+MEMORY_STORE_TTL = float(os.environ.get('EXCEL_MEMORY_STORE_TTL', '3600'))
+
+
+class MemoryStore:
+    def __init__(self, max_bytes=MEMORY_STORE_BYTES, ttl=MEMORY_STORE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, name, data):
+        with self._lock:
+            self._discard(name)
+            self._entries[name] = (data, time.monotonic() + self.ttl)
+            self._bytes += len(data)
+            self._evict()
+
+    def get(self, name):
+        """Return the stored bytes, or ``None`` if ``name`` is unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._discard(name)
+                return None
+            return entry[0]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._bytes
+
+    def _discard(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _evict(self):
+        now = time.monotonic()
+        for name in [name for name, (_, expires) in self._entries.items() if expires <= now]:
+            self._discard(name)
+        # Oldest first; the entry just stored is kept even if it alone exceeds the budget
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+
+
+memory_store = MemoryStore()
@@ -0,0 +1,59 @@
+import os
+import threading
+
+from .lazy import lazy_import
+
+# Imported on the first template read, so registering a template at start-up stays cheap
+openpyxl = lazy_import('openpyxl')
+
+
+def read_header_row(path):
+    """Return the first row of the first sheet without parsing the rest of the workbook."""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    finally:
+        workbook.close()
+
+    headers = list(row)
+    while headers and headers[-1] is None:
+        headers.pop()
+    # Same naming pandas uses for empty header cells
+    return [f"Unnamed: {i}" if value is None else str(value) for i, value in enumerate(headers)]
+
+
+class TemplateRegistry:
+    """Header-only cache of output templates, invalidated by file mtime."""
+
+    def __init__(self):
+        self._paths = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, path):
+        with self._lock:
+            self._paths[name] = path
+            self._entries.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._paths
+
+    def preload(self):
+        for name in list(self._paths):
+            self.headers(name)
+
+    def headers(self, name):
+        path = self._paths[name]
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == mtime:
+            return list(entry[1])
+
+        headers = read_header_row(path)
+        with self._lock:
+            self._entries[name] = (mtime, tuple(headers))
+        return headers
+
+
+template_registry = TemplateRegistry()
@@ -0,0 +1,133 @@
+"""Warm the processing stack before the first upload.
+
+A fresh process pays on its first upload for importing pandas, numpy,
+openpyxl and xlsxwriter (the web apps defer them, see ``lazy``), for
+reading the receipt template, and for the regular expressions and parsing
+caches built the first time a column is classified or a date parsed.
+``warm_up`` pays all of that up front. It pushes a tiny sales export and a
+tiny receipt export through the reader, every branch plan, every receipt
+layout and the writer, all in memory, with metrics muted.
+
+``EXCEL_WARM_UP`` picks when that happens:
+
+- ``preload``: before serving; under gunicorn, once in the master before it
+  forks the workers, so they share the warm stack.
+- ``background``: on a thread once the server is up, so the landing page
+  and health checks answer at once after a cold start. Readiness reports
+  not ready until it finishes.
+- ``off``: on the first upload.
+
+This module itself imports nothing heavy, so the apps can import it at start-up.
+"""
+import datetime
+import io
+import logging
+import os
+import threading
+import time
+
+from .metrics import metrics
+
+WARM_UP = os.environ.get('EXCEL_WARM_UP', 'background')
+WARM_UP_MODES = ('preload', 'background', 'off')
+
+logger = logging.getLogger(__name__)
+
+# Set once the stack is warm, or straight away when nothing will warm it
+_ready = threading.Event()
+if WARM_UP == 'off':
+    _ready.set()
+# Cleared while a background warm-up runs
+_idle = threading.Event()
+_idle.set()
+
+DAY = datetime.datetime(2025, 11, 5)
+
+SALES_ROWS = [
+    (DAY, 'TMV1', 'ANEESH UMMER', 'Consultation', 'ROHITH RAJ T S', 100, 0, 100, 6001, 'DENTAL'),
+    (DAY, 'TMV2', 'NISHA BIJU', 'dental ortho bonding', 'CIARA OSHIN', 30000, 0, 30000, 6002, 'Dental'),
+    (DAY, 'TMV3', 'SHELVI RAJ', 'RCT', 'ALINA THOMAS', 3500, 0, 3500, 6003, 'economy'),
+    (DAY, 'TMV4', 'AYAN NAIR', 'Skin peel', 'Redhina Raj', 2500, 0, 2500, 6004, 'skin '),
+    (DAY, 'TMV5', 'BIBI VARMA', 'Hair PRP', 'Redhina Raj', 4000, 0, 4000, 6005, 'HAIR'),
+]
+RECEIPT_ROWS = [
+    (DAY, 'TMV1', 'ANEESH UMMER', 100, 'Cash', 'DENTAL'),
+    (DAY, 'TMV2', 'NISHA BIJU', 30000, 'Card', 'Dental'),
+    (DAY, 'TMV3', 'SHELVI RAJ', 3500, 'Wallet', 'economy'),
+    (DAY, 'TMV4', 'AYAN NAIR', 2500, 'Card', 'skin '),
+    (DAY, 'TMV5', 'BIBI VARMA', 4000, 'Cash', 'HAIR'),
+]
+
+
+def _roundtrip(rows, columns):
+    import pandas as pd
+
+    from .reader import read_columns
+    from .writer import write_dataframe
+
+    buffer = io.BytesIO()
+    write_dataframe(pd.DataFrame(rows, columns=columns), buffer)
+    buffer.seek(0)
+    return read_columns(buffer, columns, filename='warm-up.xlsx')
+
+
+def warm_up():
+    """Run every processing path once on tiny in-memory exports; returns the seconds it took."""
+    # Imported here: importing them is most of what warming up pays for
+    from .reader import RECEIPT_COLUMNS, SALES_COLUMNS
+    from .receipts import RECEIPT_DEPARTMENTS, receipt_buckets
+    from .rules import BRANCH_PLANS, SALES_FORM_PLAN
+    from .template_registry import template_registry
+    from .writer import write_sheets
+
+    start = time.perf_counter()
+    template_registry.preload()
+    with metrics.muted():
+        sales = _roundtrip(SALES_ROWS, SALES_COLUMNS)
+        frames = []
+        # Receipt-joined plans only look patients up here: warm-up rows must never reach the patient index
+        for plan in [*BRANCH_PLANS.values(), SALES_FORM_PLAN]:
+            frames += plan.split(sales).values()
+        if 'receipt' in template_registry:
+            # Only the receipt app registers the receipt template
+            receipts = _roundtrip(RECEIPT_ROWS, RECEIPT_COLUMNS)
+            for departments in [None, *RECEIPT_DEPARTMENTS.values()]:
+                frames += receipt_buckets(receipts, 'SBI BANK', departments).values()
+        write_sheets([(str(index), frame) for index, frame in enumerate(frames)], io.BytesIO())
+    seconds = time.perf_counter() - start
+    _ready.set()
+    logger.info('Processing stack warmed up in %.2fs', seconds)
+    return seconds
+
+
+def _warm_up_logged():
+    try:
+        warm_up()
+    except Exception:
+        # The first upload warms up instead; a broken stack surfaces there with the upload's error
+        logger.exception('Warm-up failed')
+        _ready.set()
+    finally:
+        _idle.set()
+
+
+def start_warm_up(mode=None):
+    """Warm up as ``mode`` (default ``EXCEL_WARM_UP``) says; ``preload`` blocks, ``background`` returns at once."""
+    mode = mode or WARM_UP
+    if mode not in WARM_UP_MODES:
+        raise ValueError(f"Unknown warm-up mode '{mode}'. Choose one of: {', '.join(WARM_UP_MODES)}.")
+    if mode == 'preload':
+        _warm_up_logged()
+    elif mode == 'background':
+        _idle.clear()
+        threading.Thread(target=_warm_up_logged, name='warm-up', daemon=True).start()
+
+
+def ready():
+    """Whether the stack is warm (or will only be warmed by the first upload)."""
+    return _ready.is_set()
+
+
+def wait_for_warm_up(timeout=None):
+    """Block while a background warm-up is running; returns at once when none is."""
+    return _idle.wait(timeout)
@@ -0,0 +1,276 @@
+import datetime
+import decimal
+import io
+import os
+import re
+import uuid
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from .metrics import metrics
+from .store import STORAGE_MODE, memory_store
+
+# Backend used when a caller does not name one; set per deployment
+WRITER_ENGINE = os.environ.get('EXCEL_WRITER_ENGINE', 'streaming')
+# 'files' writes one workbook per bucket; 'workbook' writes every bucket as a sheet of a single workbook
+OUTPUT_MODE = os.environ.get('EXCEL_OUTPUT_MODE', 'files')
+OUTPUT_MODES = ('files', 'workbook')
+
+SHEET_NAME = 'Sheet1'
+MAX_SHEET_TITLE = 31
+# Formats pandas.DataFrame.to_excel applies, so both backends produce the same sheet
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+DATE_FORMAT = 'yyyy-mm-dd'
+EXCEL_EPOCH = pd.Timestamp('1899-12-31')
+
+
+def _is_missing(value):
+    # Empty strings are left out too, matching what to_excel stores for them
+    return value is None or value is pd.NaT or value == '' or (isinstance(value, float) and value != value)
+
+
+class StreamingSheetWriter:
+    """Writes rows to one worksheet in order, using xlsxwriter's constant-memory mode.
+
+    Each row is flushed to the temporary sheet file as soon as the next one
+    starts, so memory stays flat no matter how many rows are written.
+    ``formats`` come from ``add_formats`` and are shared by every sheet of
+    the workbook.
+    """
+
+    def __init__(self, worksheet, formats):
+        self.worksheet = worksheet
+        self.header_format = formats['header']
+        self.datetime_format = formats['datetime']
+        self.date_format = formats['date']
+        # Display format of date-only datetime columns; None writes them like any datetime
+        self.day_format = formats.get('day')
+        self.row = 0
+
+    def write_header(self, names):
+        for col, name in enumerate(names):
+            self.worksheet.write_string(self.row, col, str(name), self.header_format)
+        self.row += 1
+
+    def write_cell(self, col, value):
+        if _is_missing(value):
+            return
+        if isinstance(value, str):
+            self.worksheet.write_string(self.row, col, value)
+        elif isinstance(value, (bool, np.bool_)):
+            self.worksheet.write_boolean(self.row, col, bool(value))
+        elif isinstance(value, (int, float, np.integer, np.floating)):
+            self.worksheet.write_number(self.row, col, value)
+        elif isinstance(value, decimal.Decimal):
+            self.worksheet.write_number(self.row, col, float(value))
+        elif isinstance(value, datetime.datetime):
+            self.worksheet.write_datetime(self.row, col, value.replace(tzinfo=None), self.datetime_format)
+        elif isinstance(value, datetime.date):
+            self.worksheet.write_datetime(self.row, col, value, self.date_format)
+        else:
+            self.worksheet.write_string(self.row, col, str(value))
+
+    def write_row(self, values):
+        for col, value in enumerate(values):
+            self.write_cell(col, value)
+        self.row += 1
+
+    def write_number(self, col, value, cell_format=None):
+        if value == value:  # NaN and NaT serials are left blank
+            self.worksheet.write_number(self.row, col, value, cell_format)
+
+    def _column(self, series):
+        """``(values, write)`` for one column; datetime and numeric columns skip the per-cell type checks."""
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            if isinstance(series.dtype, pd.DatetimeTZDtype):
+                series = series.dt.tz_localize(None)
+            date_only = self.day_format is not None and is_date_only(series)
+            cell_format = self.day_format if date_only else self.datetime_format
+            return excel_serials(series).tolist(), lambda col, value: self.write_number(col, value, cell_format)
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iuf':
+            return series.tolist(), self.write_number
+        return series.tolist(), self.write_cell
+
+    def write_dataframe(self, df):
+        self.write_header(df.columns)
+        columns = [self._column(df.iloc[:, index]) for index in range(df.shape[1])]
+        writers = list(enumerate(write for _, write in columns))
+        for values in zip(*(values for values, _ in columns)):
+            for (col, write), value in zip(writers, values):
+                write(col, value)
+            self.row += 1
+
+
+def is_date_only(series):
+    """Whether a datetime column holds dates only, every time of day midnight."""
+    values = series.dropna()
+    return bool((values == values.dt.normalize()).all())
+
+
+def excel_serials(series):
+    """A datetime column as Excel's 1900-system serial numbers (days, fractions for the time), NaN for NaT."""
+    days = (series - EXCEL_EPOCH) / pd.Timedelta(days=1)
+    # Excel counts a 29 February 1900 that never was
+    return days.where(days <= 59, days + 1)
+
+
+def add_formats(workbook, date_format=None):
+    formats = {
+        'header': workbook.add_format(HEADER_FORMAT),
+        'datetime': workbook.add_format({'num_format': DATETIME_FORMAT}),
+        'date': workbook.add_format({'num_format': DATE_FORMAT}),
+    }
+    if date_format is not None:
+        formats['day'] = workbook.add_format({'num_format': date_format})
+    return formats
+
+
+def _streaming_workbook(target):
+    # Constant-memory mode spools rows to temporary files; a buffer target stays off the disk entirely
+    options = {'constant_memory': True} if isinstance(target, str) else {'in_memory': True}
+    return xlsxwriter.Workbook(target, options)
+
+
+def _write_streaming(sheets, target, date_format=None):
+    workbook = _streaming_workbook(target)
+    try:
+        formats = add_formats(workbook, date_format)
+        for title, df in sheets:
+            StreamingSheetWriter(workbook.add_worksheet(title), formats).write_dataframe(df)
+    finally:
+        workbook.close()
+
+
+def _write_pandas(engine):
+    def write(sheets, target, date_format=None):
+        with pd.ExcelWriter(target, engine=engine, date_format=date_format) as writer:
+            for title, df in sheets:
+                dates = []
+                if date_format is not None:
+                    dates = [
+                        index for index in range(df.shape[1])
+                        if pd.api.types.is_datetime64_any_dtype(df.dtypes.iloc[index]) and is_date_only(df.iloc[:, index])
+                    ]
+                if dates:
+                    # Written as dates, which take date_format, rather than as datetimes
+                    df = df.copy()
+                    for index in dates:
+                        df.isetitem(index, df.iloc[:, index].dt.date)
+                df.to_excel(writer, sheet_name=title, index=False)
+                if dates and engine == 'openpyxl':
+                    # pandas' openpyxl writer ignores date_format
+                    sheet = writer.sheets[title]
+                    for index in dates:
+                        for (cell,) in sheet.iter_rows(min_row=2, min_col=index + 1, max_col=index + 1):
+                            cell.number_format = date_format
+    return write
+
+
+WRITERS = {
+    'streaming': _write_streaming,
+    'openpyxl': _write_pandas('openpyxl'),
+    'xlsxwriter': _write_pandas('xlsxwriter'),
+}
+
+
+def split_common_prefix(names):
+    """Split the ``_``-separated leading words all ``names`` share from the rest.
+
+    ``['Kalamassery_Dental', 'Kalamassery_Skin']`` -> ``('Kalamassery', ['Dental', 'Skin'])``.
+    A name that would be left empty is kept whole.
+    """
+    parts = [name.split('_') for name in names]
+    common = 0
+    if len(parts) > 1:
+        while all(len(p) > common + 1 and p[common] == parts[0][common] for p in parts):
+            common += 1
+    prefix = '_'.join(parts[0][:common]) if parts else ''
+    return prefix, ['_'.join(p[common:]) for p in parts]
+
+
+def sheet_titles(names):
+    """Make valid, distinct worksheet titles (at most 31 characters, no ``[]:*?/\\``)."""
+    titles = []
+    for name in names:
+        base = re.sub(r'[\[\]:*?/\\]', '_', name)[:MAX_SHEET_TITLE] or SHEET_NAME
+        title, n = base, 1
+        while title.lower() in (t.lower() for t in titles):
+            n += 1
+            suffix = f"~{n}"
+            title = base[:MAX_SHEET_TITLE - len(suffix)] + suffix
+        titles.append(title)
+    return titles
+
+
+def write_sheets(sheets, path, engine=None, date_format=None):
+    """Save ``(title, df)`` pairs as the sheets of one workbook at ``path`` in a single writer session.
+
+    The workbook is written next to ``path`` and moved into place, so an
+    existing file (which may be shared with the result cache) is replaced,
+    never rewritten, and readers never see a half-written workbook.
+    ``path`` may also be a writable binary buffer. ``date_format`` is the
+    Excel number format of datetime columns that hold only dates.
+    """
+    engine = engine or WRITER_ENGINE
+    if engine not in WRITERS:
+        raise ValueError(f"Unknown Excel writer engine '{engine}'. Choose one of: {', '.join(WRITERS)}.")
+    titles = sheet_titles([title for title, _ in sheets])
+    if not isinstance(path, str):
+        WRITERS[engine](list(zip(titles, (df for _, df in sheets))), path, date_format)
+        return path
+    directory, filename = os.path.split(path)
+    partial = os.path.join(directory, f".{uuid.uuid4().hex}.{filename}")
+    try:
+        WRITERS[engine](list(zip(titles, (df for _, df in sheets))), partial, date_format)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return path
+
+
+def write_dataframe(df, path, engine=None):
+    """Save ``df`` as a single-sheet workbook at ``path`` using the configured backend."""
+    return write_sheets([(SHEET_NAME, df)], path, engine)
+
+
+def write_rows(header, rows, target, title=SHEET_NAME):
+    """Stream ``rows`` (tuples in ``header`` order) into a one-sheet workbook without building a frame.
+
+    Meant for database exports: rows are written as the iterable yields
+    them, so a cursor's worth of results never sits in memory at once.
+    """
+    workbook = _streaming_workbook(target)
+    try:
+        sheet = StreamingSheetWriter(workbook.add_worksheet(title), add_formats(workbook))
+        sheet.write_header(header)
+        for values in rows:
+            sheet.write_row(values)
+    finally:
+        workbook.close()
+    return target
+
+
+def save_output(sheets, directory, filename, engine=None, date_format=None):
+    """Write an output workbook as ``directory/filename`` and return that path.
+
+    In diskless mode (or with ``directory=None``) the workbook is rendered
+    into the in-memory store instead, under the same path (or just
+    ``filename``), which is returned.
+    """
+    path = filename if directory is None else os.path.join(directory, filename)
+    with metrics.stage('write'):
+        if directory is None or STORAGE_MODE == 'memory':
+            buffer = io.BytesIO()
+            write_sheets(sheets, buffer, engine, date_format)
+            memory_store.put(path, buffer.getvalue())
+            size = buffer.tell()
+        else:
+            os.makedirs(directory, exist_ok=True)
+            write_sheets(sheets, path, engine, date_format)
+            size = os.path.getsize(path)
+    metrics.add(bytes_out=size, outputs=1)
+    return path
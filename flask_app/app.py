@@ -1,20 +1,65 @@
+import io
 import os
-from flask import Flask, request, redirect, url_for, render_template, send_from_directory
+import sys
+from flask import Flask, Response, request, redirect, url_for, render_template, send_file, send_from_directory, jsonify, abort
 from werkzeug.utils import secure_filename
-import pandas as pd
+
+app_dir = os.path.dirname(os.path.abspath(__file__))
+# The shared excel_engine package sits at the repository root (copied next to the app in Docker)
+sys.path.append(os.path.dirname(app_dir))
+
+from excel_engine import JobQueue, ResultCache, template_registry
+from excel_engine.batch import map_files, merge_frames, unique_filenames
+from excel_engine.bundle import bundle_files, stream_zip
+from excel_engine.cache import iter_stream, run_cached, save_upload
+from excel_engine.frames import frame_cache
+from excel_engine.jobs import DONE
+from excel_engine.lazy import lazy_import
+from excel_engine.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from excel_engine.namespaces import Janitor, new_namespace
+from excel_engine.preflight import PreflightError, preflight
+from excel_engine.profiling import PROFILE_HEADER, ProfileStore
+from excel_engine.store import STORAGE_MODE, memory_store
+from excel_engine.warmup import ready, start_warm_up
+
+# pandas and openpyxl load with the receipt processing on the first upload or during warm-up
+receipts = lazy_import('excel_engine.receipts')
 
 # Import the blueprint
-from sales_blueprint import sales_blueprint
+from sales_blueprint import UPLOAD_DIRECTORY as SALES_OUTPUT_DIRECTORY, sales_blueprint
 
-app_dir = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(app_dir, 'uploads')
 CLEANED_FOLDER = os.path.join(app_dir, 'cleaned_files')
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+RECEIPT_TEMPLATE_PATH = os.path.join(app_dir, 'templates', 'Receipt Template - dental - g pay..xlsx')
+# Stands in for the upload's filename in the names of a batch's combined outputs
+COMBINED_FILENAME = 'combined.xlsx'
+
+# Read on first use or by the warm-up
+template_registry.register('receipt', RECEIPT_TEMPLATE_PATH)
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['CLEANED_FOLDER'] = CLEANED_FOLDER
 
+# Uploads are processed on a local process pool; job state is shared through SQLite
+job_queue = JobQueue(os.path.join(UPLOAD_FOLDER, 'jobs.sqlite3'))
+app.extensions['job_queue'] = job_queue
+# Finished outputs keyed by upload hash and parameters; repeat uploads skip processing
+result_cache = ResultCache(os.path.join(app_dir, 'cache'))
+app.extensions['result_cache'] = result_cache
+# Parsed uploads keyed by content; re-runs with other parameters skip the Excel parse
+frame_cache.configure(os.path.join(app_dir, 'cache', 'frames'))
+# Each upload gets its own namespace directory; the janitor keeps both roots bounded by age and size.
+# Started by gunicorn.conf.py in each worker, so the preloading master forks without a live thread.
+janitor = Janitor([CLEANED_FOLDER, UPLOAD_FOLDER])
+# Stage histograms of the web and job worker processes, merged by /metrics
+metrics.configure(None if STORAGE_MODE == 'memory' else os.path.join(UPLOAD_FOLDER, 'metrics'), app='flask')
+# Profiles of uploads sent with the X-Excel-Profile header
+profiles = ProfileStore(os.path.join(UPLOAD_FOLDER, 'profiles'))
+app.extensions['profiles'] = profiles
+# Which download route serves the files of each job kind
+DOWNLOAD_ENDPOINTS = {'receipts': 'download_file', 'sales': 'sales.download_file'}
 
 # Register the blueprint
 app.register_blueprint(sales_blueprint, url_prefix='/sales')
@@ -23,44 +68,76 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def process_receipt_dataframe(df, bank_name, original_filename):
-    df = df.copy() # Explicitly work on a copy to avoid SettingWithCopyWarning
-    columns_to_keep = ['Date', 'Pt Id', 'Patient', 'Amount', 'Paid By']
-    existing_columns = [col for col in columns_to_keep if col in df.columns]
-    df = df[existing_columns]
-    if 'Date' in df.columns:
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df.dropna(subset=['Date'], inplace=True)
-        df['Date'] = df['Date'].dt.strftime('%d-%m-%Y')
-    df.dropna(subset=existing_columns, inplace=True)
-
-    card_df = None
-    if 'Paid By' in df.columns and 'Card' in df['Paid By'].unique():
-        card_df = df[df['Paid By'] == 'Card'].copy()
-        df = df[df['Paid By'] != 'Card']
-        card_df['Paid By'] = card_df['Paid By'].replace({'Card': bank_name})
-
-    if 'Paid By' in df.columns:
-        df['Paid By'] = df['Paid By'].replace({'Cash': 'Cash Collection', 'Wallet': bank_name})
-
-    template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'Receipt Template - dental - g pay..xlsx')
-    template_df = pd.read_excel(template_path)
-    new_headers = template_df.columns.tolist()
-
-    df.columns = new_headers[:len(df.columns)]
-
-    cleaned_filename = f"cleaned_{original_filename}"
-    cleaned_file_path = os.path.join(app.config['CLEANED_FOLDER'], cleaned_filename)
-    df.to_excel(cleaned_file_path, index=False)
-
-    card_cleaned_filename = None
-    if card_df is not None:
-        card_df.columns = new_headers[:len(card_df.columns)]
-        card_cleaned_filename = f"card_cleaned_{original_filename}"
-        card_cleaned_file_path = os.path.join(app.config['CLEANED_FOLDER'], card_cleaned_filename)
-        card_df.to_excel(card_cleaned_file_path, index=False)
-
-    return cleaned_filename, card_cleaned_filename
+def process_receipt_file(file_path, filename, bank_name, branch, namespace):
+    """Job body for /upload; returns {link label: '<namespace>/<cleaned filename>'}.
+
+    ``file_path`` may also be the upload buffer itself (diskless mode).
+    """
+    with metrics.request(kind='receipts', branch=branch):
+        df, departments = receipts.read_receipt_file(file_path, filename, branch)
+        directory = os.path.join(app.config['CLEANED_FOLDER'], namespace)
+        cleaned_files = receipts.process_receipt_dataframe(df, bank_name, filename, directory, departments)
+    return {receipts.receipt_link_label(label, is_card): f"{namespace}/{name}" for (label, is_card), name in cleaned_files.items()}
+
+def process_receipt_batch(file_paths, filenames, bank_name, branch, namespace, max_workers=None):
+    """Job body for a multi-file /upload; every file on its own pool worker, then one combined file per bucket.
+
+    Returns {link label: '<namespace>/<cleaned filename>'}, the combined
+    files first. ``file_paths`` may also be upload buffers, which must then
+    be processed with ``max_workers=1``.
+    """
+    directory = os.path.join(app.config['CLEANED_FOLDER'], namespace)
+    count = len(filenames)
+    with metrics.request(kind='receipts', branch=branch):
+        results = map_files(
+            receipts.split_receipt_file, file_paths, filenames, [bank_name] * count, [branch] * count, [directory] * count,
+            max_workers=max_workers,
+        )
+
+        departments = receipts.RECEIPT_DEPARTMENTS.get(branch)
+        combined = receipts.write_receipt_buckets(
+            merge_frames(buckets for _, buckets in results), COMBINED_FILENAME, directory, departments,
+        )
+    links = {
+        f"Combined {receipts.receipt_link_label(label, is_card)}": f"{namespace}/{name}"
+        for (label, is_card), name in combined.items()
+    }
+    for filename, (cleaned_files, _) in zip(filenames, results):
+        for (label, is_card), name in cleaned_files.items():
+            links[f"{filename} {receipts.receipt_link_label(label, is_card)}"] = f"{namespace}/{name}"
+    return links
+
+def output_directory(kind):
+    """Root that a job kind's result paths are relative to."""
+    return app.config['CLEANED_FOLDER'] if kind == 'receipts' else SALES_OUTPUT_DIRECTORY
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+def finished_response(result):
+    """Answer an upload whose files are already there (cache hit or diskless mode) without a job round trip."""
+    job_id = job_queue.record('receipts', result)
+    download_links = {key: url_for('download_file', filename=name) for key, name in result.items()}
+    bundle_url = url_for('job_bundle', job_id=job_id)
+    if wants_json():
+        return jsonify(job_id=job_id, status=DONE, download_links=download_links, bundle_url=bundle_url)
+    return render_template('download.html', download_links=download_links, bundle_url=bundle_url)
+
+def rejected_response(error):
+    """Answer an upload turned away by the preflight, before any of it was saved or parsed."""
+    if wants_json():
+        return jsonify(status='rejected', error=error), 400
+    return render_template('payments.html', error=error), 400
+
+def preflight_uploads(files, filenames, branch):
+    """Check every upload's size, header and row count; returns the first rejection's message, or ``None``."""
+    required = receipts.receipt_columns(branch)
+    for file, filename in zip(files, filenames):
+        try:
+            preflight(file.stream, filename, required, kind='receipt')
+        except PreflightError as e:
+            return str(e)
+    return None
 
 @app.route('/')
 def index():
@@ -74,109 +151,190 @@ def payments():
 def upload_file():
     if 'file' not in request.files:
         return redirect(request.url)
-    file = request.files['file']
-    if file.filename == '':
+    files = [file for file in request.files.getlist('file') if file.filename != '']
+    if not files:
         return redirect(request.url)
+    if len(files) > 1:
+        return upload_batch(files)
+    file = files[0]
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-
-        df = pd.read_excel(file_path)
-        bank_name = request.form.get('bank')
-        branch = request.form.get('branch')
-
-        if branch == 'Kalamassery':
-            if 'Notes' not in df.columns:
-                return render_template('payments.html', error='The uploaded file for Kalamassery branch is missing the \'Notes\' column.')
-            
-            dental_df = df[df['Notes'].str.contains('dental', case=False, na=False)].copy()
-            skin_df = df[df['Notes'].str.contains('skin', case=False, na=False)].copy()
-            hair_df = df[df['Notes'].str.contains('hair', case=False, na=False)].copy()
-
-            download_links = {}
-
-            if not dental_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(dental_df, bank_name, f"Kalamassery_Dental_{filename}")
-                download_links['Kalamassery_Dental'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Kalamassery_Dental_Card'] = url_for('download_file', filename=card_cleaned_filename)
-            
-            if not skin_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(skin_df, bank_name, f"Kalamassery_Skin_{filename}")
-                download_links['Kalamassery_Skin'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Kalamassery_Skin_Card'] = url_for('download_file', filename=card_cleaned_filename)
-
-            if not hair_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(hair_df, bank_name, f"Kalamassery_Hair_{filename}")
-                download_links['Kalamassery_Hair'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Kalamassery_Hair_Card'] = url_for('download_file', filename=card_cleaned_filename)
-
-            return render_template('download.html', download_links=download_links, message='File processed successfully!')
-
-        elif branch == 'Vedimara':
-            if 'Notes' not in df.columns:
-                return render_template('payments.html', error='The uploaded file for Vedimara branch is missing the \'Notes\' column.')
-            
-            dental_df = df[df['Notes'].str.contains('dental', case=False, na=False)].copy()
-            skin_df = df[df['Notes'].str.contains('skin', case=False, na=False)].copy()
-            economy_df = df[df['Notes'].str.contains('economy', case=False, na=False)].copy()
-
-            download_links = {}
-
-            if not dental_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(dental_df, bank_name, f"Vedimara_Dental_{filename}")
-                download_links['Vedimara_Dental'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Vedimara_Dental_Card'] = url_for('download_file', filename=card_cleaned_filename)
-            
-            if not skin_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(skin_df, bank_name, f"Vedimara_Skin_{filename}")
-                download_links['Vedimara_Skin'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Vedimara_Skin_Card'] = url_for('download_file', filename=card_cleaned_filename)
-
-            if not economy_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(economy_df, bank_name, f"Vedimara_Economy_{filename}")
-                download_links['Vedimara_Economy'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Vedimara_Economy_Card'] = url_for('download_file', filename=card_cleaned_filename)
-
-            return render_template('download.html', download_links=download_links, message='File processed successfully!')
-
-        elif branch == 'Choondy':
-            if 'Notes' not in df.columns:
-                return render_template('payments.html', error='The uploaded file for Choondy branch is missing the \'Notes\' column.')
-            
-            dental_df = df[df['Notes'].str.contains('dental', case=False, na=False)].copy()
-            skin_hair_df = df[df['Notes'].str.contains('skin|hair', case=False, na=False)].copy()
-
-            download_links = {}
-
-            if not dental_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(dental_df, bank_name, f"Choondy_Dental_{filename}")
-                download_links['Choondy_Dental'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Choondy_Dental_Card'] = url_for('download_file', filename=card_cleaned_filename)
-            
-            if not skin_hair_df.empty:
-                cleaned_filename, card_cleaned_filename = process_receipt_dataframe(skin_hair_df, bank_name, f"Choondy_Skin_Hair_{filename}")
-                download_links['Choondy_Skin_Hair'] = url_for('download_file', filename=cleaned_filename)
-                if card_cleaned_filename:
-                    download_links['Choondy_Skin_Hair_Card'] = url_for('download_file', filename=card_cleaned_filename)
-
-            return render_template('download.html', download_links=download_links, message='File processed successfully!')
-
-        else: # Default Aluva logic
-            cleaned_filename, card_cleaned_filename = process_receipt_dataframe(df, bank_name, filename)
-            return render_template('download.html', cleaned_filename=cleaned_filename, card_cleaned_filename=card_cleaned_filename)
-
-
-@app.route('/download/<filename>')
+        bank_name, branch = request.form.get('bank'), request.form.get('branch')
+        error = preflight_uploads([file], [filename], branch)
+        if error:
+            return rejected_response(error)
+        namespace = new_namespace()
+        profile_id = namespace if profiles.authorised(request.headers.get(PROFILE_HEADER)) else None
+        profile_label = f"receipts {branch} {filename}"
+
+        if STORAGE_MODE == 'memory':
+            # Parsed from the request buffer and rendered into the memory store; nothing touches the disk
+            try:
+                cleaned = profiles.call(
+                    profile_id, profile_label,
+                    process_receipt_file, file.stream, filename, bank_name, branch, namespace,
+                )
+            except ValueError as e:
+                return render_template('payments.html', error=str(e))
+            return finished_response(cleaned)
+
+        upload_directory = os.path.join(app.config['UPLOAD_FOLDER'], namespace)
+        os.makedirs(upload_directory)
+        file_path = os.path.join(upload_directory, filename)
+        upload_hash = save_upload(iter_stream(file.stream), file_path)
+
+        # Output names carry the upload's filename, so it is part of the key
+        cache_key = result_cache.key(
+            'receipts', upload_hash, filename, bank_name, branch,
+            receipts.RECEIPT_DEPARTMENTS.get(branch), template_registry.headers('receipt'),
+        )
+        cleaned_directory = os.path.join(app.config['CLEANED_FOLDER'], namespace)
+        # A profiled upload is processed again even when its outputs are cached
+        cached = None if profile_id else result_cache.get(cache_key, cleaned_directory)
+        if cached is not None:
+            return finished_response({key: f"{namespace}/{name}" for key, name in cached.items()})
+
+        job_id = job_queue.submit('receipts', *profiles.job(
+            profile_id, profile_label, run_cached, result_cache, cache_key, app.config['CLEANED_FOLDER'],
+            process_receipt_file, file_path, filename, bank_name, branch, namespace,
+        ))
+        if wants_json():
+            return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+        return render_template('download.html', job_id=job_id)
+
+
+def upload_batch(files):
+    """Several exports in one request: processed in parallel, with per-file and combined outputs."""
+    if not all(allowed_file(file.filename) for file in files):
+        return render_template('payments.html', error='Only .xlsx and .xls files can be uploaded.')
+    filenames = unique_filenames([secure_filename(file.filename) for file in files], taken=[COMBINED_FILENAME])
+    bank_name, branch = request.form.get('bank'), request.form.get('branch')
+    error = preflight_uploads(files, filenames, branch)
+    if error:
+        return rejected_response(error)
+    namespace = new_namespace()
+
+    if STORAGE_MODE == 'memory':
+        # The memory store belongs to this process, so the files are processed here one after another
+        try:
+            cleaned = process_receipt_batch(
+                [file.stream for file in files], filenames, bank_name, branch, namespace, max_workers=1,
+            )
+        except ValueError as e:
+            return render_template('payments.html', error=str(e))
+        return finished_response(cleaned)
+
+    upload_directory = os.path.join(app.config['UPLOAD_FOLDER'], namespace)
+    os.makedirs(upload_directory)
+    file_paths = [os.path.join(upload_directory, filename) for filename in filenames]
+    for file, file_path in zip(files, file_paths):
+        save_upload(iter_stream(file.stream), file_path)
+
+    job_id = job_queue.submit('receipts', process_receipt_batch, file_paths, filenames, bank_name, branch, namespace)
+    if wants_json():
+        return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+    return render_template('download.html', job_id=job_id)
+
+
+@app.route('/healthz')
+def healthz():
+    # Liveness: the process answers; nothing is loaded or checked
+    return jsonify(status='ok')
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: the processing stack is warm, so an upload will not wait for it
+    if not ready():
+        return jsonify(status='warming up'), 503
+    return jsonify(status='ready')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage latency and upload size histograms, in the Prometheus text format."""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+def profiles_authorised():
+    return profiles.authorised(request.headers.get(PROFILE_HEADER) or request.args.get('token'))
+
+
+@app.route('/profiles')
+def profile_list():
+    """Saved upload profiles, newest first: input shapes, stage timings and links to the full profiles."""
+    if not profiles_authorised():
+        abort(404)
+    return jsonify(profiles=[
+        {
+            **record,
+            'url': url_for('profile_detail', profile_id=record['id']),
+            'download_url': url_for('profile_download', profile_id=record['id']),
+        }
+        for record in profiles.records()
+    ])
+
+
+@app.route('/profiles/<profile_id>')
+def profile_detail(profile_id):
+    record = profiles.get(profile_id) if profiles_authorised() else None
+    if record is None:
+        abort(404)
+    return jsonify(record)
+
+
+@app.route('/profiles/<profile_id>/download')
+def profile_download(profile_id):
+    """The raw ``cProfile`` output, for ``pstats`` or snakeviz."""
+    path = profiles.path(profile_id) if profiles_authorised() else None
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=f"{profile_id}.prof")
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(status=job['status'], error=job['error'], result_url=url_for('job_result', job_id=job_id))
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if job['status'] != DONE:
+        return jsonify(status=job['status'], error=job['error']), 409
+
+    endpoint = DOWNLOAD_ENDPOINTS[job['kind']]
+    download_links = {key: url_for(endpoint, filename=name) for key, name in job['result'].items()}
+    return jsonify(status=job['status'], download_links=download_links, bundle_url=url_for('job_bundle', job_id=job_id))
+
+
+@app.route('/jobs/<job_id>/download.zip')
+def job_bundle(job_id):
+    """Stream every output of a finished job as one ZIP, built while it is sent."""
+    job = job_queue.get(job_id)
+    if job is None or job['status'] != DONE:
+        abort(404)
+    files = bundle_files(job['result'], output_directory(job['kind']))
+    if files is None:
+        abort(404)
+    return Response(
+        stream_zip(files),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{job["kind"]}_{job_id}.zip"'},
+    )
+
+
+@app.route('/download/<path:filename>')
 def download_file(filename):
+    data = memory_store.get(os.path.join(app.config['CLEANED_FOLDER'], filename))
+    if data is not None:
+        return send_file(io.BytesIO(data), as_attachment=True, download_name=os.path.basename(filename))
     return send_from_directory(app.config['CLEANED_FOLDER'], filename, as_attachment=True)
 
 if __name__ == "__main__":
+    janitor.start()
+    start_warm_up()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""Gunicorn settings for the receipt app: load it once, then fork the workers.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master imports the app, which leaves pandas and the rest of the
+processing stack unloaded. ``EXCEL_WARM_UP`` then decides who loads it:
+
+- ``preload``: the master runs ``warm_up`` before forking, so the workers
+  share pandas, openpyxl, xlsxwriter, the compiled branch plans and the
+  receipt template copy-on-write, and none of them is cold on its first
+  upload. ``gc.freeze`` keeps the workers' garbage collector from touching,
+  and so copying, the preloaded objects. The workers are only forked once
+  this is done; connections made meanwhile wait on the bound socket.
+- ``background`` (the default): each worker warms up on a thread once it
+  is serving, so health checks answer straight after a wake and
+  ``/readyz`` turns ready when the worker is warm.
+- ``off``: the first upload loads it.
+"""
+import gc
+import os
+
+WARM_UP = os.environ.get('EXCEL_WARM_UP', 'background')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+preload_app = True
+# The processing runs on each worker's job pool, so one web worker per core is enough. The in-memory
+# output store belongs to one process, so EXCEL_STORAGE=memory keeps a single worker.
+workers = int(os.environ.get(
+    'WEB_CONCURRENCY',
+    1 if os.environ.get('EXCEL_STORAGE', 'disk') == 'memory' else max(2, os.cpu_count() or 1),
+))
+
+
+def on_starting(server):
+    # Runs in the master once the app is loaded: the metrics files there are from processes of an earlier run
+    from excel_engine.metrics import metrics
+
+    metrics.clear()
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked
+    if WARM_UP == 'preload':
+        from excel_engine.warmup import warm_up
+
+        server.log.info('Processing stack warmed up in %.2fs', warm_up())
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # Runs in each worker once it is set up, just before it starts serving
+    from app import janitor
+
+    # Sweeping is idempotent, so every worker runs its own rather than the master holding a thread across forks
+    janitor.start()
+    if WARM_UP == 'background':
+        from excel_engine.warmup import start_warm_up
+
+        start_warm_up('background')
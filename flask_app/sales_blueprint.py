@@ -1,135 +1,184 @@
+import io
 import os
 import uuid
-from flask import Blueprint, render_template, request, send_from_directory, current_app, redirect, url_for
-import pandas as pd
+from flask import Blueprint, render_template, request, send_file, send_from_directory, current_app, redirect, url_for
+from werkzeug.utils import secure_filename
+
+from excel_engine import SALES_COLUMNS
+from excel_engine.batch import map_files, merge_frames, unique_filenames
+from excel_engine.cache import iter_stream, run_cached, save_upload
+from excel_engine.frames import frame_cache
+from excel_engine.lazy import lazy_import
+from excel_engine.metrics import metrics
+from excel_engine.namespaces import new_namespace
+from excel_engine.preflight import PreflightError, preflight
+from excel_engine.profiling import PROFILE_HEADER
+from excel_engine.store import STORAGE_MODE, memory_store
 
 sales_blueprint = Blueprint('sales', __name__)
 
-UPLOAD_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-
-def process_excel_file_logic(input_file_path: str, output_directory: str):
-    # 1. Read the Excel file
-    df = pd.read_excel(input_file_path)
-
-    # 2. Keep only the specified columns
-    desired_columns = ['Date', 'Pt ID', 'Patient', 'Treatment Name', 'Doctor', 'Net Amount', 'Tax', 'Total', 'Invoice']
-    df_filtered = df[desired_columns]
-
-    # 3. Insert two blank columns between 'Net Amount' and 'Tax'
-    # Find the index of 'Net Amount'
-    net_amount_idx = df_filtered.columns.get_loc('Net Amount')
-
-    # Create two empty columns
-    blank_col_1 = [''] * len(df_filtered)
-    blank_col_2 = [''] * len(df_filtered)
-
-    # Insert the blank columns
-    df_modified = df_filtered.copy() # Work on a copy to avoid SettingWithCopyWarning
-    df_modified.insert(net_amount_idx + 1, 'Blank Col 1', blank_col_1)
-    df_modified.insert(net_amount_idx + 2, 'Blank Col 2', blank_col_2)
-
-    # Rename columns
-    new_column_names = ['Date', 'ID', 'Name', 'Treatment Name', 'Doctors  Name', 'Total Amount', 'Base Value', 'Sgst', 'Cgst', 'Total inv', 'Invoice No']
-    df_modified.columns = new_column_names
-
-    # 4. Split the data into three new Excel files based on 'Treatment Name'
-    # For 'consultation'
-    consultation_df = df_modified[df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)].copy()
-
-    # Calculations for consultation_df
-    consultation_df['Base Value'] = pd.to_numeric(consultation_df['Total inv'], errors='coerce') / 1.18
-    consultation_df['Sgst'] = consultation_df['Base Value'] * 0.09
-    consultation_df['Cgst'] = consultation_df['Base Value'] * 0.09
-
-    consultation_df['Base Value'] = consultation_df['Base Value'].round(2)
-    consultation_df['Sgst'] = consultation_df['Sgst'].round(2)
-    consultation_df['Cgst'] = consultation_df['Cgst'].round(2)
-
-    consultation_df['Total Amount'] = consultation_df['Base Value']
-    consultation_df['Doctors  Name'] = 'Clinic'
-
-
-    # For 'Ortho Bonding' related treatments
-    ortho_keywords = ['dental ortho bonding', 'ortho bonding new', 'debonding', 'VENEERS', 'Ortho Scaling']
-    ortho_pattern = '|'.join(ortho_keywords)
-    ortho_bonding_df = df_modified[df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)].copy()
+# The compiled plans, and pandas with them, load on the first upload or during warm-up
+rules = lazy_import('excel_engine.rules')
 
-    # Calculations for ortho_bonding_df
-    ortho_bonding_df['Base Value'] = pd.to_numeric(ortho_bonding_df['Total inv'], errors='coerce') / 1.05
-    ortho_bonding_df['Sgst'] = ortho_bonding_df['Base Value'] * 0.025
-    ortho_bonding_df['Cgst'] = ortho_bonding_df['Base Value'] * 0.025
-
-    ortho_bonding_df['Base Value'] = ortho_bonding_df['Base Value'].round(2)
-    ortho_bonding_df['Sgst'] = ortho_bonding_df['Sgst'].round(2)
-    ortho_bonding_df['Cgst'] = ortho_bonding_df['Cgst'].round(2)
-
-    ortho_bonding_df['Total Amount'] = ortho_bonding_df['Base Value']
-
-    # For the rest
-    # Create boolean masks for each condition
-    consultation_mask = df_modified['Treatment Name'].str.contains('consultation', case=False, na=False)
-    ortho_mask = df_modified['Treatment Name'].str.contains(ortho_pattern, case=False, na=False)
-
-    # Combine the masks to find all rows that match either condition
-    matched_rows_mask = consultation_mask | ortho_mask
-
-    # Select rows that do NOT match either condition
-    rest_df = df_modified[~matched_rows_mask].copy()
-
-    # Remove the summary row (e.g., "Count: 7 6090 6090")
-    rest_df = rest_df[~rest_df['Date'].astype(str).str.contains('Count:', case=False, na=False)]
-
-    # Clear columns for rest_df
-    rest_df['Base Value'] = ''
-    rest_df['Sgst'] = ''
-    rest_df['Cgst'] = ''
-
-
-    # 5. Save these separate DataFrames into new Excel files
-    consultation_output_path = os.path.join(output_directory, "Treatments_Done_Consultation.xlsx")
-    ortho_output_path = os.path.join(output_directory, "Treatments_Done_Ortho_Bonding.xlsx")
-    rest_output_path = os.path.join(output_directory, "Treatments_Done_Rest.xlsx")
-
-    consultation_df.to_excel(consultation_output_path, index=False)
-    ortho_bonding_df.to_excel(ortho_output_path, index=False)
-    rest_df.to_excel(rest_output_path, index=False)
+UPLOAD_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 
-    return {
-        "consultation_path": consultation_output_path,
-        "ortho_path": ortho_output_path,
-        "rest_path": rest_output_path
-    }
+def process_excel_file_logic(input_file_path: str, output_directory: str, filename: str = None):
+    # The input may also be the upload buffer (diskless mode)
+    with metrics.request(kind='sales', branch=None):
+        df = frame_cache.read(input_file_path, SALES_COLUMNS, filename=filename)
+        return rules.SALES_FORM_PLAN.run(df, output_directory)
+
+def process_sales_upload(upload_file_path, output_directory):
+    """Job body for /sales/sales; returns {link label: output path relative to UPLOAD_DIRECTORY}."""
+    try:
+        processed_files = process_excel_file_logic(upload_file_path, output_directory)
+    finally:
+        if os.path.exists(upload_file_path):
+            os.remove(upload_file_path)
+    return {key: os.path.relpath(path, UPLOAD_DIRECTORY) for key, path in processed_files.items()}
+
+def split_sales_file(input_file_path, output_directory, filename):
+    """Batch worker: write one file's outputs and return them with its frames for the combined files."""
+    try:
+        df = frame_cache.read(input_file_path, SALES_COLUMNS, filename=filename)
+        frames = rules.SALES_FORM_PLAN.split(df)
+    except ValueError as e:
+        raise ValueError(f"{filename}: {e}") from e
+    return rules.SALES_FORM_PLAN.write(frames, output_directory), frames
+
+def process_sales_batch(inputs, filenames, output_directory, max_workers=None):
+    """Job body for a multi-file /sales/sales; returns {link label: output path relative to UPLOAD_DIRECTORY}.
+
+    Every file is processed on its own pool worker into a subdirectory named
+    after it; the combined outputs go to ``output_directory`` itself and are
+    listed first. ``inputs`` may also be upload buffers, which must then be
+    processed with ``max_workers=1``.
+    """
+    stems = [os.path.splitext(filename)[0] for filename in filenames]
+    with metrics.request(kind='sales', branch=None):
+        try:
+            results = map_files(
+                split_sales_file, inputs, [os.path.join(output_directory, stem) for stem in stems], filenames,
+                max_workers=max_workers,
+            )
+        finally:
+            for path in inputs:
+                if isinstance(path, str) and os.path.exists(path):
+                    os.remove(path)
+
+        combined = rules.SALES_FORM_PLAN.write(merge_frames(frames for _, frames in results), output_directory)
+    links = {f"Combined {key}": os.path.relpath(path, UPLOAD_DIRECTORY) for key, path in combined.items()}
+    for stem, (processed_files, _) in zip(stems, results):
+        for key, path in processed_files.items():
+            links[f"{stem} {key}"] = os.path.relpath(path, UPLOAD_DIRECTORY)
+    return links
+
+def finished_response(result):
+    """Show the links of an upload whose files are already there (cache hit or diskless mode)."""
+    job_id = current_app.extensions['job_queue'].record('sales', result)
+    download_links = {key: url_for('sales.download_file', filename=name) for key, name in result.items()}
+    return render_template(
+        'sales_upload.html', message='File processed successfully!',
+        download_links=download_links, bundle_url=url_for('job_bundle', job_id=job_id),
+    )
+
+def preflight_uploads(files, filenames):
+    """Check every upload's size, header and row count; returns the first rejection's message, or ``None``."""
+    for file, filename in zip(files, filenames):
+        try:
+            preflight(file.stream, filename, rules.SALES_FORM_PLAN.required_columns, kind='sales')
+        except PreflightError as e:
+            return str(e)
+    return None
 
 @sales_blueprint.route('/sales', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
         if 'excel_file' not in request.files:
             return render_template('sales_upload.html', error='No file part')
-        file = request.files['excel_file']
-        if file.filename == '':
+        files = [file for file in request.files.getlist('excel_file') if file.filename != '']
+        if not files:
             return render_template('sales_upload.html', error='No selected file')
+        if len(files) > 1:
+            return upload_batch(files)
+        file = files[0]
         if file and file.filename.endswith(('.xlsx', '.xls')):
-            filename = f"{uuid.uuid4()}.xlsx"
-            upload_file_path = os.path.join(UPLOAD_DIRECTORY, filename)
-            os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
-            file.save(upload_file_path)
-            
-            try:
-                processed_files = process_excel_file_logic(upload_file_path, UPLOAD_DIRECTORY)
+            error = preflight_uploads([file], [secure_filename(file.filename)])
+            if error:
+                # Turned away before anything is saved or parsed
+                return render_template('sales_upload.html', error=error), 400
+            # Fixed output names would collide between requests; each one writes to its own namespace
+            namespace = new_namespace()
+            output_directory = os.path.join(UPLOAD_DIRECTORY, namespace)
+            profiles = current_app.extensions['profiles']
+            profile_id = namespace if profiles.authorised(request.headers.get(PROFILE_HEADER)) else None
+            profile_label = f"sales {secure_filename(file.filename)}"
+
+            if STORAGE_MODE == 'memory':
+                try:
+                    processed_files = profiles.call(
+                        profile_id, profile_label,
+                        process_excel_file_logic, file.stream, output_directory, file.filename,
+                    )
+                except Exception as e:
+                    return render_template('sales_upload.html', error=f"Error processing Excel file: {e}")
+                return finished_response({key: os.path.relpath(path, UPLOAD_DIRECTORY) for key, path in processed_files.items()})
+
+            # The extension is kept: it is how the reader tells a legacy .xls from an .xlsx
+            filename = f"{uuid.uuid4()}{os.path.splitext(file.filename)[1].lower()}"
+            upload_file_path = os.path.join(output_directory, filename)
+            os.makedirs(output_directory)
+            upload_hash = save_upload(iter_stream(file.stream), upload_file_path)
+
+            result_cache = current_app.extensions['result_cache']
+            cache_key = result_cache.key('sales', upload_hash, rules.SALES_FORM_PLAN.rules)
+            # A profiled upload is processed again even when its outputs are cached
+            cached = None if profile_id else result_cache.get(cache_key, output_directory)
+            if cached is not None:
                 os.remove(upload_file_path)
+                return finished_response({key: f"{namespace}/{name}" for key, name in cached.items()})
 
-                download_links = {}
-                for key, path in processed_files.items():
-                    filename = os.path.basename(path)
-                    download_links[key] = url_for('sales.download_file', filename=filename)
-
-                return render_template('sales_upload.html', download_links=download_links, message='File processed successfully!')
-            except Exception as e:
-                if os.path.exists(upload_file_path):
-                    os.remove(upload_file_path)
-                return render_template('sales_upload.html', error=f"Error processing Excel file: {e}")
+            job_id = current_app.extensions['job_queue'].submit('sales', *profiles.job(
+                profile_id, profile_label, run_cached, result_cache, cache_key, UPLOAD_DIRECTORY,
+                process_sales_upload, upload_file_path, output_directory,
+            ))
+            return render_template('sales_upload.html', job_id=job_id)
     return render_template('sales_upload.html')
 
-@sales_blueprint.route('/download/<filename>')
+def upload_batch(files):
+    """Several exports in one request: processed in parallel, with per-file and combined outputs."""
+    if not all(file.filename.endswith(('.xlsx', '.xls')) for file in files):
+        return render_template('sales_upload.html', error='Only .xlsx and .xls files can be uploaded.')
+    filenames = unique_filenames([secure_filename(file.filename) for file in files])
+    error = preflight_uploads(files, filenames)
+    if error:
+        return render_template('sales_upload.html', error=error), 400
+    namespace = new_namespace()
+    output_directory = os.path.join(UPLOAD_DIRECTORY, namespace)
+
+    if STORAGE_MODE == 'memory':
+        # The memory store belongs to this process, so the files are processed here one after another
+        try:
+            processed_files = process_sales_batch(
+                [file.stream for file in files], filenames, output_directory, max_workers=1,
+            )
+        except Exception as e:
+            return render_template('sales_upload.html', error=f"Error processing Excel file: {e}")
+        return finished_response(processed_files)
+
+    os.makedirs(output_directory)
+    upload_file_paths = [os.path.join(output_directory, f"{uuid.uuid4()}{os.path.splitext(filename)[1]}") for filename in filenames]
+    for file, upload_file_path in zip(files, upload_file_paths):
+        save_upload(iter_stream(file.stream), upload_file_path)
+
+    job_id = current_app.extensions['job_queue'].submit(
+        'sales', process_sales_batch, upload_file_paths, filenames, output_directory,
+    )
+    return render_template('sales_upload.html', job_id=job_id)
+
+@sales_blueprint.route('/download/<path:filename>')
 def download_file(filename):
+    data = memory_store.get(os.path.join(UPLOAD_DIRECTORY, filename))
+    if data is not None:
+        return send_file(io.BytesIO(data), as_attachment=True, download_name=os.path.basename(filename))
     return send_from_directory(UPLOAD_DIRECTORY, filename, as_attachment=True)
\ No newline at end of file